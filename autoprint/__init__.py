@@ -0,0 +1 @@
+"""自动打印测试工具的打印引擎"""
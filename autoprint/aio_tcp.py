@@ -0,0 +1,85 @@
+"""基于 asyncio 的 TCP 打印后端
+
+在一个事件循环中并发驱动成千上万台 9100 打印机，每个发送不再占用一个系统线程。
+信号量限制同时打开的连接数，writer.drain() 提供逐连接的背压。
+"""
+import asyncio
+import threading
+import time
+
+
+class AsyncTcpFleet:
+    def __init__(self, max_connections=1000, connect_timeout=10, send_timeout=10,
+                 timeouts=None, copy_delay=0.0):
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self.send_timeout = send_timeout  # 单台打印机整个作业的发送超时
+        self.timeouts = dict(timeouts or {})  # 打印机名 -> 单独的发送超时
+        self.copy_delay = copy_delay
+
+    async def _send_one(self, ip, port, data, copies, connect_timeout):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(ip, port), connect_timeout)
+        try:
+            for copy_num in range(copies):
+                writer.write(data)
+                await writer.drain()  # 发送缓冲区满时在此等待，形成背压
+                if self.copy_delay and copy_num < copies - 1:
+                    await asyncio.sleep(self.copy_delay)
+            if writer.can_write_eof():
+                writer.write_eof()
+            await writer.drain()
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def send(self, name, ip, port, data, copies, semaphore):
+        """向单台打印机发送，返回 (name, 是否成功, 错误信息, 耗时秒)"""
+        timeout = self.timeouts.get(name, self.send_timeout)
+        start = time.perf_counter()
+        async with semaphore:
+            try:
+                await asyncio.wait_for(
+                    self._send_one(ip, port, data, copies, self.connect_timeout), timeout)
+                return name, True, None, time.perf_counter() - start
+            except asyncio.TimeoutError:
+                return name, False, f"发送超时 ({timeout} 秒)", time.perf_counter() - start
+            except Exception as e:
+                # 任何异常都只算这一台打印机失败，不能中断 run() 中其余作业的收集
+                return name, False, str(e), time.perf_counter() - start
+
+    async def run(self, endpoints, data, copies=1, on_result=None):
+        """并发向 endpoints（打印机名 -> (ip, port)）发送同一份数据
+
+        on_result(name, success, error, elapsed) 在每台打印机完成时回调，
+        返回全部结果列表。
+        """
+        semaphore = asyncio.Semaphore(self.max_connections)
+        tasks = [asyncio.ensure_future(self.send(name, ip, port, data, copies, semaphore))
+                 for name, (ip, port) in endpoints.items()]
+        results = []
+        for future in asyncio.as_completed(tasks):
+            result = await future
+            results.append(result)
+            if on_result:
+                on_result(*result)
+        return results
+
+    def print_fleet(self, endpoints, data, copies=1, on_result=None):
+        """同步入口：在当前线程中运行一个事件循环直到全部发送结束"""
+        return asyncio.run(self.run(endpoints, data, copies, on_result))
+
+    def print_fleet_in_background(self, endpoints, data, copies=1, on_result=None,
+                                  on_done=None):
+        """在后台线程中运行，避免阻塞GUI线程"""
+        def runner():
+            results = self.print_fleet(endpoints, data, copies, on_result)
+            if on_done:
+                on_done(results)
+
+        thread = threading.Thread(target=runner, daemon=True, name="aio-tcp-fleet")
+        thread.start()
+        return thread
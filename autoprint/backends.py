@@ -0,0 +1,519 @@
+"""可插拔的打印后端
+
+每个后端的 send(job) 负责把作业的全部份数发送出去：
+返回后台处理程序作业ID列表时，由该后端 spooler 对应的 JobTracker 跟踪完成状态；
+返回 None 表示发送即视为完成。平台相关模块（win32print、win32api）在后端
+构造时才导入，非 Windows 系统上也可以使用 tcp、file、simulated 后端。
+RAW、TCP 和文件后端按 chunk_size 分块流式发送，大文档不会整体读入内存。
+RAW、TCP 和模拟后端支持 batch 份数模式（见 batching.py）。
+TCP 后端可等待设备确认打印完成（见 escpos_status.py），此时由 StatusPoller 代替 JobTracker 跟踪。
+txt/pdf 文档由 BackendManager 在进程内渲染为 ESC/POS 数据（见 render.py，结果缓存），
+再交给 RAW/TCP 后端发送（作业字典的 payload_path）；Word 文档仍由 shell 后端交给关联程序打印。
+relay 后端经广域网把作业交给门店的中继代理（见 relay.py），代理已缓存的文档只发送摘要。
+"""
+import os
+import threading
+import time
+
+from autoprint.batching import (COPY_MODE_BATCH, COPY_MODE_PER_COPY, CUT_COMMANDS,
+                                DrainRateEstimator, batch_source, copy_batches)
+from autoprint.escpos_status import GS_R_PAPER, SocketChannel, StatusPoller
+from autoprint.job_tracker import NotifyJobTracker
+from autoprint.render import Renderer, can_render
+from autoprint.retry import FAILURE_SPOOLER
+from autoprint.streaming import DEFAULT_CHUNK_SIZE, document_source, progress_logger, stream_write
+
+ESC_POS_INIT = b'\x1B@'  # ESC @ 初始化指令（适用于大多数热敏打印机）
+
+
+class PrintBackend:
+    name = None
+    spooler = None  # 有后台处理程序的后端需要提供，用于跟踪作业
+    raw = False  # 是否原样发送数据：txt/pdf 文档先渲染为 ESC/POS 数据再发送
+
+    def __init__(self, log=None):
+        self._log = log or (lambda message: None)
+        self.drain_rate = DrainRateEstimator()  # 由 BackendManager 根据作业完成时间更新
+
+    def send(self, job):
+        raise NotImplementedError
+
+    def create_tracker(self):
+        """后端自带的作业跟踪器；返回 None 时 BackendManager 按 spooler 创建 JobTracker"""
+        return None
+
+    def close(self):
+        pass
+
+
+class Win32RawBackend(PrintBackend):
+    """通过 WritePrinter 发送 RAW 数据；usb=True 时每份前发送 ESC @ 重置打印机
+
+    每份数据按 chunk_size 分块写入，单块写入超过 stall_timeout 秒时中止该份作业。
+    copy_mode 为 batch 时多份拼成一个作业（每 copies_per_job 份一个，0 表示不拆分），
+    cut 为每份之后的切纸指令（CUT_COMMANDS 的键）；作业字典中的同名键优先。
+    copy_delay 只在还没有测得设备消化速度时使用。
+    """
+    name = "win32"
+    raw = True
+
+    def __init__(self, log=None, copy_delay=0.5, chunk_size=DEFAULT_CHUNK_SIZE, stall_timeout=30.0,
+                 copy_mode=COPY_MODE_PER_COPY, copies_per_job=0, cut="none"):
+        super().__init__(log)
+        import win32print
+        from autoprint.job_tracker import Win32Spooler
+        self._win32print = win32print
+        self.spooler = Win32Spooler()
+        self.copy_delay = copy_delay
+        self.chunk_size = chunk_size
+        self.stall_timeout = stall_timeout
+        self.copy_mode = copy_mode
+        self.copies_per_job = copies_per_job
+        self.cut = cut
+
+    def send(self, job):
+        win32print = self._win32print
+        printer_name = job['printer']
+        copies = job['copies']
+        usb = job.get('usb', os.path.splitext(job['doc_path'])[1].lower() == ".usb")
+        batch = job.get('copy_mode', self.copy_mode) == COPY_MODE_BATCH
+        cut = CUT_COMMANDS[job.get('cut', self.cut)]
+        label = "USB打印" if usb else "RAW打印"
+        try:
+            hPrinter = win32print.OpenPrinter(printer_name)
+            try:
+                # 经过文档缓存（重复打印不再读盘）；超出缓存预算的大文档直接从磁盘分块读取
+                source, size = document_source(payload_path(job))
+                on_progress = progress_logger(self._log, f"{label} {printer_name}")
+
+                def write(chunk):
+                    if win32print.WritePrinter(hPrinter, chunk) != len(chunk):
+                        raise Exception("WritePrinter 未能写入全部数据")
+
+                # 批量模式下 ESC @ 放进作业内的每份之前；逐份模式保持原有的作业外发送
+                prefix = ESC_POS_INIT if usb and batch else b''
+                batches = copy_batches(copies, self.copies_per_job) if batch else [1] * copies
+                spool_job_ids = []
+                spool_bytes = []
+                job['bytes'] = 0
+                first = 1
+                for index, count in enumerate(batches):
+                    if usb and not batch:
+                        win32print.WritePrinter(hPrinter, ESC_POS_INIT)
+
+                    payload = batch_source(source, count, prefix, cut)
+                    nbytes = len(payload)
+                    last = first + count - 1
+                    copy_text = f"第{first}份" if count == 1 else f"第{first}-{last}份"
+                    # 每个作业的ID用于跟踪打印状态
+                    job_info = (f"Python打印任务（{copy_text}）", None, "RAW")
+                    spool_job_ids.append(win32print.StartDocPrinter(hPrinter, 1, job_info))
+                    try:
+                        win32print.StartPagePrinter(hPrinter)
+                        stats = stream_write(write, payload, nbytes, self.chunk_size, self.stall_timeout,
+                                             on_progress, on_stall=lambda: win32print.AbortPrinter(hPrinter))
+                        win32print.EndPagePrinter(hPrinter)
+                        win32print.EndDocPrinter(hPrinter)
+                    except Exception:
+                        # 删除写了一半的作业，避免打印机输出残缺数据
+                        try:
+                            win32print.AbortPrinter(hPrinter)
+                        except Exception:
+                            pass
+                        raise
+                    spool_bytes.append(nbytes)
+                    job['bytes'] += nbytes
+
+                    if usb:
+                        self._log(f"USB打印完成（{copy_text}/{copies}份，{stats.summary()}）")
+                    else:
+                        self._log(f"RAW打印任务发送到打印机: {printer_name} "
+                                  f"({copy_text}/{copies}份，{stats.summary()})")
+
+                    # 按测得的设备消化速度等待上一份打完一部分，避免打印机过载
+                    if index < len(batches) - 1:
+                        time.sleep(self.drain_rate.delay(printer_name, nbytes, stats.elapsed,
+                                                         self.copy_delay))
+                    first = last + 1
+
+                job['spool_bytes'] = spool_bytes
+                return spool_job_ids
+            finally:
+                win32print.ClosePrinter(hPrinter)
+        except Exception as e:
+            raise Exception(f"{label}失败: {str(e)}")
+
+
+class Win32ShellBackend(PrintBackend):
+    """通过关联程序的 printto 动作打印 doc/docx 等无法在进程内渲染的文档（每份启动一次关联程序）"""
+    name = "shell"
+
+    _KIND = {".txt": "文本文件", ".doc": "Word文档", ".docx": "Word文档", ".pdf": "PDF文档"}
+
+    def __init__(self, log=None, copy_delay=1.0):
+        super().__init__(log)
+        import win32api
+        self._win32api = win32api
+        self.copy_delay = copy_delay
+
+    def send(self, job):
+        doc_path = job['doc_path']
+        printer_name = job['printer']
+        copies = job['copies']
+        kind = self._KIND.get(os.path.splitext(doc_path)[1].lower(), "文档")
+        try:
+            job['bytes'] = os.path.getsize(doc_path) * copies
+            for i in range(copies):
+                self._win32api.ShellExecute(
+                    0, "printto", doc_path, f'"{printer_name}"', ".", 0
+                )
+                if copies > 1:
+                    self._log(f"{kind}打印任务已发送到打印机: {printer_name} (第 {i + 1}/{copies} 份)")
+                    time.sleep(self.copy_delay)  # 份数间短暂延迟
+            if copies == 1:
+                self._log(f"{kind}打印任务已发送到打印机: {printer_name}")
+        except Exception as e:
+            raise Exception(f"{kind}打印失败: {str(e)}")
+        return None
+
+
+class TcpBackend(PrintBackend):
+    """通过持久连接池发送到 RAW/9100 TCP打印机
+
+    batch 模式把每批份数连同切纸指令作为一段连续数据发送。
+    confirm=True（或作业字典中 confirm 为真）时在数据之后发送 GS r 1，
+    由 status_poller 在同一连接上等待设备确认打印完成。
+    """
+    name = "tcp"
+    raw = True
+
+    def __init__(self, printers, pool=None, log=None, copy_mode=COPY_MODE_PER_COPY,
+                 copies_per_job=0, cut="none", confirm=False, status_poller=None):
+        super().__init__(log)
+        from autoprint.tcp_pool import TcpConnectionPool
+        self.printers = printers  # 打印机名 -> (ip, port)，与GUI共享同一字典
+        self.pool = pool or TcpConnectionPool(log=log)
+        self.copy_mode = copy_mode
+        self.copies_per_job = copies_per_job
+        self.cut = cut
+        self.confirm = confirm
+        self.status_poller = status_poller or StatusPoller(log=log)
+
+    def send(self, job):
+        printer_name = job['printer']
+        copies = job['copies']
+        try:
+            if printer_name not in self.printers:
+                raise Exception(f"未配置TCP打印机: {printer_name}")
+            ip, port = self.printers[printer_name]
+            source, size = document_source(payload_path(job))
+            cut = CUT_COMMANDS[job.get('cut', self.cut)]
+            confirm = job.get('confirm', self.confirm)
+            on_progress = progress_logger(self._log, f"TCP打印 {ip}:{port}")
+            self._log(f"发送到TCP打印机: {ip}:{port} (共{copies}份)")
+
+            sock = None
+            if job.get('copy_mode', self.copy_mode) == COPY_MODE_BATCH:
+                job['bytes'] = 0
+                batches = copy_batches(copies, self.copies_per_job)
+                for index, count in enumerate(batches):
+                    payload = batch_source(source, count, cut=cut)
+                    # 只在最后一批之后查询，回复到达时前面各批都已打印
+                    last = confirm and index == len(batches) - 1
+                    stats = self.pool.send(ip, port, payload, 1, on_progress=on_progress,
+                                           trailer=GS_R_PAPER if last else b'', detach=last)
+                    if last:
+                        stats, sock = stats
+                    job['bytes'] += len(payload)
+                    self._log(f"TCP数据已发送 ({stats.summary()}) ({count}份合并发送)")
+            else:
+                def on_copy(copy_num, stats):
+                    self._log(f"TCP数据已发送 ({stats.summary()}) (第{copy_num}/{copies}份)")
+
+                payload = batch_source(source, 1, cut=cut) if cut else source
+                result = self.pool.send(ip, port, payload, copies, on_copy=on_copy,
+                                        on_progress=on_progress,
+                                        trailer=GS_R_PAPER if confirm else b'', detach=confirm)
+                if confirm:
+                    _, sock = result
+                job['bytes'] = len(payload) * copies if cut else size * copies
+        except Exception as e:
+            raise Exception(f"TCP打印失败: {str(e)}")
+        if sock is None:
+            return None
+        channel = SocketChannel(sock, on_close=lambda reuse: self.pool.release(ip, port, sock, reuse))
+        return [self.status_poller.begin(printer_name, channel, job)]
+
+    def create_tracker(self):
+        return self.status_poller
+
+    def close(self):
+        self.pool.close_all()
+
+
+class FileSinkBackend(PrintBackend):
+    """把打印数据追加写入 <directory>/<打印机名>.prn，用于离线检查输出内容"""
+    name = "file"
+    raw = True
+
+    def __init__(self, directory, log=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        super().__init__(log)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def send(self, job):
+        source, size = document_source(payload_path(job))
+        safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in job['printer'])
+        path = os.path.join(self.directory, f"{safe_name}.prn")
+        with self._lock, open(path, 'ab') as f:
+            for _ in range(job['copies']):
+                stream_write(f.write, source, size, self.chunk_size, stall_timeout=None)
+        job['bytes'] = size * job['copies']
+        self._log(f"打印数据已写入文件: {path} (共{job['copies']}份)")
+        return None
+
+
+class SimulatedBackend(PrintBackend):
+    """发送到内存中的模拟后台处理程序，不产生任何磁盘或设备I/O以外的开销
+
+    多份作业的份数模式和份数间隔与 Win32RawBackend 相同，copy_delay 默认为 0。
+    """
+    name = "simulated"
+    raw = True
+
+    def __init__(self, spooler=None, log=None, copy_mode=COPY_MODE_PER_COPY, copies_per_job=0,
+                 cut="none", copy_delay=0.0, **spooler_options):
+        super().__init__(log)
+        from autoprint.simulator import SimulatedSpooler
+        self.spooler = spooler or SimulatedSpooler(**spooler_options)
+        self.copy_mode = copy_mode
+        self.copies_per_job = copies_per_job
+        self.cut = cut
+        self.copy_delay = copy_delay
+
+    def send(self, job):
+        # payload_size 可直接指定每份大小（压测时无需真实文件）
+        nbytes = job.get('payload_size')
+        if nbytes is None:
+            nbytes = os.path.getsize(payload_path(job))
+        nbytes += len(CUT_COMMANDS[job.get('cut', self.cut)])
+        if job.get('copy_mode', self.copy_mode) == COPY_MODE_BATCH:
+            batches = copy_batches(job['copies'], self.copies_per_job)
+        else:
+            batches = [1] * job['copies']
+        job['spool_bytes'] = [nbytes * count for count in batches]
+        job['bytes'] = sum(job['spool_bytes'])
+        spool_job_ids = []
+        for index, spool_bytes in enumerate(job['spool_bytes']):
+            spool_job_ids.append(self.spooler.submit(job['printer'], job['document'], spool_bytes))
+            if index < len(batches) - 1:
+                delay = self.drain_rate.delay(job['printer'], spool_bytes, fallback=self.copy_delay)
+                if delay:
+                    time.sleep(delay)
+        return spool_job_ids
+
+    def close(self):
+        self.spooler.stop()
+
+
+class RelayBackend(PrintBackend):
+    """通过门店的中继代理打印：printers 为 打印机名 -> (代理地址, 代理端口)
+
+    每台打印机一条到代理的压缩连接，同一门店的打印机可以同时打印；文档按内容摘要缓存在代理上，
+    只有代理没有的文档才上传一次，之后每份、每轮只发送一条打印指令。
+    """
+    name = "relay"
+    raw = True
+
+    def __init__(self, printers, log=None, cut="none", compress_level=6):
+        super().__init__(log)
+        self.printers = printers
+        self.cut = cut
+        self.compress_level = compress_level
+        self._lock = threading.Lock()
+        self._clients = {}  # 打印机名 -> RelayClient
+
+    def client(self, printer_name):
+        from autoprint.relay import RelayClient
+        if printer_name not in self.printers:
+            raise Exception(f"未配置中继打印机: {printer_name}")
+        endpoint = tuple(self.printers[printer_name])
+        with self._lock:
+            # 引擎对同一台打印机串行发送，连接上不会有排队；代理地址变化时换新连接
+            client = self._clients.get(printer_name)
+            if client is None or client.endpoint != endpoint:
+                if client is not None:
+                    client.close()
+                client = RelayClient(*endpoint, compress_level=self.compress_level)
+                self._clients[printer_name] = client
+            return client
+
+    def send(self, job):
+        try:
+            client = self.client(job['printer'])
+            with open(payload_path(job), 'rb') as f:
+                data = f.read()
+            sent = client.wire_sent
+            reply = client.print(job['printer'], data, job['copies'],
+                                 cut=CUT_COMMANDS[job.get('cut', self.cut)])
+        except Exception as e:
+            raise Exception(f"中继打印失败: {str(e)}")
+        job['bytes'] = reply['bytes']
+        job['wire_bytes'] = client.wire_sent - sent
+        self._log(f"中继代理已打印 {job['printer']} (共{job['copies']}份，"
+                  f"线路 {job['wire_bytes']} 字节 / 打印数据 {reply['bytes']} 字节)")
+        return None
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+
+def payload_path(job):
+    """作业实际发送的数据：渲染后的缓存文件，或文档本身"""
+    return job.get('payload_path') or job['doc_path']
+
+
+BACKENDS = {
+    Win32RawBackend.name: Win32RawBackend,
+    Win32ShellBackend.name: Win32ShellBackend,
+    TcpBackend.name: TcpBackend,
+    FileSinkBackend.name: FileSinkBackend,
+    SimulatedBackend.name: SimulatedBackend,
+    RelayBackend.name: RelayBackend,
+}
+
+
+def backend_for_document(doc_path, printer_name=None, tcp_printers=None, relay_printers=None):
+    """按文档扩展名选择默认后端"""
+    ext = os.path.splitext(doc_path)[1].lower()
+    if relay_printers and printer_name in relay_printers and ext not in (".doc", ".docx"):
+        return RelayBackend.name
+    if ext == ".tcp" or (tcp_printers and printer_name in tcp_printers):
+        return TcpBackend.name
+    if ext in (".doc", ".docx"):
+        return Win32ShellBackend.name
+    return Win32RawBackend.name  # txt/pdf 渲染为 ESC/POS 后按 RAW 发送
+
+
+class BackendManager:
+    """按需创建后端实例，并为每个有后台处理程序的后端维护一个 JobTracker
+
+    renderer: render.Renderer，txt/pdf 文档交给原样发送的后端之前先渲染（不传时使用临时文件夹缓存）。
+    """
+
+    def __init__(self, options=None, tracker_factory=None, log=None, device_status=None, renderer=None):
+        self.options = options or {}  # 后端名 -> 构造参数
+        self.renderer = renderer or Renderer(log=log)
+        # device_status(printer_name) -> DeviceStatus 或 None：后台处理程序报告完成时再核对设备状态
+        self.device_status = device_status
+        # 默认按后台处理程序的变更通知跟踪作业，作业完成后立即回调，不受轮询间隔影响
+        self._tracker_factory = tracker_factory or (
+            lambda spooler: NotifyJobTracker(spooler, log=log))
+        self._log = log
+        self._lock = threading.Lock()
+        self._backends = {}
+        self._trackers = {}
+
+    def get(self, name):
+        with self._lock:
+            backend = self._backends.get(name)
+            if backend is None:
+                if name not in BACKENDS:
+                    raise Exception(f"未知的打印后端: {name}")
+                backend = BACKENDS[name](log=self._log, **self.options.get(name, {}))
+                self._backends[name] = backend
+            return backend
+
+    def tracker(self, backend):
+        with self._lock:
+            tracker = self._trackers.get(backend.name)
+            if tracker is None:
+                tracker = (backend.create_tracker() or self._tracker_factory(backend.spooler)).start()
+                self._trackers[backend.name] = tracker
+            return tracker
+
+    def run_job(self, job, complete):
+        """发送作业并在需要时跟踪其所有份数，可直接作为 PrintEngine 的 send_func 主体
+
+        complete(job_id, success, reason, failure=...) 在全部份数离开打印队列或任一份出错时调用。
+        返回 True 表示发送即视为完成。
+        """
+        backend = self.get(job['backend'])
+        if backend.raw and can_render(job['doc_path']):
+            # 只渲染一次，之后的作业和每一份都直接发送缓存的渲染结果
+            job['payload_path'] = self.renderer.render(job['doc_path'])
+        spool_job_ids = backend.send(job)
+        job['spooled_ts'] = time.time()
+        if spool_job_ids is None:
+            return True
+        tracker = self.tracker(backend)
+        remaining = set(spool_job_ids)
+        lock = threading.Lock()
+        log = self._log or (lambda message: None)
+        spool_bytes = dict(zip(spool_job_ids, job.get('spool_bytes') or ()))
+        last_done = [job.get('start_ts') or job['spooled_ts']]
+        attempt = job.get('attempts')
+
+        def on_status(spool_job_id, status_text):
+            log(f"打印作业 ID {spool_job_id} 状态: {status_text}")
+
+        def on_done(spool_job_id, success, reason):
+            if job.get('attempts') != attempt:
+                return  # 作业已重试，忽略上一次尝试留下的份数
+            if success and self.device_status is not None:
+                # 离开打印队列不代表已打印：设备报告缺纸、开盖等错误时判为失败
+                status = self.device_status(job['printer'])
+                if status is not None and not status.ok:
+                    success, reason = False, status.text()
+            if not success:
+                log(f"打印作业 ID {spool_job_id} 出错: {reason}")
+                complete(job['id'], False, f"打印作业出错: {reason}", failure=FAILURE_SPOOLER)
+                return
+            with lock:
+                remaining.discard(spool_job_id)
+                finished = not remaining
+                # 作业按顺序打印：相邻两次完成之间设备消化了这个作业的数据
+                now = time.time()
+                backend.drain_rate.observe(job['printer'], spool_bytes.get(spool_job_id, 0),
+                                           now - last_done[0])
+                last_done[0] = now
+            if finished:
+                complete(job['id'], True, None)
+
+        # 全部份数离开打印队列后才算打印成功
+        job['spool_job_ids'] = list(spool_job_ids)
+        for spool_job_id in spool_job_ids:
+            tracker.track(
+                job['printer'], spool_job_id,
+                lambda success, reason, spool_job_id=spool_job_id: on_done(spool_job_id, success, reason),
+                on_status)
+        return False
+
+    def untrack(self, job):
+        """作业已结束或将要重试（如超时）时停止跟踪其剩余份数"""
+        if not job.get('spool_job_ids'):
+            return
+        tracker = self.tracker(self.get(job['backend']))
+        for spool_job_id in job['spool_job_ids']:
+            tracker.untrack(job['printer'], spool_job_id)
+
+    def trackers(self):
+        with self._lock:
+            return list(self._trackers.values())
+
+    def close(self):
+        with self._lock:
+            trackers = list(self._trackers.values())
+            backends = list(self._backends.values())
+            self._trackers.clear()
+            self._backends.clear()
+        for tracker in trackers:
+            tracker.stop()
+        for backend in backends:
+            backend.close()
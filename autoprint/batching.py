@@ -0,0 +1,78 @@
+"""多份打印的批量模式与自适应份数间隔
+
+per_copy 模式每份一个后台处理程序作业（旧版行为）；batch 模式把多份连同切纸指令
+拼接成一个作业（或按 copies_per_job 拆成几个连续提交的作业），省去每个作业的
+后台处理开销。份数/批次之间的等待时间按实测的设备消化速度计算，而不是固定 sleep。
+"""
+import threading
+
+from autoprint.streaming import CompositeSource
+
+COPY_MODE_PER_COPY = "per_copy"
+COPY_MODE_BATCH = "batch"
+COPY_MODES = (COPY_MODE_PER_COPY, COPY_MODE_BATCH)
+
+# ESC/POS 切纸指令（GS V）
+CUT_COMMANDS = {
+    "none": b'',
+    "partial": b'\x1DV\x01',
+    "full": b'\x1DV\x00',
+    "feed": b'\x1DVB\x00',  # 走纸到切刀位置后半切
+}
+
+
+def copy_batches(copies, copies_per_job=0):
+    """把 copies 份拆成若干批，返回每批份数；copies_per_job 为 0 表示全部放进一个作业"""
+    if copies <= 0:
+        return []
+    if not copies_per_job or copies_per_job >= copies:
+        return [copies]
+    batches = [copies_per_job] * (copies // copies_per_job)
+    if copies % copies_per_job:
+        batches.append(copies % copies_per_job)
+    return batches
+
+
+def batch_source(source, copies, prefix=b'', cut=b''):
+    """返回 copies 份 source 的拼接数据源：每份前加 prefix（如 ESC @），每份后加切纸指令"""
+    parts = []
+    for _ in range(copies):
+        parts.extend((prefix, source, cut))
+    return CompositeSource(parts)
+
+
+class DrainRateEstimator:
+    """按打印机估计设备消化数据的速度（字节/秒，指数加权平均）
+
+    delay() 返回下一份/下一批之前应等待的时间：上一批数据按当前速度还需多久才能
+    打完；还没有测量值时使用 fallback（旧版的固定间隔）。
+    """
+
+    def __init__(self, alpha=0.3, max_delay=5.0):
+        self.alpha = alpha
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._rates = {}
+
+    def observe(self, printer, nbytes, seconds):
+        if nbytes <= 0 or seconds <= 0:
+            return
+        sample = nbytes / seconds
+        with self._lock:
+            rate = self._rates.get(printer)
+            self._rates[printer] = sample if rate is None else rate + self.alpha * (sample - rate)
+
+    def rate(self, printer):
+        with self._lock:
+            return self._rates.get(printer)
+
+    def delay(self, printer, nbytes, elapsed=0.0, fallback=0.0):
+        """nbytes: 上一份/批的字节数；elapsed: 发送它已经花掉的时间"""
+        rate = self.rate(printer)
+        if rate is None:
+            return fallback
+        return min(self.max_delay, max(0.0, nbytes / rate - elapsed))
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._rates)
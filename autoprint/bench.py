@@ -0,0 +1,385 @@
+"""打印引擎基准测试
+
+用法:
+    python -m autoprint.bench tcp [--jobs 2000] [--size 4096] [--copies 1]
+    python -m autoprint.bench aio [--printers 1000] [--size 4096] [--copies 1]
+    python -m autoprint.bench sim [--jobs 1000000] [--printers 50] [--latency 0]
+    python -m autoprint.bench copies [--jobs 5] [--printers 4] [--copies 5] [--latency 0.05]
+    python -m autoprint.bench render [--pages 20] [--height 1600] [--paper-width 80] [--jobs 1000]
+    python -m autoprint.bench relay [--printers 10] [--rounds 20] [--copies 2] [--documents 2] [--link-kbps 2000]
+"""
+import argparse
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+from autoprint.aio_tcp import AsyncTcpFleet
+from autoprint.backends import BackendManager, SimulatedBackend, TcpBackend
+from autoprint.batching import COPY_MODE_BATCH, COPY_MODE_PER_COPY, DrainRateEstimator
+from autoprint.engine import PrintEngine
+from autoprint.fakes import AsyncSinkFarm, SinkServer, wait_for_bytes
+from autoprint.job_tracker import PollingJobTracker
+from autoprint.relay import RelayAgent, RelayClient
+from autoprint.render import (DITHER_MODES, PAPER_PRINTABLE_MM, Renderer, gs_v0, pack_bits, paper_dots,
+                              write_pgm)
+from autoprint.tcp_pool import TcpConnectionPool
+
+
+def _send_without_pool(endpoint, data, copies, copy_delay):
+    # 与旧版 _print_raw_tcp 相同：每份单独建立连接
+    for copy_num in range(copies):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.settimeout(10)
+            s.connect(endpoint)
+            s.sendall(data)
+        if copy_num < copies - 1:
+            time.sleep(copy_delay)
+
+
+def bench_tcp(args):
+    data = b'\x1B@' + b'X' * max(args.size - 2, 0)
+    results = []
+    with SinkServer() as server:
+        ip, port = server.address
+
+        expected = server.bytes_received
+        start = time.perf_counter()
+        for _ in range(args.jobs):
+            _send_without_pool((ip, port), data, args.copies, args.copy_delay)
+        expected += args.jobs * args.copies * len(data)
+        wait_for_bytes(server, expected)
+        results.append(("每份新建连接", time.perf_counter() - start))
+
+        pool = TcpConnectionPool(pipeline=True)
+        connects_before = server.connections
+        start = time.perf_counter()
+        for _ in range(args.jobs):
+            pool.send(ip, port, data, args.copies)
+        expected += args.jobs * args.copies * len(data)
+        wait_for_bytes(server, expected)
+        results.append(("连接池+流水线", time.perf_counter() - start))
+        pool.close_all()
+        pool_connects = server.connections - connects_before
+
+    print(f"作业数: {args.jobs}  每份字节: {len(data)}  份数: {args.copies}")
+    for name, elapsed in results:
+        print(f"{name:<12} {elapsed:8.3f}s  {args.jobs / elapsed:10.1f} 作业/秒")
+    print(f"连接池共建立连接: {pool_connects}")
+
+
+def bench_aio(args):
+    data = b'\x1B@' + b'X' * max(args.size - 2, 0)
+    with AsyncSinkFarm(args.printers) as farm:
+        endpoints = farm.endpoints()
+        fleet = AsyncTcpFleet(max_connections=args.max_connections)
+        start = time.perf_counter()
+        results = fleet.print_fleet(endpoints, data, args.copies)
+        elapsed = time.perf_counter() - start
+        wait_for_bytes(farm, len(endpoints) * args.copies * len(data))
+    ok = sum(1 for result in results if result[1])
+    latencies = sorted(result[3] for result in results)
+    print(f"打印机数: {len(endpoints)}  成功: {ok}  失败: {len(results) - ok}")
+    print(f"总耗时 {elapsed:.3f}s  {len(results) / elapsed:.1f} 作业/秒  "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.1f}ms  "
+          f"max {latencies[-1] * 1000:.1f}ms")
+
+
+def bench_sim(args):
+    """在模拟后台处理程序上测量调度引擎 + 作业跟踪本身的吞吐量"""
+    backend = SimulatedBackend(latency=args.latency, error_rate=args.error_rate, seed=1)
+    tracker = PollingJobTracker(backend.spooler, interval=args.interval).start()
+    finished = threading.Semaphore(0)
+
+    def send(job):
+        for spool_job_id in backend.send(job):
+            tracker.track(job['printer'], spool_job_id,
+                          lambda success, reason, job_id=job['id']:
+                          engine.complete_job(job_id, success, reason))
+        return False
+
+    engine = PrintEngine(send, max_workers=args.workers)
+    engine.add_listener(lambda job: finished.release())
+    printers = [f"SIM{i:03d}" for i in range(args.printers)]
+
+    start = time.perf_counter()
+    for i in range(args.jobs):
+        engine.submit(printers[i % len(printers)], "bench.bin", 1, payload_size=args.size)
+    submitted = time.perf_counter() - start
+    for _ in range(args.jobs):
+        finished.acquire()
+    elapsed = time.perf_counter() - start
+
+    success, failed = engine.totals()
+    print(f"作业数: {args.jobs}  打印机数: {args.printers}  工作线程: {args.workers}")
+    print(f"提交耗时 {submitted:.2f}s  总耗时 {elapsed:.2f}s  {args.jobs / elapsed:.0f} 作业/秒")
+    print(f"成功 {success}  失败 {failed}  EnumJobs 调用 {backend.spooler.enum_calls}")
+    tracker.stop()
+    engine.shutdown()
+    backend.close()
+
+
+class _FixedDelay(DrainRateEstimator):
+    """不做测量，始终使用固定间隔（旧版行为）"""
+
+    def observe(self, printer, nbytes, seconds):
+        pass
+
+
+def _bench_copy_mode(args, copy_mode, copies_per_job=0, adaptive=True):
+    backends = BackendManager(
+        options={'simulated': {'copy_mode': copy_mode, 'copies_per_job': copies_per_job,
+                               'cut': "partial", 'copy_delay': args.copy_delay,
+                               'latency': args.latency, 'bytes_per_sec': args.rate}},
+        tracker_factory=lambda spooler: PollingJobTracker(spooler, interval=0.01))
+    backend = backends.get(SimulatedBackend.name)
+    if not adaptive:
+        backend.drain_rate = _FixedDelay()
+    finished = threading.Semaphore(0)
+    engine = PrintEngine(lambda job: backends.run_job(job, engine.complete_job),
+                         max_workers=args.printers)
+    engine.add_listener(lambda job: finished.release())
+    printers = [f"SIM{i:03d}" for i in range(args.printers)]
+    total = args.jobs * args.printers
+
+    start = time.perf_counter()
+    for i in range(total):
+        engine.submit(printers[i % len(printers)], "bench.bin", args.copies,
+                      backend=SimulatedBackend.name, payload_size=args.size)
+    for _ in range(total):
+        finished.acquire()
+    elapsed = time.perf_counter() - start
+    spool_jobs = backend.spooler.completed
+    success, failed = engine.totals()
+    engine.shutdown()
+    backends.close()
+    return elapsed, spool_jobs, success, failed
+
+
+def _bench_tcp_copy_mode(args, copy_mode, doc_path):
+    with SinkServer() as server:
+        pool = TcpConnectionPool()
+        backend = TcpBackend({"tcp": server.address}, pool, copy_mode=copy_mode, cut="partial")
+        start = time.perf_counter()
+        expected = 0
+        for _ in range(args.tcp_jobs):
+            job = {'printer': "tcp", 'doc_path': doc_path, 'copies': args.copies}
+            backend.send(job)
+            expected += job['bytes']
+        wait_for_bytes(server, expected)
+        elapsed = time.perf_counter() - start
+        pool.close_all()
+    return elapsed
+
+
+def bench_copies(args):
+    """比较多份打印的几种模式：逐份固定间隔（旧版）、逐份自适应间隔、合并为一个或几个作业"""
+    modes = [
+        ("逐份+固定间隔", COPY_MODE_PER_COPY, 0, False),
+        ("逐份+自适应间隔", COPY_MODE_PER_COPY, 0, True),
+        ("合并为一个作业", COPY_MODE_BATCH, 0, True),
+        (f"每{args.copies_per_job}份一个作业", COPY_MODE_BATCH, args.copies_per_job, True),
+    ]
+    total = args.jobs * args.printers
+    print(f"模拟后台处理程序: 打印机 {args.printers}  每台作业 {args.jobs}  份数 {args.copies}  "
+          f"每份 {args.size} 字节  作业开销 {args.latency:g}s  设备 {args.rate / 1024:.0f} KB/s")
+    for name, copy_mode, copies_per_job, adaptive in modes:
+        elapsed, spool_jobs, success, failed = _bench_copy_mode(args, copy_mode, copies_per_job,
+                                                                adaptive)
+        print(f"{name:<14} {elapsed:8.2f}s  {total * args.copies / elapsed:8.1f} 份/秒  "
+              f"后台作业 {spool_jobs:5d}  成功 {success} 失败 {failed}")
+
+    fd, doc_path = tempfile.mkstemp(suffix=".tcp")
+    with os.fdopen(fd, 'wb') as f:
+        f.write(b'\x1B@' + b'X' * max(args.size - 2, 0))
+    try:
+        print(f"TCP连接池: 作业 {args.tcp_jobs}  份数 {args.copies}")
+        for name, copy_mode in (("逐份发送", COPY_MODE_PER_COPY), ("合并发送", COPY_MODE_BATCH)):
+            elapsed = _bench_tcp_copy_mode(args, copy_mode, doc_path)
+            print(f"{name:<14} {elapsed:8.3f}s  {args.tcp_jobs * args.copies / elapsed:10.1f} 份/秒")
+    finally:
+        os.remove(doc_path)
+
+
+def _synthetic_page(width, height, seed):
+    # 灰度渐变加上文字状的细条纹，接近小票上的图片和文字
+    out = bytearray()
+    for y in range(height):
+        stripe = 0 if (y // 3 + seed) % 8 == 0 else 255
+        out += bytes(stripe if (x // 5 + y // 24 + seed) % 11 == 0 else (x * 255 // width + seed) % 256
+                     for x in range(width))
+    return bytes(out)
+
+
+def bench_render(args):
+    """测量抖动+打包的吞吐量（页/秒）、每个作业的数据量，以及缓存命中时的开销"""
+    width = paper_dots(args.paper_width, args.dpi)
+    pages = [_synthetic_page(width, args.height, seed) for seed in range(args.pages)]
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    print(f"页面: {args.pages} 页  {width}×{args.height} 点（{args.paper_width}mm, {args.dpi}dpi）"
+          f"  NumPy: {'有' if numpy else '无'}")
+    implementations = [("Python", False)] + ([("NumPy", True)] if numpy else [])
+    for dither in DITHER_MODES:
+        for name, use_numpy in implementations:
+            start = time.perf_counter()
+            total = 0
+            for page in pages:
+                bits, width_bytes = pack_bits(page, width, args.height, dither=dither, use_numpy=use_numpy)
+                total += len(bits)
+            elapsed = time.perf_counter() - start
+            print(f"{dither:<10} {name:<7} {elapsed:8.3f}s  {args.pages / elapsed:8.1f} 页/秒  "
+                  f"每页 {total // args.pages} 字节")
+
+    folder = tempfile.mkdtemp(prefix="autoprint-render-")
+    try:
+        doc_paths = []
+        for index, page in enumerate(pages):
+            doc_path = os.path.join(folder, f"page{index}.pgm")
+            write_pgm(doc_path, page, width, args.height)
+            doc_paths.append(doc_path)
+        renderer = Renderer(os.path.join(folder, "cache"), paper_width=args.paper_width, dpi=args.dpi)
+        start = time.perf_counter()
+        rendered = [renderer.render(doc_path) for doc_path in doc_paths]
+        first = time.perf_counter() - start
+        job_bytes = sum(os.path.getsize(path) for path in rendered) // len(rendered)
+        # 长时间测试反复打印同一批文档：之后的每个作业都命中缓存
+        start = time.perf_counter()
+        for index in range(args.jobs):
+            renderer.render(doc_paths[index % len(doc_paths)])
+        cached = time.perf_counter() - start
+        print(f"首次渲染（含写缓存） {first:8.3f}s  {len(doc_paths) / first:8.1f} 页/秒  "
+              f"每个作业 {job_bytes} 字节")
+        print(f"缓存命中 {args.jobs} 次 {cached:8.3f}s  每次 {cached / args.jobs * 1e6:8.1f}us  "
+              f"渲染 {renderer.renders} 次  命中 {renderer.hits} 次")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def bench_relay(args):
+    """同一批测试文档直接经广域网发送到各台打印机，与经门店中继代理发送的线路字节数和耗时对比
+
+    本机回环上测得的是实际字节数和处理开销；按 --link-kbps 和 --rtt 估算窄带链路上的传输时间。
+    """
+    width = paper_dots(80)
+    documents = []
+    for seed in range(args.documents):
+        bits, width_bytes = pack_bits(_synthetic_page(width, args.height, seed), width, args.height)
+        documents.append(b'\x1B@' + gs_v0(bits, width_bytes, args.height))
+    names = [f"printer{index}" for index in range(args.printers)]
+    jobs = [(name, documents[round_num % len(documents)])
+            for round_num in range(args.rounds) for name in names]
+    printed = sum(len(data) for _, data in jobs) * args.copies
+
+    with SinkServer() as server:
+        endpoint = server.address
+        pool = TcpConnectionPool()
+        start = time.perf_counter()
+        for _, data in jobs:
+            pool.send(*endpoint, data, args.copies)
+        wait_for_bytes(server, printed, timeout=60)
+        direct = time.perf_counter() - start
+        pool.close_all()
+
+        agent = RelayAgent({name: endpoint for name in names}, "127.0.0.1", 0,
+                           compress_level=args.level).start()
+        client = RelayClient(*agent.address, compress_level=args.level)
+        expected = server.bytes_received + printed
+        latencies = []
+        start = time.perf_counter()
+        for name, data in jobs:
+            job_start = time.perf_counter()
+            client.print(name, data, args.copies)
+            latencies.append(time.perf_counter() - job_start)
+        wait_for_bytes(server, expected, timeout=60)
+        relayed = time.perf_counter() - start
+        client.close()
+        agent.stop()
+
+    wire = client.wire_sent + client.wire_received
+    # 直接发送：每个作业至少一次往返（连接池复用连接时为确认数据送达的往返）
+    link = args.link_kbps * 1000 / 8
+    direct_link = printed / link + len(jobs) * args.rtt / 1000
+    relay_link = wire / link + (len(jobs) + client.uploads) * args.rtt / 1000
+    latencies.sort()
+    print(f"打印机: {args.printers}  轮次: {args.rounds}  份数: {args.copies}  "
+          f"文档: {args.documents} 个，每个 {sum(map(len, documents)) // len(documents)} 字节")
+    print(f"{'直接发送':<10} 线路 {printed:>12} 字节  本机 {direct:8.3f}s  "
+          f"{args.link_kbps:g}kbps 链路约 {direct_link:10.1f}s")
+    print(f"{'中继代理':<10} 线路 {wire:>12} 字节  本机 {relayed:8.3f}s  "
+          f"{args.link_kbps:g}kbps 链路约 {relay_link:10.1f}s")
+    print(f"线路字节减少 {1 - wire / printed:.2%}  上传文档 {client.uploads} 次  "
+          f"中继作业延迟 p50 {latencies[len(latencies) // 2] * 1000:.2f}ms "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms（本机回环）")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m autoprint.bench")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    tcp = sub.add_parser("tcp", help="TCP 9100 连接池吞吐量")
+    tcp.add_argument("--jobs", type=int, default=2000)
+    tcp.add_argument("--size", type=int, default=4096)
+    tcp.add_argument("--copies", type=int, default=1)
+    tcp.add_argument("--copy-delay", type=float, default=0.0,
+                     help="不使用连接池时份数之间的间隔（旧版为 0.5 秒）")
+    tcp.set_defaults(func=bench_tcp)
+
+    aio = sub.add_parser("aio", help="asyncio TCP 后端驱动大量打印机")
+    aio.add_argument("--printers", type=int, default=1000)
+    aio.add_argument("--size", type=int, default=4096)
+    aio.add_argument("--copies", type=int, default=1)
+    aio.add_argument("--max-connections", type=int, default=500)
+    aio.set_defaults(func=bench_aio)
+
+    sim = sub.add_parser("sim", help="模拟后台处理程序上的调度引擎吞吐量")
+    sim.add_argument("--jobs", type=int, default=1000000)
+    sim.add_argument("--printers", type=int, default=50)
+    sim.add_argument("--workers", type=int, default=16)
+    sim.add_argument("--size", type=int, default=4096)
+    sim.add_argument("--latency", type=float, default=0.0)
+    sim.add_argument("--error-rate", type=float, default=0.0)
+    sim.add_argument("--interval", type=float, default=0.05, help="作业跟踪轮询间隔（秒）")
+    sim.set_defaults(func=bench_sim)
+
+    copies = sub.add_parser("copies", help="多份打印的逐份/合并模式对比")
+    copies.add_argument("--jobs", type=int, default=5, help="每台打印机的作业数")
+    copies.add_argument("--printers", type=int, default=4)
+    copies.add_argument("--copies", type=int, default=5)
+    copies.add_argument("--copies-per-job", type=int, default=2)
+    copies.add_argument("--size", type=int, default=20000)
+    copies.add_argument("--latency", type=float, default=0.05, help="每个后台作业的固定开销（秒）")
+    copies.add_argument("--rate", type=float, default=1024 * 1024, help="模拟设备吞吐量（字节/秒）")
+    copies.add_argument("--copy-delay", type=float, default=0.5, help="固定份数间隔（旧版为 0.5 秒）")
+    copies.add_argument("--tcp-jobs", type=int, default=2000)
+    copies.set_defaults(func=bench_copies)
+
+    render = sub.add_parser("render", help="ESC/POS 光栅渲染吞吐量与缓存")
+    render.add_argument("--pages", type=int, default=20)
+    render.add_argument("--height", type=int, default=1600, help="每页高度（点）")
+    render.add_argument("--paper-width", type=int, choices=sorted(PAPER_PRINTABLE_MM), default=80)
+    render.add_argument("--dpi", type=int, default=203)
+    render.add_argument("--jobs", type=int, default=1000, help="缓存命中测试的作业数")
+    render.set_defaults(func=bench_render)
+
+    relay = sub.add_parser("relay", help="经中继代理按文档摘要打印与直接发送的线路字节数对比")
+    relay.add_argument("--printers", type=int, default=10)
+    relay.add_argument("--rounds", type=int, default=20, help="每台打印机的作业数")
+    relay.add_argument("--copies", type=int, default=2)
+    relay.add_argument("--documents", type=int, default=2, help="轮流打印的测试文档数")
+    relay.add_argument("--height", type=int, default=800, help="测试文档的高度（点）")
+    relay.add_argument("--level", type=int, default=6, help="zlib 压缩级别，0 表示不压缩")
+    relay.add_argument("--link-kbps", type=float, default=2000, help="估算用的广域网带宽（kbit/s）")
+    relay.add_argument("--rtt", type=float, default=60, help="估算用的广域网往返时间（毫秒）")
+    relay.set_defaults(func=bench_relay)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
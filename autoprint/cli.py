@@ -0,0 +1,741 @@
+"""无界面命令行 / 守护进程模式
+
+用法:
+    autoprinter run --printer NAME [--printer NAME ...] [--config PATH] [--document PATH]
+                    [--interval 秒 | --schedule 计划] [--copies N] [--backend auto|win32|shell|tcp|file|simulated]
+                    [--copy-mode per_copy|batch] [--copies-per-job N] [--cut none|partial|full|feed]
+                    [--paper-width 58|80] [--dpi N] [--dither ordered|threshold] [--tcp NAME=IP:PORT ...] [--scan CIDR ...] [--confirm]
+                    [--status-port NAME=COM ...] [--timeout 秒] [--backend-timeout BACKEND=秒 ...]
+                    [--relay NAME=HOST:PORT ...] [--count 次数]
+    autoprinter relay --tcp NAME=IP:PORT [--tcp ...] [--listen HOST:PORT] [--cache-mb N]
+    autoprinter agent --listen HOST:PORT [--printer NAME ...] [--tcp NAME=IP:PORT ...] [--backend ...]
+    autoprinter coordinate --agent HOST:PORT [--agent ...] [--printer NAME ...] [--document PATH]
+                    [--interval 秒 | --schedule 计划] [--copies N] [--count 次数]
+    autoprinter load --printer NAME [--printer ...] --profile 负载曲线 [--closed-loop [--concurrency N]]
+                    [--backend ...] [--tcp NAME=IP:PORT ...] [--document PATH] [--copies N] [--csv PATH]
+
+命令行参数优先于配置文件（--config）中的设置；配置文件修改后自动热加载。
+relay 子命令在门店运行中继代理（见 relay.py），测试机用 run --relay 把作业交给它。
+agent / coordinate 子命令组成多主机打印农场（见 farm.py）：每组打印机旁运行一个打印代理，
+一个协调器按计划向所有代理能访问的打印机分派作业，代理失联时把它的打印机转给其他代理。
+load 子命令按负载曲线（见 loadgen.py）压测打印机，报告后台处理程序或设备开始饱和的速率。
+与GUI共用同一个打印引擎，但不导入 PyQt5；打印后端在第一次使用时才导入。
+"""
+import argparse
+import csv
+import os
+import sys
+import threading
+import time
+
+from autoprint.backends import BACKENDS, BackendManager, backend_for_document
+from autoprint.batching import COPY_MODES, CUT_COMMANDS
+from autoprint.config import ConfigError, ConfigManager, apply_tcp_config, resolve_document
+from autoprint.documents import DOCUMENT_FOLDER, list_documents
+from autoprint.engine import PrintEngine
+from autoprint.farm import FARM_PORT, FarmAgent, FarmCoordinator
+from autoprint.escpos_status import SerialChannel, StatusPoller
+from autoprint.exporter import MetricsExporter
+from autoprint.journal import JobJournal
+from autoprint.loadgen import LoadGenerator, format_report, parse_profile
+from autoprint.logbuffer import LogPipeline
+from autoprint.metrics import JobMetricsStore
+from autoprint.relay import RELAY_PORT, PayloadStore, RelayAgent
+from autoprint.render import DITHER_MODES, PAPER_PRINTABLE_MM, Renderer, can_render
+from autoprint.retry import NO_RETRY
+from autoprint.schedule import IntervalSchedule, Scheduler, parse_schedule
+from autoprint.scanner import SubnetScanner, apply_scan_results, count_hosts
+from autoprint.tcp_pool import TcpConnectionPool
+from autoprint.timeouts import TimeoutPolicy
+
+
+def _print_line(line):
+    print(line, flush=True)
+
+
+def _parse_tcp_printer(value):
+    try:
+        name, address = value.split("=", 1)
+        ip, port = address.rsplit(":", 1)
+        return name, (ip, int(port))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"TCP打印机格式应为 NAME=IP:PORT: {value}")
+
+
+def _parse_endpoint(value, default_port=RELAY_PORT):
+    host, sep, port = value.rpartition(":")
+    try:
+        return (host if sep else value), int(port) if sep else default_port
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"地址格式应为 HOST:PORT: {value}")
+
+
+def _parse_agent(value):
+    return _parse_endpoint(value, FARM_PORT)
+
+
+def _parse_relay_printer(value):
+    name, sep, address = value.partition("=")
+    if not sep or not name or not address:
+        raise argparse.ArgumentTypeError(f"中继打印机格式应为 NAME=HOST:PORT: {value}")
+    return name, _parse_endpoint(address)
+
+
+def _parse_status_port(value):
+    name, sep, port = value.partition("=")
+    if not sep or not name or not port:
+        raise argparse.ArgumentTypeError(f"状态端口格式应为 NAME=COM端口: {value}")
+    return name, port
+
+
+def _parse_schedule(value):
+    try:
+        parse_schedule(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+
+def _parse_profile(value):
+    try:
+        parse_profile(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+
+def _parse_backend_timeout(value):
+    backend, sep, seconds = value.partition("=")
+    try:
+        if not sep or backend not in BACKENDS or float(seconds) <= 0:
+            raise ValueError
+        return backend, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"后端超时格式应为 BACKEND=秒（BACKEND 为 {'/'.join(sorted(BACKENDS))}）: {value}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="autoprinter", description="打印驱动测试工具（无界面模式）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="按固定间隔向一台或多台打印机打印测试文档")
+    run.add_argument("--printer", action="append", default=[],
+                     help="打印机名称，可重复指定以同时测试多台打印机")
+    run.add_argument("--config", help="TOML/YAML 配置文件：打印机、打印参数、文档和后端，修改后自动热加载")
+    run.add_argument("--document", help=f"测试文档路径（默认取 {DOCUMENT_FOLDER} 中的第一个文档）")
+    run.add_argument("--interval", type=float, help="打印间隔（秒，可以是小数，默认60）")
+    run.add_argument("--schedule", type=_parse_schedule,
+                     help="打印计划，代替 --interval：every 0.5s、10/s（每秒作业数）、cron */5 * * * *")
+    run.add_argument("--copies", type=int, help="每次打印份数（默认1）")
+    run.add_argument("--copy-mode", choices=COPY_MODES,
+                     help="per_copy 每份一个作业（默认）；batch 多份合并为一个作业（RAW/TCP/模拟后端）")
+    run.add_argument("--copies-per-job", type=int, default=0,
+                     help="batch 模式下每个作业最多包含的份数，0 表示不拆分")
+    run.add_argument("--cut", choices=sorted(CUT_COMMANDS),
+                     help="每份之后发送的 ESC/POS 切纸指令（默认 none）")
+    run.add_argument("--count", type=int, default=0, help="每台打印机打印的次数，0 表示一直运行")
+    run.add_argument("--timeout", type=float, help="打印超时（秒，默认120）")
+    run.add_argument("--backend-timeout", action="append", default=[], type=_parse_backend_timeout,
+                     metavar="BACKEND=秒", help="某个后端单独的打印超时，配置文件中打印机自己的超时优先")
+    run.add_argument("--no-retry", action="store_true", help="失败的作业不重试")
+    run.add_argument("--workers", type=int, default=16, help="并发打印线程数上限")
+    run.add_argument("--backend", choices=["auto"] + sorted(BACKENDS),
+                     help="打印后端，auto（默认）表示按文档类型选择")
+    run.add_argument("--paper-width", type=int, choices=sorted(PAPER_PRINTABLE_MM), default=80,
+                     help="纸宽（毫米），txt/pdf/图片按此宽度渲染为 ESC/POS 数据")
+    run.add_argument("--dpi", type=int, default=203, help="打印头分辨率（默认203）")
+    run.add_argument("--dither", choices=DITHER_MODES, default="ordered",
+                     help="pdf/图片转为黑白的方式：ordered 有序抖动（默认），threshold 固定阈值")
+    run.add_argument("--tcp", action="append", default=[], type=_parse_tcp_printer,
+                     metavar="NAME=IP:PORT", help="TCP打印机配置，可重复指定")
+    run.add_argument("--scan", action="append", default=[], metavar="CIDR",
+                     help="扫描网段，把开放 9100 端口的主机加入TCP打印机并一起测试，可重复指定")
+    run.add_argument("--confirm", action="store_true", default=None,
+                     help="TCP打印机等待设备确认打印完成（GS r 1），等待期间检测缺纸、开盖和切刀错误")
+    run.add_argument("--relay", action="append", default=[], type=_parse_relay_printer,
+                     metavar="NAME=HOST:PORT",
+                     help=f"经门店的中继代理打印（代理端口默认 {RELAY_PORT}），文档按摘要缓存在代理上，可重复指定")
+    run.add_argument("--status-port", action="append", default=[], type=_parse_status_port,
+                     metavar="NAME=COM", help="USB打印机的虚拟串口，持续查询其实时状态（需要 pyserial）")
+    run.add_argument("--output-dir", default=os.path.join(DOCUMENT_FOLDER, "output"),
+                     help="file 后端的输出目录")
+    run.add_argument("--log-file", help="同时写入按大小轮转的 JSONL 日志文件")
+    run.add_argument("--metrics-file", help="把每个作业的指标追加写入该二进制文件")
+    run.add_argument("--journal", help="作业日志文件：重启后恢复计数器和未完成的作业")
+    run.add_argument("--metrics-port", type=int, help="在该端口提供 Prometheus /metrics")
+    run.set_defaults(func=run_command)
+
+    relay = sub.add_parser("relay", help="在打印机旁运行中继代理，接收测试机按文档摘要发来的打印指令")
+    relay.add_argument("--listen", type=_parse_endpoint, default=("0.0.0.0", RELAY_PORT),
+                       metavar="HOST:PORT", help=f"监听地址（默认 0.0.0.0:{RELAY_PORT}）")
+    relay.add_argument("--tcp", action="append", default=[], type=_parse_tcp_printer,
+                       metavar="NAME=IP:PORT", help="代理负责的TCP打印机，可重复指定")
+    relay.add_argument("--cache-mb", type=int, default=256, help="文档缓存上限（MB，默认256）")
+    relay.add_argument("--log-file", help="同时写入按大小轮转的 JSONL 日志文件")
+    relay.set_defaults(func=relay_command)
+
+    agent = sub.add_parser("agent", help="在一组打印机旁运行打印代理，执行协调器分派的作业")
+    agent.add_argument("--listen", type=_parse_agent, required=True, metavar="HOST:PORT",
+                       help=f"监听地址（端口默认 {FARM_PORT}）；代理不做身份验证，只应监听协调器可达的受信任网络")
+    agent.add_argument("--name", help="代理名称（默认为监听地址）")
+    agent.add_argument("--printer", action="append", default=[],
+                       help="本机可以打印的打印机名称，可重复指定")
+    agent.add_argument("--tcp", action="append", default=[], type=_parse_tcp_printer,
+                       metavar="NAME=IP:PORT", help="本机可以访问的TCP打印机，可重复指定")
+    agent.add_argument("--backend", choices=["auto"] + sorted(BACKENDS), default="auto",
+                       help="打印后端，auto（默认）表示按文档类型选择")
+    agent.add_argument("--workers", type=int, default=16, help="并发打印线程数上限")
+    agent.add_argument("--timeout", type=float, default=120, help="打印超时（秒，默认120）")
+    agent.add_argument("--no-retry", action="store_true", help="失败的作业不重试")
+    agent.add_argument("--documents", help="保存协调器上传的文档的目录（默认为临时目录）")
+    agent.add_argument("--output-dir", default=os.path.join(DOCUMENT_FOLDER, "output"),
+                       help="file 后端的输出目录")
+    agent.add_argument("--log-file", help="同时写入按大小轮转的 JSONL 日志文件")
+    agent.set_defaults(func=agent_command)
+
+    coordinate = sub.add_parser("coordinate", help="向多个打印代理分派作业并汇总结果")
+    coordinate.add_argument("--agent", action="append", default=[], type=_parse_agent, required=True,
+                            metavar="HOST:PORT", help=f"打印代理地址（端口默认 {FARM_PORT}），可重复指定")
+    coordinate.add_argument("--printer", action="append", default=[],
+                            help="只测试这些打印机（默认测试代理能访问的全部打印机）")
+    coordinate.add_argument("--document", help=f"测试文档路径（默认取 {DOCUMENT_FOLDER} 中的第一个文档）")
+    coordinate.add_argument("--interval", type=float, default=60, help="打印间隔（秒，可以是小数，默认60）")
+    coordinate.add_argument("--schedule", type=_parse_schedule, help="打印计划，代替 --interval")
+    coordinate.add_argument("--copies", type=int, default=1, help="每次打印份数（默认1）")
+    coordinate.add_argument("--copy-mode", choices=COPY_MODES, help="份数模式（默认由代理决定）")
+    coordinate.add_argument("--cut", choices=sorted(CUT_COMMANDS), help="每份之后发送的切纸指令")
+    coordinate.add_argument("--count", type=int, default=0, help="每台打印机打印的次数，0 表示一直运行")
+    coordinate.add_argument("--failure-after", type=float, default=5.0,
+                            help="代理连续多少秒无法连接时判定失联并转移它的打印机（默认5）")
+    coordinate.add_argument("--report", type=float, default=30.0, help="汇总日志的间隔（秒，0 表示不输出）")
+    coordinate.add_argument("--log-file", help="同时写入按大小轮转的 JSONL 日志文件")
+    coordinate.set_defaults(func=coordinate_command)
+
+    load = sub.add_parser("load", help="按目标速率和负载曲线压测打印机，找出开始饱和的速率")
+    load.add_argument("--printer", action="append", default=[],
+                      help="打印机名称，可重复指定；每台打印机都按完整的目标速率加压")
+    load.add_argument("--profile", type=_parse_profile, required=True,
+                      help="负载曲线: sustained 10/s 60s、ramp 1-50/s 120s、step 5,10,20/s 30s、"
+                           "spike 10:100/s 60s 5s；速率也可以是 KB/s、MB/s")
+    load.add_argument("--closed-loop", action="store_true",
+                      help="闭环：每台打印机最多 --concurrency 个未完成作业（默认开环，不等待完成）")
+    load.add_argument("--concurrency", type=int, default=1, help="闭环时每台打印机的未完成作业上限")
+    load.add_argument("--document", help=f"测试文档路径（默认取 {DOCUMENT_FOLDER} 中的第一个文档）")
+    load.add_argument("--copies", type=int, default=1, help="每个作业的份数（默认1）")
+    load.add_argument("--backend", choices=["auto"] + sorted(BACKENDS), default="auto",
+                      help="打印后端，auto（默认）表示按文档类型选择")
+    load.add_argument("--tcp", action="append", default=[], type=_parse_tcp_printer,
+                      metavar="NAME=IP:PORT", help="TCP打印机配置，可重复指定")
+    load.add_argument("--confirm", action="store_true",
+                      help="TCP打印机等待设备确认打印完成（GS r 1），延迟包含设备打印时间")
+    load.add_argument("--sim-bytes-per-sec", type=float, default=0,
+                      help="simulated 后端模拟的设备吞吐量（字节/秒，0 表示不限）")
+    load.add_argument("--sim-latency", type=float, default=0.0, help="simulated 后端每个作业的固定开销（秒）")
+    load.add_argument("--window", type=float, default=1.0, help="统计窗口（秒，默认1）")
+    load.add_argument("--tolerance", type=float, default=0.1,
+                      help="完成速率连续两个窗口低于目标速率的这个比例时判定饱和（默认0.1）")
+    load.add_argument("--latency-factor", type=float, default=3.0,
+                      help="p95 延迟超过开始时的这个倍数时判定饱和（默认3）")
+    load.add_argument("--drain", type=float, default=30.0, help="负载结束后等待积压作业完成的最长时间（秒）")
+    load.add_argument("--timeout", type=float, default=30.0, help="打印超时（秒，默认30）")
+    load.add_argument("--workers", type=int, default=64, help="并发打印线程数上限")
+    load.add_argument("--output-dir", default=os.path.join(DOCUMENT_FOLDER, "output"),
+                      help="file 后端的输出目录")
+    load.add_argument("--csv", help="把每个窗口的统计写入 CSV 文件")
+    load.add_argument("--log-file", help="同时写入按大小轮转的 JSONL 日志文件")
+    load.set_defaults(func=load_command)
+    parser.commands = tuple(sub.choices)  # autoprinter.py 据此把子命令交给命令行模式
+    return parser
+
+
+def _resolve_document(document):
+    if document:
+        if not os.path.isfile(document):
+            raise SystemExit(f"错误: 测试文档不存在: {document}")
+        return document
+    try:
+        documents = list_documents(DOCUMENT_FOLDER)
+    except OSError:
+        documents = []
+    if not documents:
+        raise SystemExit(f"错误: {DOCUMENT_FOLDER} 中没有可用测试文档")
+    return sorted(documents)[0]
+
+
+def run_command(args):
+    log_pipeline = LogPipeline(file_path=args.log_file, capacity=1000, pending_limit=1,
+                               echo=_print_line)
+    try:
+        return _run(args, log_pipeline.log)
+    finally:
+        log_pipeline.close()
+
+
+def relay_command(args):
+    if not args.tcp:
+        raise SystemExit("错误: 没有要代理的打印机（使用 --tcp 指定）")
+    log_pipeline = LogPipeline(file_path=args.log_file, capacity=1000, pending_limit=1,
+                               echo=_print_line)
+    log_message = log_pipeline.log
+    try:
+        agent = RelayAgent(dict(args.tcp), *args.listen,
+                           store=PayloadStore(args.cache_mb * 1024 * 1024), log=log_message)
+    except OSError as e:
+        log_pipeline.close()
+        raise SystemExit(f"错误: 监听 {args.listen[0]}:{args.listen[1]} 失败: {e}")
+    host, port = agent.address
+    log_message(f"中继代理已启动: {host}:{port} -> {', '.join(name for name, _ in args.tcp)}")
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        log_message("收到中断信号，正在停止")
+    finally:
+        agent.stop()
+        log_message(f"中继代理已停止: 打印 {agent.jobs} 个作业，文档缓存命中 {agent.store.hits} 次、"
+                    f"未命中 {agent.store.misses} 次")
+        log_pipeline.close()
+    return 0
+
+
+def agent_command(args):
+    printers = list(args.printer)
+    printers += [name for name, _ in args.tcp if name not in printers]
+    if not printers:
+        raise SystemExit("错误: 没有要代理的打印机（使用 --printer 或 --tcp 指定）")
+    log_pipeline = LogPipeline(file_path=args.log_file, capacity=1000, pending_limit=1,
+                               echo=_print_line)
+    log_message = log_pipeline.log
+    tcp_printers = dict(args.tcp)
+    renderer = None
+    if args.documents:
+        renderer = Renderer(os.path.join(args.documents, "cache"), log=log_message)
+    backends = BackendManager(
+        options={
+            'tcp': {'printers': tcp_printers},
+            'file': {'directory': args.output_dir},
+        },
+        log=log_message, renderer=renderer)
+
+    def backend_for(printer_name, doc_path):
+        if args.backend != "auto":
+            return args.backend
+        return backend_for_document(doc_path, printer_name, tcp_printers)
+
+    try:
+        agent = FarmAgent(printers, backends, backend_for, args.documents, name=args.name,
+                          host=args.listen[0], port=args.listen[1], max_workers=args.workers,
+                          retry_policy=NO_RETRY if args.no_retry else None,
+                          timeout_policy=TimeoutPolicy(args.timeout), log=log_message)
+    except OSError as e:
+        log_pipeline.close()
+        raise SystemExit(f"错误: 监听 {args.listen[0]}:{args.listen[1]} 失败: {e}")
+    log_message(f"打印代理已启动: {agent.name} -> {', '.join(printers)}")
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        log_message("收到中断信号，正在停止")
+    finally:
+        agent.stop()
+        success, failed = agent.engine.totals()
+        log_message(f"打印代理已停止: 成功打印 {success} 次，失败 {failed} 次")
+        log_pipeline.close()
+    return 0
+
+
+def coordinate_command(args):
+    log_pipeline = LogPipeline(file_path=args.log_file, capacity=1000, pending_limit=1,
+                               echo=_print_line)
+    try:
+        return _coordinate(args, log_pipeline.log)
+    finally:
+        log_pipeline.close()
+
+
+def _coordinate(args, log_message):
+    doc_path = _resolve_document(args.document)
+    schedule = parse_schedule(args.schedule) if args.schedule else IntervalSchedule(args.interval)
+    options = {field: value for field, value in (('copy_mode', args.copy_mode), ('cut', args.cut))
+               if value is not None}
+    coordinator = FarmCoordinator(args.agent, failure_after=args.failure_after, log=log_message)
+
+    def on_job_finished(job):
+        if job['status'] != 'done':
+            log_message(f"打印失败: [{job['printer']}] {job.get('error')}")
+
+    coordinator.add_listener(on_job_finished)
+    coordinator.start()
+    submitted = {}
+
+    def current_printers():
+        printers = coordinator.printers()
+        if args.printer:
+            printers = [name for name in args.printer if name in printers]
+        return [name for name in printers if not args.count or submitted.get(name, 0) < args.count]
+
+    def print_scheduled(printer_name, count):
+        if args.count:
+            count = min(count, args.count - submitted.get(printer_name, 0))
+            if count <= 0:
+                return
+        for _ in range(count):
+            coordinator.submit(printer_name, doc_path, args.copies, **options)
+        submitted[printer_name] = submitted.get(printer_name, 0) + count
+        if args.count and submitted[printer_name] >= args.count:
+            scheduler.remove(printer_name)
+
+    scheduler = Scheduler(print_scheduled, log=log_message)
+    printers = current_printers()
+    log_message(f"协调器启动: {len(args.agent)} 个代理，{len(printers)} 台打印机，"
+                f"{os.path.basename(doc_path)}，计划 {schedule}")
+    stop = threading.Event()
+    last_report = time.monotonic()
+    try:
+        scheduler.start()
+        while not stop.is_set():
+            # 代理上线或失联后打印机集合会变化；新出现的打印机立即开始打印
+            printers = current_printers()
+            scheduler.update({name: schedule for name in printers}, immediate=True)
+            if args.count and not printers and submitted and not coordinator.outstanding():
+                break
+            if args.report and time.monotonic() - last_report >= args.report:
+                last_report = time.monotonic()
+                success, failed = coordinator.totals()
+                alive = sum(1 for entry in coordinator.agent_stats() if entry['alive'])
+                log_message(f"进度: 在线代理 {alive}/{len(args.agent)}，成功 {success}，失败 {failed}，"
+                            f"未完成 {coordinator.outstanding()}")
+            stop.wait(0.2)
+    except KeyboardInterrupt:
+        log_message("收到中断信号，正在停止")
+    finally:
+        scheduler.stop()
+        coordinator.stop()
+
+    for entry in coordinator.agent_stats():
+        log_message(f"代理 {entry['agent']}: {'在线' if entry['alive'] else '失联'}，负责 {entry['printers']} 台"
+                    f"（可访问 {entry['reachable']} 台），提交 {entry['submitted']}，完成 {entry['completed']}，"
+                    f"线路 {entry['wire_bytes']} 字节")
+    for entry in coordinator.printer_stats():
+        latency = ""
+        if entry['latency_avg'] is not None:
+            latency = f"  延迟 平均 {entry['latency_avg']:.3f}s 最大 {entry['latency_max']:.3f}s"
+        log_message(f"[{entry['printer']}] 成功 {entry['success']}  失败 {entry['failed']}  "
+                    f"超时 {entry['timeouts']}  未完成 {entry['pending']}{latency}")
+    success, failed = coordinator.totals()
+    log_message(f"共提交 {sum(submitted.values())} 个作业，成功打印 {success} 次，失败 {failed} 次")
+    return 0 if failed == 0 and not coordinator.outstanding() else 1
+
+
+def load_command(args):
+    log_pipeline = LogPipeline(file_path=args.log_file, capacity=1000, pending_limit=1,
+                               echo=_print_line)
+    try:
+        return _load(args, log_pipeline.log)
+    finally:
+        log_pipeline.close()
+
+
+def _load(args, log_message):
+    printers = list(args.printer) + [name for name, _ in args.tcp if name not in args.printer]
+    if not printers:
+        raise SystemExit("错误: 没有要压测的打印机（使用 --printer 或 --tcp 指定）")
+    doc_path = _resolve_document(args.document)
+    profile = parse_profile(args.profile)
+    tcp_printers = dict(args.tcp)
+    tcp_pool = TcpConnectionPool(log=log_message)
+    status_poller = StatusPoller(confirm_timeout=args.timeout, log=log_message)
+    # 压测时每秒可能有上千个作业，后端不逐份输出日志，失败原因在汇总中体现
+    backends = BackendManager(
+        options={
+            'tcp': {'printers': tcp_printers, 'pool': tcp_pool, 'status_poller': status_poller},
+            'simulated': {'bytes_per_sec': args.sim_bytes_per_sec, 'latency': args.sim_latency},
+            'file': {'directory': args.output_dir},
+        },
+        renderer=Renderer(os.path.join(DOCUMENT_FOLDER, "cache"), log=log_message))
+    # 按实际发送的数据量换算字节速率：txt/pdf/图片先渲染一次
+    payload = backends.renderer.render(doc_path) if can_render(doc_path) else doc_path
+    job_bytes = os.path.getsize(payload) * args.copies
+
+    engine = PrintEngine(lambda job: backends.run_job(job, engine.complete_job),
+                         max_workers=args.workers, log=log_message, retry_policy=NO_RETRY,
+                         timeout_policy=TimeoutPolicy(args.timeout))
+    engine.add_listener(backends.untrack)
+
+    def submit(printer_name, **extra):
+        backend = args.backend
+        if backend == "auto":
+            backend = backend_for_document(doc_path, printer_name, tcp_printers)
+        return engine.submit(printer_name, doc_path, args.copies, backend=backend,
+                             confirm=args.confirm, **extra)
+
+    try:
+        generator = LoadGenerator(engine, printers, submit, profile, job_bytes=job_bytes,
+                                  closed_loop=args.closed_loop, concurrency=args.concurrency,
+                                  window=args.window, tolerance=args.tolerance,
+                                  latency_factor=args.latency_factor, log=log_message)
+    except ValueError as e:
+        raise SystemExit(f"错误: {e}")
+    log_message(f"负载生成: {profile}（{'闭环' if args.closed_loop else '开环'}）-> {', '.join(printers)}，"
+                f"{os.path.basename(doc_path)} 每个作业 {job_bytes} 字节，共 {profile.duration:g} 秒")
+    try:
+        report = generator.run(drain=args.drain)
+    except KeyboardInterrupt:
+        log_message("收到中断信号，正在停止")
+        generator.stop()
+        report = generator.report()
+    finally:
+        engine.shutdown()
+        backends.close()
+        status_poller.stop()
+        tcp_pool.close_all()
+
+    for line in format_report(report, len(printers)):
+        log_message(line)
+    if args.csv:
+        with open(args.csv, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(report['windows'][0]) if report['windows'] else ['start'])
+            writer.writeheader()
+            writer.writerows(report['windows'])
+        log_message(f"窗口统计已写入: {args.csv}")
+    success, failed = engine.totals()
+    log_message(f"共提交 {success + failed + report['outstanding']} 个作业，成功打印 {success} 次，失败 {failed} 次")
+    return 0
+
+
+def _scan(ranges, tcp_printers, log_message):
+    try:
+        hosts = count_hosts(ranges)
+    except ValueError as e:
+        raise SystemExit(f"错误: 网段格式错误: {e}")
+    log_message(f"开始扫描TCP打印机: {', '.join(ranges)}（{hosts} 台主机）")
+    start = time.perf_counter()
+    results = SubnetScanner().scan(ranges)
+    added = apply_scan_results(tcp_printers, results)
+    log_message(f"网段扫描完成: 发现 {len(results)} 台主机，其中 {len(added)} 台TCP打印机，"
+                f"用时 {time.perf_counter() - start:.1f} 秒")
+    return added
+
+
+def _run(args, log_message):
+    config_diffs = []
+    station_config = ConfigManager(args.config or "", on_change=config_diffs.append,
+                                   log=log_message)
+    if args.config:
+        try:
+            station_config.load()
+        except ConfigError as e:
+            raise SystemExit(f"错误: {e}")
+    # 命令行写出的参数覆盖配置文件
+    overrides = {field: value for field, value in (
+        ('interval', args.interval), ('schedule', args.schedule), ('timeout', args.timeout),
+        ('copies', args.copies), ('document', args.document and os.path.abspath(args.document)),
+        ('backend', args.backend), ('copy_mode', args.copy_mode), ('cut', args.cut),
+        ('confirm', args.confirm)) if value is not None}
+
+    def settings(printer_name=None):
+        values = station_config.config.settings(printer_name)
+        values.update(overrides)
+        return values
+
+    default_doc = _resolve_document(resolve_document(settings()['document'], DOCUMENT_FOLDER))
+    tcp_printers = dict(args.tcp)
+    tcp_printers.update(station_config.config.tcp_printers())
+    relay_printers = dict(args.relay)
+    scanned = []
+    scan_ranges = args.scan or list(station_config.config.scan_ranges)
+    if scan_ranges:
+        scanned = _scan(scan_ranges, tcp_printers, log_message)
+
+    # 超时：配置文件中打印机自己的 timeout > --backend-timeout > 全局超时
+    timeout_policy = TimeoutPolicy(backends=dict(args.backend_timeout))
+
+    def apply_timeouts():
+        timeout_policy.default = settings()['timeout']
+        timeout_policy.printers = {} if 'timeout' in overrides else {
+            name: printer['timeout'] for name, printer in station_config.config.printers.items()
+            if 'timeout' in printer}
+
+    apply_timeouts()
+
+    def schedule_for(printer_name):
+        # 命令行的 --schedule / --interval 优先于配置文件中的计划
+        if 'schedule' in overrides:
+            return parse_schedule(overrides['schedule'])
+        if 'interval' in overrides:
+            return IntervalSchedule(overrides['interval'])
+        return station_config.config.schedule(printer_name)
+
+    def current_printers():
+        names = list(args.printer)
+        for name in station_config.config.enabled_printers() + scanned:
+            if name not in names:
+                names.append(name)
+        return names
+
+    printers = current_printers()
+    if not printers:
+        raise SystemExit("错误: 没有要测试的打印机（使用 --printer 指定、--config 配置或 --scan 扫描）")
+    tcp_pool = TcpConnectionPool(log=log_message)
+    # 所有打印机共用一个设备状态轮询线程
+    status_poller = StatusPoller(confirm_timeout=settings()['timeout'], log=log_message)
+    status_poller.add_listener(
+        lambda name, status: log_message(f"[{name}] 设备状态: {status.text()}"))
+    for name, port in args.status_port:
+        try:
+            status_poller.monitor(name, SerialChannel(port))
+        except Exception as e:
+            raise SystemExit(f"错误: 打开 {name} 的状态端口 {port} 失败: {e}")
+    if args.status_port:
+        status_poller.start()
+    copy_options = {'copies_per_job': args.copies_per_job}
+    backends = BackendManager(
+        options={
+            'win32': dict(copy_options),
+            'tcp': dict(copy_options, printers=tcp_printers, pool=tcp_pool,
+                        status_poller=status_poller),
+            'simulated': dict(copy_options),
+            'file': {'directory': args.output_dir},
+            'relay': {'printers': relay_printers},
+        },
+        log=log_message, device_status=status_poller.status,
+        renderer=Renderer(os.path.join(DOCUMENT_FOLDER, "cache"), paper_width=args.paper_width,
+                          dpi=args.dpi, dither=args.dither, log=log_message))
+
+    def print_job(job):
+        log_message(f"开始打印: {job['document']} 到 {job['printer']}（份数: {job['copies']}）")
+        return backends.run_job(job, engine.complete_job)
+
+    relay_bytes = [0, 0]  # 中继作业的线路字节数、打印数据字节数
+
+    def on_job_finished(job):
+        backends.untrack(job)
+        if job['status'] == 'done' and 'wire_bytes' in job:
+            relay_bytes[0] += job['wire_bytes']
+            relay_bytes[1] += job.get('bytes', 0)
+        if job['status'] == 'done':
+            log_message(f"打印成功完成！[{job['printer']}] {job['document']}")
+        elif job['status'] == 'timeout':
+            log_message(f"打印超时！[{job['printer']}] {job.get('error')}")
+        else:
+            log_message(f"打印失败: [{job['printer']}] {job.get('error')}"
+                        f"（{job['attempts']}次尝试，已放弃）")
+
+    engine = PrintEngine(print_job, max_workers=args.workers, log=log_message,
+                         retry_policy=NO_RETRY if args.no_retry else None,
+                         timeout_policy=timeout_policy)
+    engine.add_listener(on_job_finished)
+    engine.add_retry_listener(backends.untrack)
+    metrics = JobMetricsStore(path=args.metrics_file)
+    engine.add_listener(metrics.record)
+    journal = None
+    if args.journal:
+        journal = JobJournal(args.journal, log=log_message)
+        journal.attach(engine)
+    exporter = None
+    if args.metrics_port:
+        exporter = MetricsExporter(engine, backends, tcp_pool)
+        host, port = exporter.start(port=args.metrics_port)
+        log_message(f"指标端口已开启: http://{host}:{port}/metrics")
+
+    submitted = {}  # 打印机 -> 已提交的作业数
+
+    def print_scheduled(printer_name, count):
+        # 在调度线程中调用；达到 --count 后移除该打印机的计划
+        if args.count:
+            count = min(count, args.count - submitted.get(printer_name, 0))
+            if count <= 0:
+                return
+        values = settings(printer_name)
+        doc_path = resolve_document(values['document'], DOCUMENT_FOLDER) or default_doc
+        backend = values['backend']
+        if backend == "auto":
+            backend = backend_for_document(doc_path, printer_name, tcp_printers, relay_printers)
+        for _ in range(count):
+            engine.submit(printer_name, doc_path, values['copies'], backend=backend,
+                          copy_mode=values['copy_mode'], cut=values['cut'],
+                          confirm=values['confirm'])
+        submitted[printer_name] = submitted.get(printer_name, 0) + count
+        if args.count and submitted[printer_name] >= args.count:
+            scheduler.remove(printer_name)
+
+    def sync_schedules():
+        # 每台打印机启动时立即打印一次，之后按各自的计划；计划不变的打印机保持原有节奏
+        scheduler.update({name: schedule_for(name) for name in printers
+                          if not args.count or submitted.get(name, 0) < args.count},
+                         immediate=True)
+
+    scheduler = Scheduler(print_scheduled, log=log_message)
+    if args.config:
+        station_config.watch()
+    stop = threading.Event()
+    log_message(f"无界面模式启动: {os.path.basename(default_doc)} -> {', '.join(printers)}，"
+                f"计划 {schedule_for(None)}，每次打印 {settings()['copies']} 份")
+    started_at = time.time()
+    try:
+        sync_schedules()
+        scheduler.start()
+        while not stop.is_set():
+            while config_diffs:
+                # 热加载：只更新变化的TCP打印机和计划，之后的作业按新的设置提交，进行中的作业不受影响
+                diff = config_diffs.pop(0)
+                apply_tcp_config(tcp_printers, station_config.config, diff)
+                apply_timeouts()
+                printers = current_printers()
+                sync_schedules()
+                log_message(f"已重新加载配置文件: {diff.summary()}")
+                if diff.scan:
+                    log_message("扫描网段的变化在重新启动后生效")
+            if args.count and all(submitted.get(name, 0) >= args.count for name in printers):
+                break
+            stop.wait(0.2)
+        scheduler.stop()
+
+        # 等待最后一批作业结束（或超时、用尽重试）
+        while (engine.active_jobs() or engine.retrying_jobs()
+               or any(state['pending'] for state in engine.printer_stats())):
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        log_message("收到中断信号，正在停止")
+    finally:
+        scheduler.stop()
+        station_config.close()
+        if exporter:
+            exporter.stop()
+        engine.shutdown()
+        if journal:
+            journal.close()
+        backends.close()
+        status_poller.stop()
+        tcp_pool.close_all()
+        metrics.close()
+
+    success, failed = engine.totals()
+    window = time.time() - started_at + 1
+    for state in engine.printer_stats():
+        stats = metrics.stats(state['printer'], window=window)
+        latency = ""
+        if stats['p50'] is not None:
+            latency = (f"  延迟 p50 {stats['p50']:.3f}s p95 {stats['p95']:.3f}s"
+                       f" p99 {stats['p99']:.3f}s")
+        log_message(f"[{state['printer']}] 成功 {state['success']}  失败 {state['failed']}  "
+                    f"超时 {state['timeouts']}  重试 {state['retries']}{latency}")
+    for entry in engine.dead_letters():
+        log_message(f"放弃的作业 #{entry['id']} [{entry['printer']}] {entry['document']}: "
+                    f"{entry['failure']}，{entry['attempts']}次尝试，{entry['reason']}")
+    for entry in scheduler.stats():
+        if entry['skipped']:
+            log_message(f"[{entry['printer']}] 计划 {entry['schedule']}：落后时跳过 {entry['skipped']} 次")
+    if relay_bytes[1]:
+        log_message(f"中继: 线路传输 {relay_bytes[0]} 字节，打印数据 {relay_bytes[1]} 字节"
+                    f"（{relay_bytes[0] / relay_bytes[1]:.1%}）")
+    log_message(f"共提交 {sum(submitted.values())} 个作业，成功打印 {success} 次，失败 {failed} 次")
+    return 0 if failed == 0 else 1
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
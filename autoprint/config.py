@@ -0,0 +1,348 @@
+"""配置文件驱动的打印机清单与热加载
+
+测试站的打印机、打印参数、文档和后端写在一个 TOML 文件中（也支持 YAML，需要 PyYAML）:
+
+    [defaults]                  # 全局设置，打印机节中没有写的字段沿用这里
+    interval = 60               # 自动打印间隔（秒，可以是小数）
+    # schedule = "10/s"         # 代替 interval：every 0.5s / 10/s / cron */5 * * * *（见 schedule.py）
+    timeout = 120               # 打印超时（秒）
+    copies = 1
+    document = "receipt.tcp"    # 相对路径按测试文档文件夹解析
+    backend = "auto"            # auto 表示按文档类型选择
+    copy_mode = "per_copy"
+    cut = "none"
+    confirm = false             # TCP打印机等待设备确认打印完成（GS r 1）
+
+    [scan]
+    ranges = ["192.168.1.0/24"]
+
+    [printers."Sunmi NT311"]    # 没有 host 的打印机按名称交给 Windows 后台处理程序
+    copies = 2
+
+    [printers.kitchen]          # 有 host 的是 TCP 打印机
+    host = "192.168.1.50"
+    port = 9100
+    schedule = "every 0.5s"
+
+ConfigManager 监视配置文件：内容没变（只是 mtime 变化）时不解析；各节按内容摘要比较，
+只校验变化的节，并返回增量（ConfigDiff），调用方只更新变化的部分，进行中的作业不受影响。
+文件有语法或取值错误时保留上一次有效的配置。
+"""
+import hashlib
+import json
+import os
+import threading
+
+from autoprint.backends import BACKENDS
+from autoprint.batching import COPY_MODES, CUT_COMMANDS
+from autoprint.documents import FolderWatcher
+from autoprint.schedule import IntervalSchedule, parse_schedule
+from autoprint.scanner import RAW_PORT, count_hosts
+
+CONFIG_NAMES = ('autoprinter.toml', 'autoprinter.yaml', 'autoprinter.yml')
+
+# 配置文件中没有写出时使用的值
+DEFAULT_SETTINGS = {
+    'interval': 60.0,
+    'schedule': None,
+    'timeout': 120.0,
+    'copies': 1,
+    'document': None,
+    'backend': 'auto',
+    'copy_mode': 'per_copy',
+    'cut': 'none',
+    'confirm': False,
+    'enabled': True,
+}
+
+_CHOICES = {
+    'backend': ('auto',) + tuple(sorted(BACKENDS)),
+    'copy_mode': COPY_MODES,
+    'cut': tuple(sorted(CUT_COMMANDS)),
+}
+
+
+class ConfigError(Exception):
+    pass
+
+
+def find_config(folder):
+    """返回文件夹中第一个存在的配置文件，都不存在时返回 TOML 配置文件的路径"""
+    for name in CONFIG_NAMES:
+        path = os.path.join(folder, name)
+        if os.path.isfile(path):
+            return path
+    return os.path.join(folder, CONFIG_NAMES[0])
+
+
+def parse_config(data, path):
+    """按扩展名解析配置文件内容（bytes），返回字典"""
+    if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ConfigError("读取 YAML 配置文件需要安装 PyYAML")
+        loads = lambda text: yaml.safe_load(text) or {}
+    else:
+        import tomllib
+        loads = tomllib.loads
+    try:
+        document = loads(data.decode('utf-8-sig'))
+    except Exception as e:
+        raise ConfigError(f"解析配置文件失败: {str(e)}")
+    if not isinstance(document, dict):
+        raise ConfigError("配置文件的顶层必须是表")
+    return document
+
+
+def _settings(section, where, extra=()):
+    """校验一个节中的打印设置，只返回其中写出的字段"""
+    if not isinstance(section, dict):
+        raise ConfigError(f"{where} 必须是表")
+    settings = {}
+    for field, value in section.items():
+        if field in extra:
+            continue
+        if field in ('interval', 'timeout'):
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+                raise ConfigError(f"{where}.{field} 必须是正数: {value!r}")
+            value = float(value)
+        elif field == 'copies':
+            if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+                raise ConfigError(f"{where}.copies 必须是正整数: {value!r}")
+        elif field == 'document':
+            if not isinstance(value, str) or not value:
+                raise ConfigError(f"{where}.document 必须是文件路径: {value!r}")
+        elif field == 'schedule':
+            try:
+                parse_schedule(value)
+            except ValueError as e:
+                raise ConfigError(f"{where}.schedule {str(e)}")
+        elif field in ('enabled', 'confirm'):
+            if not isinstance(value, bool):
+                raise ConfigError(f"{where}.{field} 必须是 true 或 false: {value!r}")
+        elif field in _CHOICES:
+            if value not in _CHOICES[field]:
+                raise ConfigError(f"{where}.{field} 应为 {'/'.join(_CHOICES[field])} 之一: {value!r}")
+        else:
+            raise ConfigError(f"{where} 中有未知的字段: {field}")
+        settings[field] = value
+    return settings
+
+
+def _printer(name, section):
+    where = f"printers.{name}"
+    printer = _settings(section, where, extra=('host', 'port'))
+    if 'host' in section:
+        host, port = section['host'], section.get('port', RAW_PORT)
+        if not isinstance(host, str) or not host:
+            raise ConfigError(f"{where}.host 必须是IP地址或主机名: {host!r}")
+        if isinstance(port, bool) or not isinstance(port, int) or not 0 < port < 65536:
+            raise ConfigError(f"{where}.port 必须是 1-65535 的端口号: {port!r}")
+        printer['host'] = host
+        printer['port'] = port
+    elif 'port' in section:
+        raise ConfigError(f"{where}.port 需要同时写出 host")
+    return printer
+
+
+def _scan_ranges(section):
+    if not isinstance(section, dict):
+        raise ConfigError("scan 必须是表")
+    unknown = set(section) - {'ranges'}
+    if unknown:
+        raise ConfigError(f"scan 中有未知的字段: {', '.join(sorted(unknown))}")
+    ranges = section.get('ranges', [])
+    if not isinstance(ranges, list) or not all(isinstance(cidr, str) for cidr in ranges):
+        raise ConfigError("scan.ranges 必须是网段字符串的列表")
+    try:
+        count_hosts(ranges)
+    except ValueError as e:
+        raise ConfigError(f"scan.ranges 网段格式错误: {str(e)}")
+    return tuple(cidr.strip() for cidr in ranges)
+
+
+def _digest(section):
+    text = json.dumps(section, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(text.encode('utf-8')).digest()
+
+
+def resolve_document(document, folder):
+    """配置中的文档路径：相对路径按测试文档文件夹解析"""
+    return os.path.join(folder, document) if document else None
+
+
+class StationConfig:
+    """一次加载得到的配置；defaults 和 printers 中只包含文件里写出的字段"""
+
+    def __init__(self, defaults=None, printers=None, scan_ranges=()):
+        self.defaults = defaults or {}
+        self.printers = printers or {}  # 名称 -> 设置（TCP打印机另有 host/port）
+        self.scan_ranges = tuple(scan_ranges)
+
+    def settings(self, printer_name=None):
+        """打印机的有效设置：内置默认值 <- [defaults] <- [printers.NAME]"""
+        settings = dict(DEFAULT_SETTINGS)
+        settings.update(self.defaults)
+        settings.update(self.printers.get(printer_name, {}))
+        return settings
+
+    def schedule(self, printer_name=None, default=None):
+        """打印机的自动打印计划：打印机节中的 schedule/interval > [defaults] 中的 schedule >
+        default（GUI 传入界面上的间隔）> interval
+        """
+        printer = self.printers.get(printer_name, {})
+        if 'schedule' in printer:
+            return parse_schedule(printer['schedule'])
+        if 'interval' in printer:
+            return IntervalSchedule(printer['interval'])
+        if 'schedule' in self.defaults:
+            return parse_schedule(self.defaults['schedule'])
+        return default or IntervalSchedule(self.settings()['interval'])
+
+    def enabled_printers(self):
+        return [name for name in self.printers if self.settings(name)['enabled']]
+
+    def tcp_printers(self):
+        return {name: (printer['host'], printer['port'])
+                for name, printer in self.printers.items() if 'host' in printer}
+
+
+class ConfigDiff:
+    def __init__(self, defaults=(), added=(), removed=(), changed=(), scan=False):
+        self.defaults = list(defaults)  # 变化的全局字段名
+        self.added = list(added)  # 打印机名称
+        self.removed = list(removed)
+        self.changed = list(changed)
+        self.scan = scan  # 扫描网段是否变化
+
+    def __bool__(self):
+        return bool(self.defaults or self.added or self.removed or self.changed or self.scan)
+
+    def __repr__(self):
+        return (f"ConfigDiff(defaults={self.defaults} +{len(self.added)} -{len(self.removed)}"
+                f" ~{len(self.changed)} scan={self.scan})")
+
+    def summary(self):
+        parts = []
+        if self.defaults:
+            parts.append(f"全局设置变化: {', '.join(self.defaults)}")
+        if self.added or self.removed or self.changed:
+            parts.append(f"打印机新增 {len(self.added)} 台，移除 {len(self.removed)} 台，"
+                         f"变化 {len(self.changed)} 台")
+        if self.scan:
+            parts.append("扫描网段已变化")
+        return "；".join(parts) or "无变化"
+
+
+def apply_tcp_config(tcp_printers, config, diff):
+    """按增量原地更新TCP打印机字典，扫描发现的打印机不受影响"""
+    for name in diff.removed:
+        tcp_printers.pop(name, None)
+    for name in diff.added + diff.changed:
+        printer = config.printers[name]
+        if 'host' in printer:
+            tcp_printers[name] = (printer['host'], printer['port'])
+        else:
+            tcp_printers.pop(name, None)
+
+
+class ConfigManager:
+    """path: 配置文件路径（文件不存在时视为空配置）；
+    on_change(diff): 热加载得到非空增量时在监视线程中调用。
+    """
+
+    def __init__(self, path, on_change=None, log=None):
+        self.path = path
+        self.on_change = on_change
+        self._log = log or (lambda message: None)
+        self._lock = threading.Lock()
+        self.config = StationConfig()
+        self._file_digest = None
+        self._section_digests = {}  # ('defaults',) / ('scan',) / ('printers', 名称) -> 内容摘要
+        self._watcher = None
+        self.parses = 0  # 实际解析文件的次数
+        self.sections_validated = 0  # 重新校验的节数
+
+    def load(self):
+        """读取配置文件并返回增量；内容未变时不解析，出错时抛出 ConfigError 并保留原配置"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        except OSError as e:
+            raise ConfigError(f"读取配置文件失败: {str(e)}")
+        with self._lock:
+            file_digest = hashlib.sha1(data).digest()
+            if file_digest == self._file_digest:
+                return ConfigDiff()
+            document = parse_config(data, self.path) if data.strip() else {}
+            self.parses += 1
+            unknown = set(document) - {'defaults', 'scan', 'printers'}
+            if unknown:
+                raise ConfigError(f"未知的配置节: {', '.join(sorted(unknown))}")
+            printers_section = document.get('printers') or {}
+            if not isinstance(printers_section, dict):
+                raise ConfigError("printers 必须是表")
+
+            sections = {('defaults',): document.get('defaults') or {},
+                        ('scan',): document.get('scan') or {}}
+            for name, section in printers_section.items():
+                sections[('printers', str(name))] = section
+            digests = {key: _digest(section) for key, section in sections.items()}
+            stale = {key for key, digest in digests.items()
+                     if digest != self._section_digests.get(key)}
+
+            # 只校验内容变化的节，未变化的节沿用上一次的结果
+            old = self.config
+            defaults = (_settings(sections[('defaults',)], "defaults")
+                        if ('defaults',) in stale else old.defaults)
+            scan_ranges = (_scan_ranges(sections[('scan',)])
+                           if ('scan',) in stale else old.scan_ranges)
+            printers = {}
+            for key, section in sections.items():
+                if key[0] == 'printers':
+                    printers[key[1]] = _printer(key[1], section) if key in stale else old.printers[key[1]]
+
+            diff = ConfigDiff(
+                defaults=[field for field in DEFAULT_SETTINGS
+                          if defaults.get(field) != old.defaults.get(field)],
+                added=[name for name in printers if name not in old.printers],
+                removed=[name for name in old.printers if name not in printers],
+                changed=[name for name in printers
+                         if name in old.printers and printers[name] != old.printers[name]],
+                scan=scan_ranges != old.scan_ranges)
+            self.config = StationConfig(defaults, printers, scan_ranges)
+            self._file_digest = file_digest
+            self._section_digests = digests
+            self.sections_validated += len(stale)
+            return diff
+
+    def reload(self):
+        """load() 的容错版本：出错时记录日志并返回 None"""
+        try:
+            return self.load()
+        except ConfigError as e:
+            self._log(f"{str(e)}，继续使用上一次的配置")
+            return None
+
+    def watch(self, interval=1.0):
+        """监视配置文件所在的文件夹，文件变化时重新加载并回调 on_change(diff)"""
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        target = os.path.normcase(os.path.abspath(self.path))
+
+        def changed(paths):
+            if not any(os.path.normcase(os.path.abspath(path)) == target for path in paths):
+                return
+            diff = self.reload()
+            if diff and self.on_change:
+                self.on_change(diff)
+
+        self._watcher = FolderWatcher(folder, changed, interval).start()
+        return self
+
+    def close(self):
+        if self._watcher:
+            self._watcher.stop()
@@ -0,0 +1,195 @@
+"""打印机发现与打印机清单缓存
+
+各枚举来源（EnumPrinters 的各个标志、wmic 备用方法）在后台线程池中并行查询，
+每个来源有独立的超时；超时的来源沿用上一次的结果，不阻塞其他来源。
+合并后的清单缓存 ttl 秒，每次刷新返回与上一次相比的增量（新增/移除/变化），
+界面只需按增量更新下拉框。
+"""
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+
+class PrinterSource:
+    """name: 来源名称；func(): 返回打印机字典列表（至少包含 'name'）；timeout: 超时秒数"""
+
+    def __init__(self, name, func, timeout=5.0):
+        self.name = name
+        self.func = func
+        self.timeout = timeout
+
+
+def win32_sources(timeout=5.0, network_timeout=15.0):
+    """EnumPrinters 的五个枚举标志各为一个来源；网络打印机枚举通常最慢，超时单独设置"""
+    import win32print
+
+    def enum(flag):
+        return [{'name': printer[2], 'description': printer[1], 'comment': printer[3]}
+                for printer in win32print.EnumPrinters(flag, None, 1)]
+
+    flags = [
+        ("local", win32print.PRINTER_ENUM_LOCAL),
+        ("connections", win32print.PRINTER_ENUM_CONNECTIONS),
+        ("network", win32print.PRINTER_ENUM_NETWORK),
+        ("shared", win32print.PRINTER_ENUM_SHARED),
+        ("name", win32print.PRINTER_ENUM_NAME),
+    ]
+    return [PrinterSource(name, lambda flag=flag: enum(flag),
+                          network_timeout if name == "network" else timeout)
+            for name, flag in flags]
+
+
+def wmic_source(timeout=10.0):
+    """备用方法：wmic printer get name"""
+
+    def run():
+        result = subprocess.run(['wmic', 'printer', 'get', 'name'], capture_output=True,
+                                text=True, encoding='gbk', timeout=timeout)
+        if result.returncode != 0:
+            raise Exception(f"wmic 返回码 {result.returncode}")
+        return [{'name': line.strip()} for line in result.stdout.strip().split('\n')[1:]
+                if line.strip()]
+
+    return PrinterSource("wmic", run, timeout)
+
+
+def default_printer_name():
+    try:
+        import win32print
+        return win32print.GetDefaultPrinter()
+    except Exception:
+        return None
+
+
+class InventoryDiff:
+    def __init__(self, added=(), removed=(), changed=()):
+        self.added = list(added)  # 打印机字典
+        self.removed = list(removed)  # 打印机名称
+        self.changed = list(changed)  # 打印机字典
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self):
+        return f"InventoryDiff(+{len(self.added)} -{len(self.removed)} ~{len(self.changed)})"
+
+
+class PrinterInventory:
+    """sources: 并行查询的来源；fallback: 全部来源都失败时使用的来源（如 wmic）；
+    ttl: 清单缓存有效期（秒）；name_filter(name): 返回 False 的打印机不进入清单。
+    """
+
+    def __init__(self, sources, fallback=None, ttl=60.0, name_filter=None, log=None):
+        self.sources = list(sources)
+        self.fallback = fallback
+        self.ttl = ttl
+        self.name_filter = name_filter or (lambda name: True)
+        self._log = log or (lambda message: None)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=len(self.sources) + 1,
+                                            thread_name_prefix="printer-discovery")
+        self._inflight = {}  # 来源名 -> 尚未结束的 Future（超时的查询不会重复发起）
+        self._source_results = {}  # 来源名 -> 上一次成功的结果
+        self._printers = {}  # 名称 -> 打印机字典，按来源顺序
+        self._refreshed_at = None
+        self._background = None
+
+    def printers(self):
+        with self._lock:
+            return list(self._printers.values())
+
+    def names(self):
+        with self._lock:
+            return list(self._printers)
+
+    def is_fresh(self):
+        with self._lock:
+            return (self._refreshed_at is not None
+                    and time.monotonic() - self._refreshed_at < self.ttl)
+
+    def _submit(self, source):
+        future = self._inflight.get(source.name)
+        if future is None or future.done():
+            future = self._executor.submit(source.func)
+            self._inflight[source.name] = future
+            # 超时后才完成的查询结果也保存下来，供下一次刷新沿用
+            future.add_done_callback(lambda done, name=source.name: self._store(name, done))
+        return future
+
+    def _store(self, name, future):
+        if not future.cancelled() and future.exception() is None:
+            with self._lock:
+                self._source_results[name] = future.result()
+
+    def _collect(self, sources):
+        """并行等待各来源，返回 来源名 -> 结果（失败且没有上一次结果的来源不在其中）"""
+        start = time.monotonic()
+        futures = [(source, self._submit(source)) for source in sources]
+        results = {}
+        for source, future in futures:
+            remaining = max(0.0, source.timeout - (time.monotonic() - start))
+            try:
+                results[source.name] = future.result(remaining)
+            except FutureTimeout:
+                with self._lock:
+                    cached = self._source_results.get(source.name)
+                self._log(f"获取打印机（{source.name}）超时"
+                          + ("，沿用上一次结果" if cached is not None else ""))
+                if cached is not None:
+                    results[source.name] = cached
+            except Exception as e:
+                self._log(f"获取打印机（{source.name}）失败: {str(e)}")
+        return results
+
+    def refresh(self, force=False):
+        """重新查询各来源并返回增量；清单仍在有效期内且未强制刷新时直接返回空增量"""
+        with self._refresh_lock:
+            if not force and self.is_fresh():
+                return InventoryDiff()
+            results = self._collect(self.sources)
+            if not results and self.fallback is not None:
+                self._log(f"所有来源均失败，使用备用方法（{self.fallback.name}）")
+                results = self._collect([self.fallback])
+
+            merged = {}
+            for source in self.sources + ([self.fallback] if self.fallback else []):
+                for info in results.get(source.name, ()):
+                    name = info['name']
+                    if name not in merged and self.name_filter(name):
+                        merged[name] = dict(info, source=source.name)
+
+            with self._lock:
+                previous = self._printers
+                diff = InventoryDiff(
+                    added=[info for name, info in merged.items() if name not in previous],
+                    removed=[name for name in previous if name not in merged],
+                    changed=[info for name, info in merged.items()
+                             if name in previous and previous[name] != info])
+                self._printers = merged
+                self._refreshed_at = time.monotonic()
+            return diff
+
+    def refresh_in_background(self, force=False, callback=None):
+        """在后台线程中刷新，完成后调用 callback(diff)；已有刷新在进行时直接返回 False"""
+        with self._lock:
+            if self._background is not None and self._background.is_alive():
+                return False
+
+            def run():
+                try:
+                    diff = self.refresh(force)
+                except Exception as e:
+                    self._log(f"刷新打印机列表失败: {str(e)}")
+                    return
+                if callback:
+                    callback(diff)
+
+            self._background = threading.Thread(target=run, daemon=True, name="printer-refresh")
+            self._background.start()
+        return True
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
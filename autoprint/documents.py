@@ -0,0 +1,227 @@
+"""测试文档文件夹、文档内容缓存与文件夹监视
+
+DocumentCache 以 (路径, mtime, 大小) 为键缓存文档内容（bytes），按字节预算做 LRU 淘汰；
+不使用 mmap：文件被截断时访问映射会使进程崩溃（SIGBUS），Windows 上映射还会阻止覆盖文档。
+超出预算的大文档由 streaming.document_source 按路径分块读取。
+FolderWatcher 监视文档文件夹，文件变化时使缓存失效并通知界面刷新列表，
+因此反复打印同一个文档不需要任何磁盘 I/O。
+"""
+import os
+import threading
+from collections import OrderedDict
+
+DOCUMENT_FOLDER = os.path.join(os.path.expanduser("~"), "PrintTestDocuments")
+DOCUMENT_EXTENSIONS = ('.pdf', '.txt', '.doc', '.docx', '.xps', '.tcp', '.usb',
+                       '.png', '.jpg', '.jpeg', '.bmp', '.pgm')
+
+
+def list_documents(folder=DOCUMENT_FOLDER):
+    """返回文件夹中所有支持的测试文档的完整路径"""
+    return [os.path.join(folder, file) for file in os.listdir(folder)
+            if file.lower().endswith(DOCUMENT_EXTENSIONS)]
+
+
+class _Entry:
+    __slots__ = ('key', 'data', 'size')
+
+    def __init__(self, key, data):
+        self.key = key
+        self.data = data
+        self.size = len(data)
+
+
+class DocumentCache:
+    """budget_bytes: 缓存内容的总字节上限
+
+    被 trust() 的文件夹由 FolderWatcher 负责失效，其中的文件命中缓存时不再 stat。
+    """
+
+    def __init__(self, budget_bytes=256 * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self._trusted = set()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # 规范化路径 -> _Entry
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def trust(self, folder):
+        with self._lock:
+            self._trusted.add(self._normalize(folder))
+
+    def untrust(self, folder):
+        with self._lock:
+            self._trusted.discard(self._normalize(folder))
+
+    def get(self, path):
+        """返回文档内容（bytes）"""
+        norm = self._normalize(path)
+        with self._lock:
+            entry = self._entries.get(norm)
+            if entry is not None and os.path.dirname(norm) in self._trusted:
+                self._entries.move_to_end(norm)
+                self.hits += 1
+                return entry.data
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(norm)
+            if entry is not None and entry.key == key:
+                self._entries.move_to_end(norm)
+                self.hits += 1
+                return entry.data
+            self.misses += 1
+        with open(path, 'rb') as f:
+            entry = _Entry(key, f.read())
+        with self._lock:
+            old = self._entries.pop(norm, None)
+            if old is not None:
+                self._release(old)
+            if entry.size <= self.budget_bytes:
+                self._entries[norm] = entry
+                self.used_bytes += entry.size
+                self._evict()
+        return entry.data
+
+    def _release(self, entry):
+        self.used_bytes -= entry.size
+
+    def _evict(self):
+        while self.used_bytes > self.budget_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._release(entry)
+
+    def invalidate(self, path=None):
+        """使单个文件（或全部）缓存失效"""
+        with self._lock:
+            if path is None:
+                entries = list(self._entries.values())
+                self._entries.clear()
+            else:
+                entry = self._entries.pop(self._normalize(path), None)
+                entries = [entry] if entry else []
+            for entry in entries:
+                self._release(entry)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.used_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+class FolderWatcher:
+    """监视文件夹中文件的增删改，callback(changed_paths) 在监视线程中调用
+
+    Windows 上使用目录变更通知唤醒，其他平台按 interval 秒扫描一次。
+    """
+
+    def __init__(self, folder, callback, interval=1.0):
+        self.folder = folder
+        self.callback = callback
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._snapshot = self._scan()
+        self._thread = None
+
+    def _scan(self):
+        snapshot = {}
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        st = entry.stat()
+                        snapshot[entry.path] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            pass
+        return snapshot
+
+    def _change_waiter(self):
+        try:
+            import win32con
+            import win32event
+            import win32file
+        except ImportError:
+            return lambda: self._stopped.wait(self.interval)
+        handle = win32file.FindFirstChangeNotification(
+            self.folder, False,
+            win32con.FILE_NOTIFY_CHANGE_FILE_NAME | win32con.FILE_NOTIFY_CHANGE_SIZE
+            | win32con.FILE_NOTIFY_CHANGE_LAST_WRITE)
+
+        def wait():
+            result = win32event.WaitForSingleObject(handle, int(self.interval * 1000))
+            if result == win32event.WAIT_OBJECT_0:
+                win32file.FindNextChangeNotification(handle)
+            return self._stopped.is_set()
+
+        return wait
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="folder-watch")
+        self._thread.start()
+        return self
+
+    def _run(self):
+        wait = self._change_waiter()
+        while not wait():
+            snapshot = self._scan()
+            if snapshot == self._snapshot:
+                continue
+            changed = {path for path in snapshot.keys() | self._snapshot.keys()
+                       if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            try:
+                self.callback(changed)
+            except Exception:
+                pass
+
+    def stop(self):
+        self._stopped.set()
+
+
+class DocumentLibrary:
+    """测试文档列表与内容缓存：列表只在文件夹变化或手动刷新时重新读取"""
+
+    def __init__(self, folder=DOCUMENT_FOLDER, cache=None, on_change=None):
+        self.folder = folder
+        self.cache = cache or document_cache
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._documents = None
+        self._watcher = None
+
+    def documents(self, rescan=False):
+        with self._lock:
+            if rescan or self._documents is None:
+                self._documents = sorted(list_documents(self.folder))
+            return list(self._documents)
+
+    def watch(self, interval=1.0):
+        self._watcher = FolderWatcher(self.folder, self._changed, interval).start()
+        self.cache.trust(self.folder)
+        return self
+
+    def _changed(self, changed_paths):
+        for path in changed_paths:
+            self.cache.invalidate(path)
+        with self._lock:
+            self._documents = None
+        if self.on_change:
+            self.on_change(changed_paths)
+
+    def close(self):
+        if self._watcher:
+            self._watcher.stop()
+            self.cache.untrust(self.folder)
+
+
+# 进程内共享的文档内容缓存
+document_cache = DocumentCache()
+
+
+def read_document(doc_path):
+    """读取文档内容（经过缓存）"""
+    return document_cache.get(doc_path)
@@ -0,0 +1,372 @@
+"""多打印机并发打印调度引擎
+
+每台打印机同一时刻只发送一个作业（其余作业在该打印机的优先级队列中排队），
+不同打印机之间通过有界线程池并发执行，吞吐量随打印机数量线性增长。
+失败的作业按失败类别指数退避重试（见 retry.py），用尽重试次数后进入死信列表；
+带 key 提交的作业是幂等的，内存占用不随运行时间增长。
+作业开始时在进程内的时间轮（见 timeouts.py）上登记截止时间，结束时取消，到期即按超时处理。
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from autoprint.retry import FAILURE_OTHER, FAILURE_TIMEOUT, RetryPolicy, classify_exception
+from autoprint.timeouts import TimerWheel
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+
+class PrinterState:
+    """单台打印机的作业状态与计数器"""
+
+    def __init__(self, name):
+        self.name = name
+        self.success = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.active_jobs = {}  # job_id -> job，已发送但尚未确认完成的作业
+        self.pending = []  # 堆：(优先级, 序号, job)，等待发送的作业
+        self.sending = False  # 是否有作业正在发送
+
+    def snapshot(self):
+        return {
+            'printer': self.name,
+            'success': self.success,
+            'failed': self.failed,
+            'timeouts': self.timeouts,
+            'retries': self.retries,
+            'active': len(self.active_jobs),
+            'pending': len(self.pending),
+        }
+
+
+class PrintEngine:
+    """通过有界线程池同时向多台打印机发送打印作业
+
+    send_func(job) 在工作线程中执行实际打印：抛出异常表示失败；
+    返回 True 表示发送即完成（如 ShellExecute 打印），
+    返回 False/None 表示作业已发送，需要稍后调用 complete_job 确认。
+    dead_letter_limit: 死信列表最多保留的条数；key_limit: 已结束作业的幂等键最多保留的个数。
+    timeout_policy: timeouts.TimeoutPolicy，为 None 时作业不限时；
+    timer_wheel: 共用的 timeouts.TimerWheel，不传时按需创建一个。
+    """
+
+    def __init__(self, send_func, max_workers=8, log=None, retry_policy=None,
+                 dead_letter_limit=1000, key_limit=10000, timeout_policy=None, timer_wheel=None):
+        self._send = send_func
+        self._log = log or (lambda message: None)
+        self._lock = threading.Lock()
+        self._printers = {}
+        self._jobs = {}  # job_id -> job（仅活动作业）
+        self._ids = itertools.count(1)
+        self._seq = itertools.count()
+        self._listeners = []
+        self._retry_listeners = []
+        self._submit_listeners = []
+        self.retry_policy = retry_policy or RetryPolicy()
+        self._retry_heap = []  # (重试时刻, 序号, job)
+        self._retry_cond = threading.Condition(self._lock)
+        self._retry_thread = None
+        self._stopped = False
+        self._keys = {}  # 幂等键 -> 未结束的作业
+        self._finished_keys = OrderedDict()  # 幂等键 -> 已结束的作业（有上限）
+        self.key_limit = key_limit
+        self._dead_letters = deque(maxlen=dead_letter_limit)
+        self.timeout_policy = timeout_policy
+        self._wheel = timer_wheel
+        self._owns_wheel = timer_wheel is None
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="print-worker")
+
+    def add_listener(self, callback):
+        """注册作业结束回调 callback(job)，在工作线程或确认线程中调用"""
+        self._listeners.append(callback)
+
+    def add_submit_listener(self, callback):
+        """注册作业提交回调 callback(job)，在作业进入发送队列之前调用"""
+        self._submit_listeners.append(callback)
+
+    def add_retry_listener(self, callback):
+        """注册作业重试回调 callback(job)：作业本次尝试失败、稍后将重新发送"""
+        self._retry_listeners.append(callback)
+
+    def _state(self, printer_name):
+        state = self._printers.get(printer_name)
+        if state is None:
+            state = self._printers[printer_name] = PrinterState(printer_name)
+        return state
+
+    def _new_job(self, printer_name, doc_path, copies, extra, priority=PRIORITY_NORMAL, key=None):
+        job = {
+            'id': next(self._ids),
+            'key': key,
+            'priority': priority,
+            'printer': printer_name,
+            'document': os.path.basename(doc_path),
+            'doc_path': doc_path,
+            'copies': copies,
+            'start_time': None,
+            'status': 'queued',
+            'attempts': 0,
+            # 各阶段时间戳（time.time()），用于统计延迟
+            'enqueue_ts': time.time(),
+            'start_ts': None,
+            'spooled_ts': None,
+            'end_ts': None,
+        }
+        job.update(extra)
+        return job
+
+    def submit(self, printer_name, doc_path, copies=1, priority=PRIORITY_NORMAL, key=None, **extra):
+        """提交一个打印作业，返回作业字典
+
+        priority 越小越先发送；key 为幂等键：同一 key 的作业未结束或刚结束时，
+        直接返回已有的作业而不重复打印。
+        """
+        with self._lock:
+            if key is not None:
+                existing = self._keys.get(key) or self._finished_keys.get(key)
+                if existing is not None:
+                    return existing
+            job = self._new_job(printer_name, doc_path, copies, extra, priority, key)
+            if key is not None:
+                self._keys[key] = job
+        for callback in self._submit_listeners:
+            try:
+                callback(job)
+            except Exception as e:
+                self._log(f"作业回调异常: {e}")
+        with self._lock:
+            self._enqueue(job)
+        return job
+
+    def _enqueue(self, job):
+        # 调用方持有 self._lock
+        state = self._state(job['printer'])
+        heapq.heappush(state.pending, (job['priority'], next(self._seq), job))
+        if not state.sending:
+            state.sending = True
+            self._executor.submit(self._drain, state)
+
+    def submit_all(self, printer_names, doc_path, copies=1, **extra):
+        """向多台打印机同时提交同一文档"""
+        return [self.submit(name, doc_path, copies, **extra) for name in printer_names]
+
+    def begin_job(self, printer_name, doc_path, copies=1, **extra):
+        """登记一个由外部后端（如 asyncio TCP 后端）执行的作业，结束时调用 complete_job"""
+        job = self._new_job(printer_name, doc_path, copies, extra)
+        job['start_time'] = datetime.now()
+        job['start_ts'] = job['enqueue_ts']
+        job['status'] = 'sent'
+        job['attempts'] = 1
+        job['external'] = True  # 由外部后端发送，引擎无法重试
+        with self._lock:
+            self._state(printer_name).active_jobs[job['id']] = job
+            self._jobs[job['id']] = job
+            self._arm_deadline(job)
+        return job
+
+    def _arm_deadline(self, job):
+        # 调用方持有 self._lock；在时间轮上登记本次尝试的截止时间
+        timeout = self.timeout_policy.timeout_for(job) if self.timeout_policy else None
+        if not timeout:
+            return
+        if self._wheel is None:
+            self._wheel = TimerWheel(log=self._log).start()
+        job['deadline'] = self._wheel.schedule(timeout, self._deadline_expired,
+                                               job['id'], job['attempts'])
+
+    def _deadline_expired(self, job_id, attempt):
+        # 在时间轮线程中调用
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            elapsed = time.time() - job['start_ts']
+        self.complete_job(job_id, False, f"已等待 {elapsed:.1f} 秒", timeout=True, attempt=attempt)
+
+    def _drain(self, state):
+        # 依次发送该打印机队列中的作业，队列为空时释放发送槽
+        while True:
+            with self._lock:
+                if not state.pending:
+                    state.sending = False
+                    return
+                job = heapq.heappop(state.pending)[2]
+                job['start_time'] = datetime.now()
+                job['start_ts'] = time.time()
+                job['spooled_ts'] = None
+                job['status'] = 'sending'
+                job['attempts'] += 1
+                attempt = job['attempts']
+                state.active_jobs[job['id']] = job
+                self._jobs[job['id']] = job
+                self._arm_deadline(job)
+            try:
+                confirmed = self._send(job)
+            except Exception as e:
+                self.complete_job(job['id'], False, str(e), failure=classify_exception(e), attempt=attempt)
+                continue
+            if job['spooled_ts'] is None:
+                job['spooled_ts'] = time.time()
+            if confirmed:
+                self.complete_job(job['id'], True, attempt=attempt)
+            else:
+                with self._lock:
+                    if job['status'] == 'sending':
+                        job['status'] = 'sent'
+
+    def complete_job(self, job_id, success, reason=None, timeout=False, failure=None, attempt=None):
+        """确认作业结束；重复确认会被忽略，返回是否生效
+
+        failure 为失败类别（retry.FAILURE_*），按重试策略决定重试还是进入死信列表。
+        attempt: 确认针对的尝试次数，作业已超时并重新发送时，上一次尝试迟到的确认被忽略。
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or (attempt is not None and job['attempts'] != attempt):
+                return False
+            del self._jobs[job_id]
+            handle = job.pop('deadline', None)
+            if handle is not None:
+                self._wheel.cancel(handle)
+            state = self._printers[job['printer']]
+            state.active_jobs.pop(job_id, None)
+            if success:
+                state.success += 1
+                job['status'] = 'done'
+                job.pop('error', None)
+            else:
+                failure = failure or (FAILURE_TIMEOUT if timeout else FAILURE_OTHER)
+                job['failure'] = failure
+                job['error'] = reason
+                delay = None
+                if not job.get('external') and not self._stopped:
+                    delay = self.retry_policy.next_delay(failure, job['attempts'])
+                if delay is not None:
+                    state.retries += 1
+                    job['status'] = 'retrying'
+                    job['retry_at'] = time.time() + delay
+                    self._schedule_retry(job, delay)
+                else:
+                    state.failed += 1
+                    if timeout:
+                        state.timeouts += 1
+                    job['status'] = 'timeout' if timeout else 'failed'
+                    self._dead_letters.append({
+                        'id': job['id'], 'key': job['key'], 'printer': job['printer'],
+                        'document': job['document'], 'failure': failure, 'reason': reason,
+                        'attempts': job['attempts'], 'ts': time.time(),
+                    })
+            if job['status'] != 'retrying':
+                job['end_time'] = datetime.now()
+                job['end_ts'] = time.time()
+                self._finish_key(job)
+        if job['status'] == 'retrying':
+            self._log(f"作业 #{job['id']} [{job['printer']}] 第{job['attempts']}次尝试失败（{failure}）:"
+                      f" {reason}，{delay:.1f} 秒后重试")
+            listeners = self._retry_listeners
+        else:
+            listeners = self._listeners
+        for callback in listeners:
+            try:
+                callback(job)
+            except Exception as e:
+                self._log(f"作业回调异常: {e}")
+        return True
+
+    def _finish_key(self, job):
+        # 调用方持有 self._lock
+        key = job['key']
+        if key is None:
+            return
+        self._keys.pop(key, None)
+        self._finished_keys[key] = job
+        if len(self._finished_keys) > self.key_limit:
+            self._finished_keys.popitem(last=False)
+
+    def _schedule_retry(self, job, delay):
+        # 调用方持有 self._lock
+        heapq.heappush(self._retry_heap, (time.monotonic() + delay, next(self._seq), job))
+        if self._retry_thread is None:
+            self._retry_thread = threading.Thread(target=self._retry_loop, daemon=True,
+                                                  name="print-retry")
+            self._retry_thread.start()
+        self._retry_cond.notify()
+
+    def _retry_loop(self):
+        with self._lock:
+            while not self._stopped:
+                if not self._retry_heap:
+                    self._retry_cond.wait()
+                    continue
+                due = self._retry_heap[0][0] - time.monotonic()
+                if due > 0:
+                    self._retry_cond.wait(due)
+                    continue
+                job = heapq.heappop(self._retry_heap)[2]
+                job['status'] = 'queued'
+                self._enqueue(job)
+
+    def dead_letters(self):
+        """用尽重试次数的作业（最近的在后），每条包含失败类别和原因"""
+        with self._lock:
+            return list(self._dead_letters)
+
+    def retrying_jobs(self):
+        with self._lock:
+            return [entry[2] for entry in self._retry_heap]
+
+    def get_job(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_jobs(self):
+        """所有已开始但未结束的作业"""
+        with self._lock:
+            return [job for job in self._jobs.values() if job['start_time'] is not None]
+
+    def printer_stats(self):
+        with self._lock:
+            return [state.snapshot() for state in self._printers.values()]
+
+    def totals(self):
+        """返回 (成功次数, 失败次数)"""
+        with self._lock:
+            success = sum(state.success for state in self._printers.values())
+            failed = sum(state.failed for state in self._printers.values())
+        return success, failed
+
+    def restore(self, counters, next_id=1):
+        """恢复各打印机的计数器（如从作业日志回放），新作业ID从 next_id 开始"""
+        with self._lock:
+            for printer_name, values in counters.items():
+                state = self._state(printer_name)
+                for field in ('success', 'failed', 'timeouts', 'retries'):
+                    setattr(state, field, values.get(field, 0))
+            self._ids = itertools.count(max(next_id, 1))
+
+    def reset_counters(self):
+        with self._lock:
+            for state in self._printers.values():
+                state.success = state.failed = state.timeouts = state.retries = 0
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            self._stopped = True
+            self._retry_heap.clear()
+            self._retry_cond.notify_all()
+            for state in self._printers.values():
+                state.pending.clear()
+        if self._wheel is not None and self._owns_wheel:
+            self._wheel.stop()
+        self._executor.shutdown(wait=wait)
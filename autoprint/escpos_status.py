@@ -0,0 +1,420 @@
+"""ESC/POS 打印机实时状态通道
+
+通过 DLE EOT n（实时状态，收到即回复，不经过打印缓冲区）和 GS r 1（按顺序处理，
+前面的打印数据全部处理完才回复）与打印机双向通信：
+    - TCP 作业发送完后紧跟 GS r 1，收到回复即为设备确认打印完成；
+    - 等待期间每 poll_interval 秒发送 DLE EOT 2/3/4，缺纸、开盖、切刀错误立即判为失败；
+    - 确认完成后再查询一次实时状态，记录作业结束时的设备状态。
+StatusPoller 用一个线程和一个 selector 服务所有打印机的状态通道，接口与 JobTracker 相同，
+可直接作为 TCP 后端的作业跟踪器；USB 打印机可通过虚拟串口（需要 pyserial）持续监视。
+"""
+import itertools
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+
+from autoprint.scanner import is_escpos_status
+
+DLE_EOT = b'\x10\x04'
+GS_R_PAPER = b'\x1Dr\x01'  # GS r 1：传送纸张传感器状态（处理完前面的数据后回复）
+STATUS_PRINTER = 1
+STATUS_OFFLINE = 2
+STATUS_ERROR = 3
+STATUS_PAPER = 4
+REALTIME_QUERIES = (STATUS_OFFLINE, STATUS_ERROR, STATUS_PAPER)
+REALTIME_QUERY = b''.join(DLE_EOT + bytes([n]) for n in REALTIME_QUERIES)
+
+
+def is_gs_r_reply(value):
+    """GS r 1 回复的固定位：bit4=0, bit7=0（DLE EOT 回复的 bit4 固定为 1）"""
+    return value & 0x90 == 0
+
+
+class DeviceStatus:
+    def __init__(self):
+        self.offline = False
+        self.cover_open = False
+        self.paper_out = False
+        self.paper_near_end = False
+        self.cutter_error = False
+        self.unrecoverable = False
+        self.recoverable_error = False
+        self.error = False
+        self.no_response = False
+        self.updated = None
+
+    def update(self, n, value):
+        """按 DLE EOT n 的回复字节更新状态"""
+        if n == STATUS_PRINTER:
+            self.offline = bool(value & 0x08)
+        elif n == STATUS_OFFLINE:
+            self.cover_open = bool(value & 0x04)
+            self.error = bool(value & 0x40)
+        elif n == STATUS_ERROR:
+            self.cutter_error = bool(value & 0x08)
+            self.unrecoverable = bool(value & 0x20)
+            self.recoverable_error = bool(value & 0x40)
+        elif n == STATUS_PAPER:
+            self.paper_near_end = bool(value & 0x0C)
+            self.paper_out = bool(value & 0x60)
+        self.no_response = False
+        self.updated = time.time()
+
+    def update_paper(self, value):
+        """按 GS r 1 的回复字节更新纸张状态"""
+        self.paper_near_end = bool(value & 0x03)
+        self.paper_out = bool(value & 0x0C)
+        self.updated = time.time()
+
+    def problems(self):
+        problems = [text for flag, text in (
+            (self.no_response, "设备无响应"),
+            (self.offline, "脱机"),
+            (self.cover_open, "纸仓盖打开"),
+            (self.paper_out, "缺纸"),
+            (self.cutter_error, "切刀错误"),
+            (self.unrecoverable, "不可恢复错误"),
+            (self.recoverable_error, "可自动恢复错误"),
+        ) if flag]
+        if self.error and not problems:
+            problems.append("打印机错误")
+        return problems
+
+    def warnings(self):
+        return ["纸将用尽"] if self.paper_near_end and not self.paper_out else []
+
+    @property
+    def ok(self):
+        return not self.problems()
+
+    def text(self):
+        return "、".join(self.problems() + self.warnings()) or "正常"
+
+    def copy(self):
+        status = DeviceStatus()
+        status.__dict__.update(self.__dict__)
+        return status
+
+
+class SocketChannel:
+    """TCP 状态通道；on_close(reuse) 在通道结束时调用（如把连接归还连接池）"""
+
+    def __init__(self, sock, on_close=None):
+        self.sock = sock
+        self._on_close = on_close
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def setup(self):
+        self.sock.setblocking(False)
+
+    def send(self, data):
+        self.sock.settimeout(1.0)
+        try:
+            self.sock.sendall(data)
+        finally:
+            self.sock.setblocking(False)
+
+    def read(self):
+        """返回已到达的字节；对端关闭时返回 None"""
+        try:
+            data = self.sock.recv(256)
+        except (BlockingIOError, InterruptedError):
+            return b''
+        return data or None
+
+    def close(self, reuse=False):
+        if self._on_close:
+            self._on_close(reuse)
+        else:
+            self.sock.close()
+
+
+class SerialChannel:
+    """USB 打印机的虚拟串口状态通道（需要 pyserial），不能注册到 selector，每个周期读一次"""
+
+    def __init__(self, port, baudrate=9600):
+        try:
+            import serial
+        except ImportError:
+            raise Exception("USB状态通道需要安装 pyserial")
+        self.port = port
+        self._serial = serial.Serial(port, baudrate, timeout=0, write_timeout=1)
+
+    def fileno(self):
+        return None
+
+    def setup(self):
+        pass
+
+    def send(self, data):
+        self._serial.write(data)
+
+    def read(self):
+        return self._serial.read(256)
+
+    def close(self, reuse=False):
+        self._serial.close()
+
+
+class _Watch:
+    """一个状态通道上的一次作业确认（confirm=True）或持续监视"""
+
+    def __init__(self, token, printer_name, channel, confirm, deadline, job=None):
+        self.token = token
+        self.printer = printer_name
+        self.channel = channel
+        self.confirm = confirm
+        self.deadline = deadline
+        self.job = job
+        self.status = DeviceStatus()
+        self.pending = deque()  # 已发送、尚未收到回复的 DLE EOT n
+        self.sent_at = None
+        self.next_poll = 0.0
+        self.started = time.monotonic()
+        self.confirmed_at = None
+        self.last_text = "正常"  # 作业期间只在状态变化时回调 on_status
+        self.on_done = None
+        self.on_status = None
+        self.untracked = False
+        self.result = None
+
+
+class StatusPoller:
+    """poll_interval: 等待确认期间实时状态的查询间隔（秒）；
+    monitor_interval: 持续监视的查询间隔；confirm_timeout: 等待设备确认的最长时间；
+    reply_timeout: 实时状态查询超过该时间没有回复视为设备无响应。
+    """
+
+    def __init__(self, poll_interval=0.05, monitor_interval=1.0, confirm_timeout=120.0,
+                 reply_timeout=2.0, log=None):
+        self.poll_interval = poll_interval
+        self.monitor_interval = monitor_interval
+        self.confirm_timeout = confirm_timeout
+        self.reply_timeout = reply_timeout
+        self._log = log or (lambda message: None)
+        self._lock = threading.Lock()
+        self._tokens = itertools.count(1)
+        self._watches = {}  # token -> _Watch
+        self._new = deque()
+        self._early = {}  # token -> 登记回调之前就已得到的确认结果
+        self._statuses = {}  # 打印机名 -> 最近一次的 DeviceStatus
+        self._listeners = []
+        self.queue_depth = {}  # 打印机名 -> 等待设备确认的作业数（与 JobTracker 一致，供指标导出）
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add_listener(self, callback):
+        """注册设备状态变化回调 callback(printer_name, status)，在轮询线程中调用"""
+        self._listeners.append(callback)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="escpos-status")
+                self._thread.start()
+        return self
+
+    def _add(self, watch):
+        with self._lock:
+            self._watches[watch.token] = watch
+            self._new.append(watch)
+            if watch.confirm:
+                self.queue_depth[watch.printer] = self.queue_depth.get(watch.printer, 0) + 1
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            pass
+        return watch.token
+
+    def begin(self, printer_name, channel, job=None):
+        """登记一次作业确认：调用方已在 channel 上发送了作业数据和 GS r 1，返回跟踪用的 token"""
+        return self._add(_Watch(next(self._tokens), printer_name, channel, True,
+                                time.monotonic() + self.confirm_timeout, job))
+
+    def monitor(self, printer_name, channel):
+        """持续监视一台打印机（如 USB 串口），状态变化时通知监听器"""
+        return self._add(_Watch(next(self._tokens), printer_name, channel, False, None))
+
+    def status(self, printer_name):
+        with self._lock:
+            status = self._statuses.get(printer_name)
+            return status.copy() if status is not None else None
+
+    def device_statuses(self):
+        with self._lock:
+            return {name: status.copy() for name, status in self._statuses.items()}
+
+    # ---- JobTracker 接口 ----
+
+    def track(self, printer_name, token, on_done, on_status=None):
+        with self._lock:
+            watch = self._watches.get(token)
+            if watch is not None:
+                watch.on_done = on_done
+                watch.on_status = on_status
+                return
+            # 设备在登记回调之前就已回复
+            result = self._early.pop(token, None)
+        if result is not None:
+            on_done(*result)
+
+    def untrack(self, printer_name, token):
+        with self._lock:
+            watch = self._watches.get(token)
+            if watch is not None:
+                watch.on_done = watch.on_status = None
+                watch.untracked = True
+            self._early.pop(token, None)
+
+    def outstanding(self):
+        with self._lock:
+            return sum(1 for watch in self._watches.values() if watch.confirm)
+
+    # ---- 轮询线程 ----
+
+    def _run(self):
+        serial_watches = []
+        while not self._stopped.is_set():
+            with self._lock:
+                new, self._new = list(self._new), deque()
+            for watch in new:
+                try:
+                    watch.channel.setup()
+                    if watch.channel.fileno() is None:
+                        serial_watches.append(watch)
+                    else:
+                        self._selector.register(watch.channel, selectors.EVENT_READ, watch)
+                except Exception as e:
+                    self._finish(watch, False, f"状态通道不可用: {str(e)}")
+            timeout = self.poll_interval if self._watches else None
+            for key, _ in self._selector.select(timeout):
+                if key.data is None:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except OSError:
+                        pass
+                else:
+                    self._read(key.data)
+            for watch in serial_watches:
+                self._read(watch)
+            now = time.monotonic()
+            with self._lock:
+                watches = list(self._watches.values())
+            for watch in watches:
+                if watch.result is None:
+                    self._tick(watch, now)
+            serial_watches = [watch for watch in serial_watches if watch.result is None]
+        for watch in list(self._watches.values()):
+            self._finish(watch, False, "状态轮询已停止")
+        self._selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def _read(self, watch):
+        try:
+            data = watch.channel.read()
+        except Exception as e:
+            data = None
+            self._log(f"读取打印机状态失败: {watch.printer}: {str(e)}")
+        if data is None:
+            self._finish(watch, False, "状态通道已断开")
+            return
+        for value in data:
+            if is_escpos_status(value) and watch.pending:
+                watch.status.update(watch.pending.popleft(), value)
+            elif watch.confirm and watch.confirmed_at is None and is_gs_r_reply(value):
+                # 前面的打印数据已全部处理完，立即再查询一次实时状态
+                watch.confirmed_at = time.monotonic()
+                watch.status.update_paper(value)
+                watch.next_poll = 0.0
+        if data:
+            self._status_changed(watch)
+
+    def _status_changed(self, watch):
+        text = watch.status.text()
+        with self._lock:
+            previous = self._statuses.get(watch.printer)
+            self._statuses[watch.printer] = watch.status.copy()
+            on_status = watch.on_status
+        if text != watch.last_text and on_status:
+            on_status(watch.token, f"设备状态: {text}")
+        watch.last_text = text
+        if previous is not None and previous.text() == text:
+            return
+        for callback in self._listeners:
+            try:
+                callback(watch.printer, watch.status.copy())
+            except Exception as e:
+                self._log(f"设备状态回调异常: {e}")
+
+    def _tick(self, watch, now):
+        if watch.pending and now - watch.sent_at > self.reply_timeout:
+            watch.pending.clear()
+            watch.status.no_response = True
+            self._status_changed(watch)
+        if watch.confirm:
+            problems = watch.status.problems()
+            if problems:
+                self._finish(watch, False, "、".join(problems))
+                return
+            if watch.confirmed_at is not None and not watch.pending and watch.next_poll:
+                self._finish(watch, True, "设备确认打印完成")
+                return
+            if now > watch.deadline:
+                self._finish(watch, False, f"等待设备确认超时（{self.confirm_timeout:g} 秒）")
+                return
+        if watch.pending or now < watch.next_poll:
+            return
+        try:
+            watch.channel.send(REALTIME_QUERY)
+        except Exception as e:
+            self._finish(watch, False, f"查询打印机状态失败: {str(e)}")
+            return
+        watch.pending.extend(REALTIME_QUERIES)
+        watch.sent_at = now
+        watch.next_poll = now + (self.poll_interval if watch.confirm else self.monitor_interval)
+
+    def _finish(self, watch, success, reason):
+        try:
+            if watch.channel.fileno() is not None:
+                self._selector.unregister(watch.channel)
+        except (KeyError, ValueError, OSError):
+            pass
+        # 还有未回复的查询时连接中残留数据，不再复用
+        watch.channel.close(reuse=success and not watch.pending)
+        if watch.job is not None:
+            watch.job['device_status'] = watch.status.text()
+            if watch.confirmed_at is not None:
+                watch.job['device_confirm_latency'] = watch.confirmed_at - watch.started
+        with self._lock:
+            watch.result = (success, reason)
+            self._watches.pop(watch.token, None)
+            on_done = watch.on_done
+            if watch.confirm:
+                self.queue_depth[watch.printer] -= 1
+                if on_done is None and not watch.untracked:
+                    self._early[watch.token] = watch.result
+            else:
+                self._statuses.pop(watch.printer, None)
+        if on_done:
+            try:
+                on_done(success, reason)
+            except Exception as e:
+                self._log(f"作业跟踪回调异常: {e}")
+
+    def stop(self):
+        self._stopped.set()
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            pass
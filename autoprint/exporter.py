@@ -0,0 +1,178 @@
+"""Prometheus/OpenMetrics 指标导出
+
+作业结束时只做几次整数加法（直方图桶用二分查找定位），
+文本格式在每次抓取时才生成，长时间高频测试中也可以一直开启。
+计数器独立于 PrintEngine，界面上重置计数不会让 Prometheus 计数器回退。
+"""
+import bisect
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_TCP_COUNTERS = ('connects', 'reuses', 'reconnects', 'stale_closed', 'errors', 'jobs',
+                 'copies', 'bytes')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsExporter:
+    """engine: PrintEngine；backends: BackendManager（提供打印队列长度）；
+    tcp_pool: TcpConnectionPool（提供连接统计）。"""
+
+    def __init__(self, engine, backends=None, tcp_pool=None, buckets=DEFAULT_BUCKETS):
+        self.engine = engine
+        self.backends = backends
+        self.tcp_pool = tcp_pool
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._outcomes = defaultdict(int)  # (打印机, 结果) -> 次数
+        self._bucket_counts = defaultdict(lambda: [0] * (len(self.buckets) + 1))
+        self._latency_sum = defaultdict(float)
+        self._confirm_counts = defaultdict(lambda: [0] * (len(self.buckets) + 1))
+        self._confirm_sum = defaultdict(float)
+        self._bytes = defaultdict(int)
+        self._retries = defaultdict(lambda: defaultdict(int))  # 打印机 -> 失败类别 -> 次数
+        self._server = None
+        engine.add_listener(self.observe)
+        engine.add_retry_listener(self.observe_retry)
+
+    def observe(self, job):
+        printer = job['printer']
+        latency = None
+        if job['status'] == 'done' and job.get('end_ts') and job.get('enqueue_ts'):
+            latency = job['end_ts'] - job['enqueue_ts']
+        with self._lock:
+            self._outcomes[(printer, job['status'])] += 1
+            self._bytes[printer] += job.get('bytes') or 0
+            if latency is not None:
+                self._bucket_counts[printer][bisect.bisect_left(self.buckets, latency)] += 1
+                self._latency_sum[printer] += latency
+            confirm = job.get('device_confirm_latency')
+            if confirm is not None:
+                self._confirm_counts[printer][bisect.bisect_left(self.buckets, confirm)] += 1
+                self._confirm_sum[printer] += confirm
+
+    def observe_retry(self, job):
+        with self._lock:
+            self._retries[job['printer']][job.get('failure')] += 1
+
+    def render(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels)
+                label_text = "{" + label_text + "}" if label_text else ""
+                lines.append(f"{name}{suffix}{label_text} {_format_value(value)}")
+
+        with self._lock:
+            outcomes = dict(self._outcomes)
+            bucket_counts = {printer: list(counts) for printer, counts in self._bucket_counts.items()}
+            latency_sum = dict(self._latency_sum)
+            confirm_counts = {printer: list(counts) for printer, counts in self._confirm_counts.items()}
+            confirm_sum = dict(self._confirm_sum)
+            sent_bytes = dict(self._bytes)
+            retries = [(printer, failure, count) for printer, counts in self._retries.items()
+                       for failure, count in counts.items()]
+
+        metric("autoprinter_jobs_total", "counter", "结束的打印作业数（按结果）",
+               [("", (("printer", printer), ("outcome", outcome)), count)
+                for (printer, outcome), count in sorted(outcomes.items())])
+        metric("autoprinter_job_retries_total", "counter", "失败后重试的次数（按失败类别）",
+               [("", (("printer", printer), ("failure", failure)), count)
+                for printer, failure, count in sorted(retries)])
+        metric("autoprinter_sent_bytes_total", "counter", "发送到打印机的字节数",
+               [("", (("printer", printer),), count) for printer, count in sorted(sent_bytes.items())])
+
+        def histogram(counts_by_printer, sums):
+            samples = []
+            for printer, counts in sorted(counts_by_printer.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    samples.append(("_bucket", (("printer", printer), ("le", _format_value(bound))),
+                                    cumulative))
+                samples.append(("_sum", (("printer", printer),), sums.get(printer, 0.0)))
+                samples.append(("_count", (("printer", printer),), cumulative))
+            return samples
+
+        metric("autoprinter_job_latency_seconds", "histogram", "成功作业从入队到完成的延迟",
+               histogram(bucket_counts, latency_sum))
+        metric("autoprinter_device_confirm_seconds", "histogram",
+               "TCP作业发送完毕到设备确认打印完成（GS r 1 回复）的延迟",
+               histogram(confirm_counts, confirm_sum))
+
+        states = self.engine.printer_stats()
+        metric("autoprinter_active_jobs", "gauge", "已发送但尚未确认完成的作业数",
+               [("", (("printer", state['printer']),), state['active']) for state in states])
+        metric("autoprinter_pending_jobs", "gauge", "等待发送的作业数",
+               [("", (("printer", state['printer']),), state['pending']) for state in states])
+
+        if self.backends is not None:
+            depth = {}
+            for tracker in self.backends.trackers():
+                depth.update(tracker.queue_depth)
+            metric("autoprinter_spooler_queue_depth", "gauge", "最近一次检查时打印队列中的作业数",
+                   [("", (("printer", printer),), count) for printer, count in sorted(depth.items())])
+            problems = []
+            for tracker in self.backends.trackers():
+                if hasattr(tracker, 'device_statuses'):
+                    for printer, status in sorted(tracker.device_statuses().items()):
+                        problems.extend((printer, problem) for problem in status.problems())
+            metric("autoprinter_device_problem", "gauge", "设备最近一次上报的故障（缺纸、开盖、切刀错误等）",
+                   [("", (("printer", printer), ("problem", problem)), 1)
+                    for printer, problem in problems])
+
+        if self.tcp_pool is not None:
+            stats = self.tcp_pool.snapshot()
+            for key in _TCP_COUNTERS:
+                metric(f"autoprinter_tcp_pool_{key}_total", "counter", f"TCP连接池 {key} 计数",
+                       [("", (), stats.get(key, 0))])
+            metric("autoprinter_tcp_pool_idle_connections", "gauge", "TCP连接池中的空闲连接数",
+                   [("", (), stats.get('idle', 0))])
+
+        lines.append("")
+        return "\n".join(lines)
+
+    def start(self, host="0.0.0.0", port=9464):
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True,
+                                  name="metrics-http")
+        thread.start()
+        return self._server.server_address
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,140 @@
+"""用于压测和调试的本地假打印机"""
+import asyncio
+import socket
+import socketserver
+import threading
+import time
+
+
+class _SinkHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        with server.stats_lock:
+            server.connections += 1
+        while True:
+            try:
+                data = self.request.recv(65536)
+            except OSError:
+                break
+            if not data:
+                break
+            with server.stats_lock:
+                server.bytes_received += len(data)
+
+
+class _ThreadingSinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class SinkServer:
+    """模拟 JetDirect/9100 打印机：接收并丢弃所有数据，只统计连接数和字节数"""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self._server = _ThreadingSinkServer((host, port), _SinkHandler)
+        self._server.stats_lock = threading.Lock()
+        self._server.connections = 0
+        self._server.bytes_received = 0
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address[:2]
+
+    @property
+    def connections(self):
+        return self._server.connections
+
+    @property
+    def bytes_received(self):
+        return self._server.bytes_received
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class AsyncSinkFarm:
+    """在一个后台事件循环中启动 count 台假 9100 打印机，用于模拟大规模打印机群"""
+
+    def __init__(self, count, host="127.0.0.1"):
+        self.count = count
+        self.host = host
+        self.addresses = []
+        self.connections = 0
+        self.bytes_received = 0
+        self._loop = None
+        self._servers = []
+        self._thread = None
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                self.bytes_received += len(data)
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+    async def _start_servers(self):
+        for _ in range(self.count):
+            server = await asyncio.start_server(self._handle, self.host, 0, backlog=256)
+            self._servers.append(server)
+            self.addresses.append(server.sockets[0].getsockname()[:2])
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start_servers(), self._loop).result()
+        return self
+
+    def stop(self):
+        async def close_all():
+            for server in self._servers:
+                server.close()
+
+        asyncio.run_coroutine_threadsafe(close_all(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def endpoints(self, prefix="FakeTCP"):
+        """返回可直接作为 tcp_printers 使用的字典"""
+        return {f"{prefix}{i:04d}": address for i, address in enumerate(self.addresses)}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def wait_for_bytes(server, expected, timeout=10.0):
+    """等待假打印机收齐 expected 字节（发送端 sendall 返回不代表对端已读完）"""
+    deadline = time.monotonic() + timeout
+    while server.bytes_received < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return server.bytes_received >= expected
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
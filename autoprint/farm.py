@@ -0,0 +1,469 @@
+"""多主机打印农场：一个协调器驱动多台主机上的打印代理
+
+打印代理（autoprinter agent）运行在每组打印机旁，用本机的打印引擎和后端执行作业；
+协调器（autoprinter coordinate）按计划生成作业并分派给负责该打印机的代理，汇总各代理
+回报的结果。每台打印机同一时刻只归一个代理负责；代理失联时，协调器把它负责的打印机
+转给其他也能访问这些打印机的代理，并把已分派但未回报结果的作业转过去重新打印（至少一次）。
+
+RPC（帧协议见 rpc.py）:
+    {"op": "hello"} -> {"agent": 名称, "instance": 启动标识, "printers": [...]}
+    {"op": "put", "hash": sha256, "ext": 扩展名} + 文档内容
+    {"op": "submit", "jobs": [{"key", "printer", "document", "hash", "ext", "copies", "options"}]}
+        -> {"missing": [摘要...], "rejected": [{"key", "error"}]}（缺少文档的作业上传后重发）
+    {"op": "poll", "after": 序号} -> {"events": [{"seq", "key", "status", "error", "latency"}, ...]}
+作业按协调器生成的 key 在代理的引擎中幂等提交，连接中断后重发 submit 不会重复打印。
+hash 必须是 64 位十六进制的 sha256，options 只接受 JOB_OPTIONS 中的字段，其余作业会被拒绝：
+代理不做身份验证，不能让对端借此打印代理主机上的任意文件。
+"""
+import hashlib
+import itertools
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+
+from autoprint.engine import PrintEngine
+from autoprint.rpc import RpcClient, RpcError, RpcServer
+
+FARM_PORT = 9300
+POLL_LIMIT = 5000  # 每次 poll 最多返回的事件数
+JOB_OPTIONS = ('copy_mode', 'cut', 'confirm', 'timeout', 'priority', 'backend')  # 协调器可以指定的作业参数
+_HASH = re.compile(r'[0-9a-f]{64}')
+
+
+def _document_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FarmAgent:
+    """打印代理：printers 为本机可访问的打印机名列表，作业交给 backends（BackendManager）发送
+
+    backend_for(printer_name, doc_path) 返回作业使用的后端名；
+    文档按内容摘要保存在 documents_dir 中，同一文档只需上传一次。
+    """
+
+    def __init__(self, printers, backends, backend_for, documents_dir=None, name=None,
+                 host="127.0.0.1", port=FARM_PORT, max_workers=16, retry_policy=None,
+                 timeout_policy=None, event_limit=100000, log=None):
+        self.printers = list(printers)
+        self.backends = backends
+        self.backend_for = backend_for
+        self.documents_dir = documents_dir or tempfile.mkdtemp(prefix="autoprint-agent-")
+        os.makedirs(self.documents_dir, exist_ok=True)
+        self._log = log or (lambda message: None)
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=event_limit)  # 已结束作业的事件，序号连续递增
+        self._seq = itertools.count(1)
+        self.instance = uuid.uuid4().hex  # 代理重启后协调器据此重发未回报的作业
+        self.engine = PrintEngine(self._send, max_workers=max_workers, log=log,
+                                  retry_policy=retry_policy, timeout_policy=timeout_policy)
+        self.engine.add_listener(self._on_finished)
+        self.engine.add_retry_listener(backends.untrack)
+        self._server = RpcServer(self.handle, host, port, log=log)
+        self.name = name or f"{self.address[0]}:{self.address[1]}"
+
+    @property
+    def address(self):
+        return self._server.address
+
+    def _send(self, job):
+        self._log(f"开始打印: {job['document']} 到 {job['printer']}（份数: {job['copies']}）")
+        return self.backends.run_job(job, self.engine.complete_job)
+
+    def _on_finished(self, job):
+        self.backends.untrack(job)
+        with self._lock:
+            self._events.append({
+                'seq': next(self._seq), 'key': job['key'], 'printer': job['printer'],
+                'status': job['status'], 'error': job.get('error'), 'attempts': job['attempts'],
+                'latency': job['end_ts'] - job['enqueue_ts']})
+
+    def document_path(self, digest, ext):
+        return os.path.join(self.documents_dir, f"{digest}{ext}")
+
+    def handle(self, header, payload):
+        op = header.get('op')
+        if op == 'hello':
+            return {'ok': True, 'agent': self.name, 'instance': self.instance,
+                    'printers': self.printers}
+        if op == 'put':
+            return self._put(header['hash'], header.get('ext', ''), payload)
+        if op == 'submit':
+            return self._submit(header['jobs'])
+        if op == 'poll':
+            return self._poll(header.get('after', 0))
+        return {'ok': False, 'error': f"未知的操作: {op}"}
+
+    def _put(self, digest, ext, data):
+        if hashlib.sha256(data).hexdigest() != digest:
+            return {'ok': False, 'error': "文档内容与摘要不一致"}
+        path = self.document_path(digest, os.path.basename(ext))
+        if not os.path.exists(path):
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        return {'ok': True}
+
+    def _submit(self, jobs):
+        missing = set()
+        rejected = []
+        for spec in jobs:
+            if spec['printer'] not in self.printers:
+                rejected.append({'key': spec['key'], 'error': f"代理 {self.name} 没有打印机 {spec['printer']}"})
+                continue
+            if not isinstance(spec.get('hash'), str) or not _HASH.fullmatch(spec['hash']):
+                rejected.append({'key': spec['key'], 'error': f"文档摘要格式错误: {spec.get('hash')!r}"})
+                continue
+            options = dict(spec.get('options') or {})
+            unknown = sorted(set(options) - set(JOB_OPTIONS))
+            if unknown:
+                rejected.append({'key': spec['key'], 'error': f"不支持的作业参数: {', '.join(unknown)}"})
+                continue
+            doc_path = self.document_path(spec['hash'], os.path.basename(spec.get('ext', '')))
+            if not os.path.exists(doc_path):
+                missing.add(spec['hash'])
+                continue
+            backend = options.pop('backend', None) or self.backend_for(spec['printer'], doc_path)
+            if spec.get('document'):
+                options['document'] = spec['document']  # 日志中显示原始文件名而不是摘要
+            self.engine.submit(spec['printer'], doc_path, spec.get('copies', 1), key=spec['key'],
+                               backend=backend, **options)
+        return {'ok': True, 'missing': sorted(missing), 'rejected': rejected}
+
+    def _poll(self, after):
+        with self._lock:
+            if not self._events:
+                return {'ok': True, 'events': []}
+            # 事件序号连续，直接按偏移定位
+            first = self._events[0]['seq']
+            start = max(0, after + 1 - first)
+            events = list(itertools.islice(self._events, start, start + POLL_LIMIT))
+        return {'ok': True, 'events': events}
+
+    def start(self):
+        self._server.start("farm-agent")
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.stop()
+        self.engine.shutdown()
+        self.backends.close()
+
+
+class _AgentLink:
+    """协调器到一个代理的连接及其作业"""
+
+    def __init__(self, host, port, compress_level):
+        self.endpoint = (host, port)
+        self.name = f"{host}:{port}"
+        self.client = RpcClient(host, port, compress_level, timeout=10)
+        self.instance = None
+        self.printers = set()  # 代理能访问的打印机
+        self.alive = False
+        self.probed = threading.Event()  # 已尝试过第一次连接
+        self.failing_since = None
+        self.outbox = deque()  # 等待发送的作业
+        self.inflight = {}  # key -> 已发送、未回报结果的作业
+        self.documents = set()  # 代理已有的文档摘要
+        self.seq = 0  # 已处理到的事件序号
+        self.wake = threading.Event()
+        self.submitted = 0
+        self.completed = 0
+
+
+class FarmCoordinator:
+    """agents: 代理地址 (host, port) 列表
+
+    heartbeat: 轮询各代理的间隔（秒）；failure_after: 连续失败多久判定代理失联；
+    batch: 每次 submit 最多携带的作业数。
+    """
+
+    def __init__(self, agents, heartbeat=0.5, failure_after=3.0, batch=500, compress_level=6, log=None):
+        self.heartbeat = heartbeat
+        self.failure_after = failure_after
+        self.batch = batch
+        self._log = log or (lambda message: None)
+        self._lock = threading.Lock()
+        self._links = [_AgentLink(host, port, compress_level) for host, port in agents]
+        self._owners = {}  # 打印机 -> 负责的 _AgentLink
+        self._orphans = []  # 没有在线代理可以打印的作业
+        self._jobs = {}  # key -> 未结束的作业
+        self._documents = {}  # 路径 -> (mtime, size, 摘要)
+        self._printers = {}  # 打印机 -> 计数器
+        self._listeners = []
+        self._ids = itertools.count(1)
+        self._prefix = uuid.uuid4().hex[:12]
+        self._assigning = False
+        self._stopped = False
+
+    def add_listener(self, callback):
+        """注册作业结束回调 callback(job)，在代理的轮询线程中调用"""
+        self._listeners.append(callback)
+
+    def start(self):
+        for link in self._links:
+            threading.Thread(target=self._run_link, args=(link,), daemon=True,
+                             name=f"farm-link-{link.name}").start()
+        for link in self._links:
+            link.probed.wait(self.failure_after)
+        # 第一次连接都结束后再分配打印机，能访问同一打印机的代理平均分担
+        with self._lock:
+            self._assigning = True
+            self._assign()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        for link in self._links:
+            link.wake.set()
+            link.client.close()
+
+    # 打印机分配（调用方持有 self._lock）
+
+    def _assign(self):
+        load = {link: 0 for link in self._links}
+        for owner in self._owners.values():
+            load[owner] += 1
+        printers = sorted(set().union(*(link.printers for link in self._links if link.alive)))
+        for printer_name in printers:
+            owner = self._owners.get(printer_name)
+            if owner is not None and owner.alive:
+                continue
+            candidates = [link for link in self._links if link.alive and printer_name in link.printers]
+            owner = min(candidates, key=lambda link: load[link])
+            self._owners[printer_name] = owner
+            load[owner] += 1
+        orphans, self._orphans = self._orphans, []
+        for job in orphans:
+            self._route(job)
+
+    def _route(self, job):
+        owner = self._owners.get(job['printer'])
+        if owner is None or not owner.alive:
+            job['agent'] = None
+            self._orphans.append(job)
+            return
+        job['agent'] = owner.name
+        owner.outbox.append(job)
+        owner.wake.set()
+
+    def _agent_up(self, link, reply):
+        with self._lock:
+            if reply['instance'] != link.instance:
+                # 代理（重新）启动：它没有之前的文档和作业
+                link.instance = reply['instance']
+                link.seq = 0
+                link.documents.clear()
+            # 连接中断前的 submit 不一定送达，未回报的作业重发一次（代理按 key 去重）
+            link.outbox.extendleft(reversed(list(link.inflight.values())))
+            link.inflight.clear()
+            link.printers = set(reply['printers'])
+            link.alive = True
+            if self._assigning:
+                self._assign()
+        self._log(f"代理已连接: {reply['agent']} ({link.name})，{len(link.printers)} 台打印机")
+
+    def _agent_down(self, link, error):
+        with self._lock:
+            link.alive = False
+            jobs = list(link.inflight.values()) + list(link.outbox)
+            link.inflight.clear()
+            link.outbox.clear()
+            moved = [name for name, owner in self._owners.items() if owner is link]
+            for name in moved:
+                del self._owners[name]
+            if self._assigning:
+                self._assign()
+            for job in jobs:
+                self._route(job)
+            held = len(self._orphans)
+        self._log(f"代理失联: {link.name}（{error}），转移 {len(moved)} 台打印机和 {len(jobs)} 个作业"
+                  + (f"，{held} 个作业等待能访问其打印机的代理" if held else ""))
+
+    # 代理连接线程
+
+    def _run_link(self, link):
+        while not self._stopped:
+            link.wake.clear()
+            try:
+                if not link.alive or link.failing_since is not None:
+                    self._agent_up(link, link.client.call('hello'))
+                    link.failing_since = None
+                self._flush(link)
+                self._poll(link)
+            except (OSError, RpcError, KeyError) as e:
+                now = time.monotonic()
+                if link.failing_since is None:
+                    link.failing_since = now
+                if link.alive and now - link.failing_since >= self.failure_after:
+                    self._agent_down(link, e)
+            finally:
+                link.probed.set()
+            if self._stopped:
+                break
+            if not link.outbox or link.failing_since is not None:
+                link.wake.wait(self.heartbeat)
+
+    def _flush(self, link):
+        while True:
+            with self._lock:
+                if not link.alive or not link.outbox:
+                    return
+                jobs = [link.outbox.popleft() for _ in range(min(self.batch, len(link.outbox)))]
+                for job in jobs:
+                    link.inflight[job['key']] = job
+            specs = [{'key': job['key'], 'printer': job['printer'], 'document': job['document'],
+                      'hash': job['hash'], 'ext': job['ext'], 'copies': job['copies'],
+                      'options': job['options']}
+                     for job in jobs]
+            frames = [link.client.frame('put', self._read(job['doc_path']), hash=job['hash'], ext=job['ext'])
+                      for job in {job['hash']: job for job in jobs
+                                  if job['hash'] not in link.documents}.values()]
+            # 代理可能没有的文档与作业一起发送；代理仍缺文档时（如已清理）上传后再发一次
+            replies = link.client.request(frames + [link.client.frame('submit', jobs=specs)])
+            reply = replies[-1]
+            link.documents.update(job['hash'] for job in jobs)
+            if reply.get('missing'):
+                missing = set(reply['missing'])
+                retry = [spec for spec in specs if spec['hash'] in missing]
+                frames = [link.client.frame('put', self._read(job['doc_path']), hash=job['hash'], ext=job['ext'])
+                          for job in {job['hash']: job for job in jobs if job['hash'] in missing}.values()]
+                reply = link.client.request(frames + [link.client.frame('submit', jobs=retry)])[-1]
+            if not reply.get('ok'):
+                raise RpcError(reply.get('error') or "submit 失败")
+            link.submitted += len(jobs)
+            for entry in reply.get('rejected', ()):
+                self._finish(link, {'key': entry['key'], 'status': 'failed', 'error': entry['error']})
+
+    def _poll(self, link):
+        while True:
+            events = link.client.call('poll', after=link.seq)['events']
+            for event in events:
+                link.seq = event['seq']
+                self._finish(link, event)
+            if len(events) < POLL_LIMIT:
+                return
+
+    def _finish(self, link, event):
+        with self._lock:
+            job = link.inflight.pop(event['key'], None)
+            if job is None:
+                return  # 作业已转给其他代理，忽略原代理迟到的结果
+            del self._jobs[job['key']]
+            link.completed += 1
+            counters = self._counters(job['printer'])
+            job['status'] = event['status']
+            job['error'] = event.get('error')
+            job['latency'] = event.get('latency')
+            job['end_ts'] = time.time()
+            if job['status'] == 'done':
+                counters['success'] += 1
+            else:
+                counters['failed'] += 1
+                if job['status'] == 'timeout':
+                    counters['timeouts'] += 1
+            if job['latency'] is not None:
+                counters['latency_total'] += job['latency']
+                counters['latency_max'] = max(counters['latency_max'], job['latency'])
+        for callback in self._listeners:
+            try:
+                callback(job)
+            except Exception as e:
+                self._log(f"作业回调异常: {e}")
+
+    def _counters(self, printer_name):
+        # 调用方持有 self._lock
+        counters = self._printers.get(printer_name)
+        if counters is None:
+            counters = self._printers[printer_name] = {
+                'success': 0, 'failed': 0, 'timeouts': 0, 'latency_total': 0.0, 'latency_max': 0.0}
+        return counters
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _hash(self, path):
+        stat = os.stat(path)
+        cached = self._documents.get(path)
+        if cached is None or cached[:2] != (stat.st_mtime, stat.st_size):
+            cached = (stat.st_mtime, stat.st_size, _document_hash(path))
+            self._documents[path] = cached
+        return cached[2]
+
+    # 提交与统计
+
+    def submit(self, printer_name, doc_path, copies=1, **options):
+        """提交一个作业，返回作业字典；options 原样交给代理的引擎（backend、cut、copy_mode 等）"""
+        job = {
+            'key': f"{self._prefix}-{next(self._ids)}",
+            'printer': printer_name,
+            'doc_path': doc_path,
+            'document': os.path.basename(doc_path),
+            'hash': self._hash(doc_path),
+            'ext': os.path.splitext(doc_path)[1].lower(),
+            'copies': copies,
+            'options': options,
+            'status': 'queued',
+            'enqueue_ts': time.time(),
+        }
+        with self._lock:
+            self._jobs[job['key']] = job
+            self._counters(printer_name)
+            self._route(job)
+        return job
+
+    def printers(self):
+        """在线代理能访问的全部打印机"""
+        with self._lock:
+            return sorted(set().union(*(link.printers for link in self._links if link.alive)))
+
+    def outstanding(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def printer_stats(self):
+        with self._lock:
+            pending = {}
+            for job in self._jobs.values():
+                pending[job['printer']] = pending.get(job['printer'], 0) + 1
+            stats = []
+            for name, counters in sorted(self._printers.items()):
+                done = counters['success'] + counters['failed']
+                owner = self._owners.get(name)
+                stats.append({
+                    'printer': name, 'agent': owner.name if owner else None,
+                    'success': counters['success'], 'failed': counters['failed'],
+                    'timeouts': counters['timeouts'], 'pending': pending.get(name, 0),
+                    'latency_avg': counters['latency_total'] / done if done else None,
+                    'latency_max': counters['latency_max']})
+            return stats
+
+    def agent_stats(self):
+        with self._lock:
+            owned = {}
+            for owner in self._owners.values():
+                owned[owner] = owned.get(owner, 0) + 1
+            return [{'agent': link.name, 'alive': link.alive, 'printers': owned.get(link, 0),
+                     'reachable': len(link.printers), 'queued': len(link.outbox),
+                     'inflight': len(link.inflight), 'submitted': link.submitted,
+                     'completed': link.completed,
+                     'wire_bytes': link.client.wire_sent + link.client.wire_received}
+                    for link in self._links]
+
+    def totals(self):
+        """返回 (成功次数, 失败次数)"""
+        with self._lock:
+            return (sum(counters['success'] for counters in self._printers.values()),
+                    sum(counters['failed'] for counters in self._printers.values()))
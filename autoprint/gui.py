@@ -0,0 +1,822 @@
+import sys
+import os
+import shutil
+from datetime import datetime
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
+                             QHBoxLayout, QLabel, QPushButton, QTextEdit,
+                             QSpinBox, QGroupBox, QMessageBox, QComboBox,
+                             QFileDialog, QLineEdit, QListWidget, QListWidgetItem,
+                             QCheckBox, QDoubleSpinBox)
+from PyQt5.QtCore import Qt, QTimer
+
+from autoprint.aio_tcp import AsyncTcpFleet
+from autoprint.backends import BackendManager, backend_for_document
+from autoprint.batching import COPY_MODE_BATCH, COPY_MODE_PER_COPY
+from autoprint.config import ConfigManager, apply_tcp_config, find_config, resolve_document
+from autoprint.discovery import PrinterInventory, default_printer_name, win32_sources, wmic_source
+from autoprint.documents import DOCUMENT_FOLDER, DocumentLibrary, read_document
+from autoprint.engine import PRIORITY_HIGH, PRIORITY_NORMAL, PrintEngine
+from autoprint.escpos_status import StatusPoller
+from autoprint.exporter import MetricsExporter
+from autoprint.journal import JobJournal
+from autoprint.logbuffer import LogPipeline, format_record
+from autoprint.metrics import JobMetricsStore
+from autoprint.render import Renderer, can_render
+from autoprint.schedule import IntervalSchedule, Scheduler
+from autoprint.scanner import (RAW_PORT, SubnetScanner, apply_scan_results, count_hosts,
+                               printer_name as scanned_printer_name)
+from autoprint.tcp_pool import TcpConnectionPool
+from autoprint.timeouts import TimeoutPolicy
+
+
+class PrintMonitorApp(QMainWindow):
+    def __init__(self):
+        super().__init__()
+        self.is_auto_printing = False
+        self.print_timeout = 120  # 2分钟超时
+        self.test_documents = []
+        self.document_folder = DOCUMENT_FOLDER
+        self.tcp_printers = {}  # 初始化TCP打印机配置字典
+        self.print_copies = 1  # 默认打印份数（关键新增属性）
+        self.max_print_workers = 16  # 并发打印线程数上限
+        self.max_log_lines = 5000  # 日志窗口最多保留的行数
+
+        # 日志管道：任意线程写入，GUI定时批量显示，同时写入轮转的JSONL日志文件
+        self.log_pipeline = LogPipeline(
+            file_path=os.path.join(self.document_folder, "logs", "autoprinter.jsonl"))
+
+        # 多打印机并发调度引擎（每台打印机独立的作业状态和计数器）
+        # 作业截止时间由引擎的时间轮线程处理，不依赖下面的界面定时器
+        self.timeout_policy = TimeoutPolicy(self.print_timeout)
+        self.engine = PrintEngine(self._print_job, max_workers=self.max_print_workers,
+                                  log=self.log_message, timeout_policy=self.timeout_policy)
+        self.engine.add_listener(self._on_job_finished)
+        # 每个作业的时间戳与结果，计数器重置时不清空，用于长时间测试的延迟统计
+        self.metrics = JobMetricsStore(
+            path=os.path.join(self.document_folder, "logs", "metrics.bin"))
+        self.engine.add_listener(self.metrics.record)
+        # TCP打印机持久连接池（多份打印在同一连接上流水线发送）
+        self.tcp_pool = TcpConnectionPool(log=self.log_message)
+        # asyncio TCP后端：在一个事件循环中同时驱动全部TCP打印机
+        self.tcp_fleet = AsyncTcpFleet()
+        # ESC/POS 设备状态：所有TCP打印机共用一个轮询线程，设备确认打印完成并检测缺纸、开盖等错误
+        self.status_poller = StatusPoller(log=self.log_message)
+        self.status_poller.add_listener(
+            lambda name, status: self.log_message(f"[{name}] 设备状态: {status.text()}"))
+        # 打印后端：win32/shell/tcp按文档类型自动选择，也可切换为模拟打印机或文件输出
+        # txt/pdf 在进程内渲染为 ESC/POS 数据（缓存在文档文件夹的 cache 中）后按 RAW 发送
+        # 后台处理程序中的作业按StartDocPrinter返回的作业ID跟踪（队列变化通知驱动）
+        self.backends = BackendManager(
+            options={
+                'tcp': {'printers': self.tcp_printers, 'pool': self.tcp_pool,
+                        'status_poller': self.status_poller},
+                'file': {'directory': os.path.join(self.document_folder, "output")},
+            },
+            log=self.log_message, device_status=self.status_poller.status,
+            renderer=Renderer(os.path.join(self.document_folder, "cache"), log=self.log_message))
+        # 失败后等待重试的作业不再跟踪上一次尝试留在打印队列中的份数
+        self.engine.add_retry_listener(self.backends.untrack)
+        # 可选的Prometheus指标端口（在界面上开启）
+        self.exporter = MetricsExporter(self.engine, self.backends, self.tcp_pool)
+
+        # 确保文档文件夹存在
+        if not os.path.exists(self.document_folder):
+            os.makedirs(self.document_folder)
+
+        # 文档列表和内容缓存：文件夹变化时由监视线程使缓存失效，界面在下一次定时刷新时更新列表
+        self.documents_changed = False
+        self.documents = DocumentLibrary(self.document_folder,
+                                         on_change=self._on_documents_changed).watch()
+
+        # 打印机清单：各枚举来源在后台并行查询，缓存60秒，过期后在后台按增量刷新
+        self.printers_diff = None
+        self.printer_warning_shown = False
+        self.printer_inventory = PrinterInventory(
+            win32_sources(), fallback=wmic_source(), ttl=60.0,
+            name_filter=lambda name: name.lower().startswith('sunmi'),
+            log=self.log_message)
+
+        # 网段扫描：自动发现开放 9100 端口的TCP打印机
+        self.tcp_scan_ranges = ["192.168.1.0/24"]
+        self.scanner = SubnetScanner()
+        self.scan_thread = None
+        self.scan_results = None
+
+        # 配置文件（打印机、打印参数、文档、后端），修改后由监视线程热加载，GUI定时按增量应用
+        self.config_diffs = []
+        self.station_config = ConfigManager(
+            find_config(os.path.join(self.document_folder, "config")),
+            on_change=self.config_diffs.append, log=self.log_message)
+
+        # 自动打印：一个调度线程按各打印机的计划（间隔/速率/cron）提交作业，
+        # 打印参数由GUI线程每秒快照一次（auto_print_params），调度线程不读取控件
+        self.auto_print_params = None
+        self.scheduler = Scheduler(self.auto_print_test_page, log=self.log_message).start()
+
+        # 后台结果的应用与状态刷新统一在GUI线程中每秒执行一次
+        self.timeout_timer = QTimer()
+        self.timeout_timer.timeout.connect(self.check_print_timeout)
+
+        self.log_flush_timer = QTimer()
+        self.log_flush_timer.timeout.connect(self.flush_log_view)
+
+        self.metrics_timer = QTimer()
+        self.metrics_timer.timeout.connect(self.update_metrics_label)
+
+        self.init_ui()
+        self.timeout_timer.start(1000)
+        self.log_flush_timer.start(200)
+        self.metrics_timer.start(5000)
+        self.refresh_printers(force=False)
+        self.load_tcp_printers_config()  # 加载TCP打印机配置
+
+        # 作业日志：恢复上次运行的计数器，重新提交崩溃或退出时未完成的作业
+        self.journal = JobJournal(os.path.join(self.document_folder, "logs", "journal.bin"),
+                                  log=self.log_message)
+        self.journal.attach(self.engine)
+        self.update_status_labels()
+
+    def init_ui(self):
+        self.setWindowTitle('打印驱动测试工具')
+        self.setGeometry(100, 100, 900, 700)
+
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+
+        layout = QVBoxLayout(central_widget)
+
+        # 状态信息组
+        status_group = QGroupBox("打印状态")
+        status_layout = QVBoxLayout()
+
+        self.status_label = QLabel("就绪")
+        status_layout.addWidget(self.status_label)
+
+        self.print_count_label = QLabel("成功打印次数: 0")
+        status_layout.addWidget(self.print_count_label)
+
+        self.failed_count_label = QLabel("失败打印次数: 0")
+        status_layout.addWidget(self.failed_count_label)
+
+        self.current_job_label = QLabel("当前打印作业: 无")
+        status_layout.addWidget(self.current_job_label)
+
+        self.metrics_label = QLabel("最近5分钟: 无数据")
+        status_layout.addWidget(self.metrics_label)
+
+        self.document_folder_label = QLabel(f"文档存储位置: {self.document_folder}")
+        status_layout.addWidget(self.document_folder_label)
+
+        status_group.setLayout(status_layout)
+        layout.addWidget(status_group)
+
+        # 控制组（新增打印份数设置）
+        control_group = QGroupBox("打印控制")
+        control_layout = QVBoxLayout()
+
+        # 打印机选择
+        printer_layout = QHBoxLayout()
+        printer_layout.addWidget(QLabel("选择打印机:"))
+        self.printer_combo = QComboBox()
+        printer_layout.addWidget(self.printer_combo)
+        refresh_btn = QPushButton("刷新打印机列表")
+        refresh_btn.clicked.connect(lambda: self.refresh_printers(force=True))
+        printer_layout.addWidget(refresh_btn)
+        self.all_printers_check = QCheckBox("同时打印所有打印机")
+        printer_layout.addWidget(self.all_printers_check)
+        control_layout.addLayout(printer_layout)
+
+        # 文档选择
+        doc_layout = QHBoxLayout()
+        doc_layout.addWidget(QLabel("选择测试文档:"))
+        self.doc_combo = QComboBox()
+        self.refresh_documents()
+        doc_layout.addWidget(self.doc_combo)
+        add_doc_btn = QPushButton("添加文档")
+        add_doc_btn.clicked.connect(self.add_document)
+        doc_layout.addWidget(add_doc_btn)
+        refresh_doc_btn = QPushButton("刷新文档列表")
+        refresh_doc_btn.clicked.connect(self.reload_documents)
+        doc_layout.addWidget(refresh_doc_btn)
+        control_layout.addLayout(doc_layout)
+
+        # 新增：打印份数设置（关键修复点）
+        copies_layout = QHBoxLayout()
+        copies_layout.addWidget(QLabel("打印份数:"))
+        self.copies_spin = QSpinBox()
+        self.copies_spin.setRange(1, 10)  # 支持1-10份
+        self.copies_spin.setValue(self.print_copies)
+        self.copies_spin.valueChanged.connect(self.update_print_copies)
+        copies_layout.addWidget(self.copies_spin)
+        # 多份合并为一个后台处理程序作业（RAW/TCP/模拟后端），每份之后可加切纸指令
+        self.batch_copies_check = QCheckBox("多份合并为一个作业")
+        copies_layout.addWidget(self.batch_copies_check)
+        copies_layout.addWidget(QLabel("切纸:"))
+        self.cut_combo = QComboBox()
+        for label, cut in (("不切纸", "none"), ("半切", "partial"), ("全切", "full"),
+                           ("走纸后半切", "feed")):
+            self.cut_combo.addItem(label, cut)
+        copies_layout.addWidget(self.cut_combo)
+        # TCP打印机在数据之后发送 GS r 1，收到回复才算打印完成
+        self.confirm_check = QCheckBox("TCP打印等待设备确认")
+        copies_layout.addWidget(self.confirm_check)
+        control_layout.addLayout(copies_layout)
+
+        # 自动打印设置
+        auto_print_layout = QHBoxLayout()
+        auto_print_layout.addWidget(QLabel("自动打印间隔(秒):"))
+        self.interval_spin = QDoubleSpinBox()
+        self.interval_spin.setDecimals(2)
+        self.interval_spin.setRange(0.05, 86400)
+        self.interval_spin.setValue(1800)
+        self.interval_spin.valueChanged.connect(self.update_auto_print_interval)
+        auto_print_layout.addWidget(self.interval_spin)
+        self.auto_print_btn = QPushButton("开始自动打印")
+        self.auto_print_btn.clicked.connect(self.toggle_auto_print)
+        auto_print_layout.addWidget(self.auto_print_btn)
+        control_layout.addLayout(auto_print_layout)
+
+        # 超时设置
+        timeout_layout = QHBoxLayout()
+        timeout_layout.addWidget(QLabel("打印超时(秒):"))
+        self.timeout_spin = QSpinBox()
+        self.timeout_spin.setRange(30, 300)
+        self.timeout_spin.setValue(120)
+        self.timeout_spin.valueChanged.connect(self.update_timeout)
+        timeout_layout.addWidget(self.timeout_spin)
+        control_layout.addLayout(timeout_layout)
+
+        # 手动打印按钮
+        self.manual_print_btn = QPushButton("立即打印测试文档")
+        self.manual_print_btn.clicked.connect(self.manual_print_test_page)
+        control_layout.addWidget(self.manual_print_btn)
+
+        backend_layout = QHBoxLayout()
+        backend_layout.addWidget(QLabel("打印后端:"))
+        self.backend_combo = QComboBox()
+        self.backend_combo.addItem("自动（按文档类型）", None)
+        self.backend_combo.addItem("模拟打印机", "simulated")
+        self.backend_combo.addItem("输出到文件", "file")
+        backend_layout.addWidget(self.backend_combo)
+        control_layout.addLayout(backend_layout)
+
+        metrics_layout = QHBoxLayout()
+        self.metrics_port_check = QCheckBox("开启Prometheus指标端口:")
+        self.metrics_port_check.toggled.connect(self.toggle_metrics_exporter)
+        metrics_layout.addWidget(self.metrics_port_check)
+        self.metrics_port_spin = QSpinBox()
+        self.metrics_port_spin.setRange(1024, 65535)
+        self.metrics_port_spin.setValue(9464)
+        metrics_layout.addWidget(self.metrics_port_spin)
+        control_layout.addLayout(metrics_layout)
+
+        self.fleet_print_btn = QPushButton("向所有TCP打印机发送测试文档")
+        self.fleet_print_btn.clicked.connect(self.print_tcp_fleet)
+        control_layout.addWidget(self.fleet_print_btn)
+
+        # 扫描网段自动发现TCP打印机（逗号分隔多个CIDR）
+        scan_layout = QHBoxLayout()
+        scan_layout.addWidget(QLabel("扫描网段:"))
+        self.scan_ranges_edit = QLineEdit(", ".join(self.tcp_scan_ranges))
+        scan_layout.addWidget(self.scan_ranges_edit)
+        self.scan_btn = QPushButton("扫描TCP打印机")
+        self.scan_btn.clicked.connect(self.scan_tcp_printers)
+        scan_layout.addWidget(self.scan_btn)
+        control_layout.addLayout(scan_layout)
+
+        control_group.setLayout(control_layout)
+        layout.addWidget(control_group)
+
+        # 文档管理组
+        doc_manage_group = QGroupBox("文档管理")
+        doc_manage_layout = QVBoxLayout()
+        self.doc_list = QListWidget()
+        self.refresh_doc_list()
+        doc_manage_layout.addWidget(self.doc_list)
+        doc_btn_layout = QHBoxLayout()
+        open_folder_btn = QPushButton("打开文档文件夹")
+        open_folder_btn.clicked.connect(self.open_document_folder)
+        doc_btn_layout.addWidget(open_folder_btn)
+        remove_doc_btn = QPushButton("删除选中文档")
+        remove_doc_btn.clicked.connect(self.remove_document)
+        doc_btn_layout.addWidget(remove_doc_btn)
+        doc_manage_layout.addLayout(doc_btn_layout)
+        doc_manage_group.setLayout(doc_manage_layout)
+        layout.addWidget(doc_manage_group)
+
+        # 日志区域
+        log_group = QGroupBox("打印日志")
+        log_layout = QVBoxLayout()
+        self.log_text = QTextEdit()
+        self.log_text.setReadOnly(True)
+        # 限制行数，避免多日测试中日志控件越来越慢
+        self.log_text.document().setMaximumBlockCount(self.max_log_lines)
+        log_layout.addWidget(self.log_text)
+        log_group.setLayout(log_layout)
+        layout.addWidget(log_group)
+
+        # 日志操作按钮
+        log_btn_layout = QHBoxLayout()
+        clear_btn = QPushButton("清空日志")
+        clear_btn.clicked.connect(self.clear_log)
+        log_btn_layout.addWidget(clear_btn)
+        export_btn = QPushButton("导出日志")
+        export_btn.clicked.connect(self.export_log)
+        log_btn_layout.addWidget(export_btn)
+        layout.addLayout(log_btn_layout)
+
+        self.log_message("应用程序已启动")
+
+    def update_print_copies(self):
+        """更新打印份数设置（关键修复点）"""
+        self.print_copies = self.copies_spin.value()
+        self.log_message(f"打印份数已设置为: {self.print_copies}")
+
+        # 【新增】设置打印份数后立即打印测试文档并重置成功打印次数
+        self.reset_print_counters()
+        self.manual_print_test_page()
+
+    def update_auto_print_interval(self):
+        """更新自动打印间隔：正在自动打印时从上一次的计划时刻起按新间隔计算，不重置计数器"""
+        self.log_message(f"自动打印间隔已设置为: {self.interval_spin.value():g} 秒")
+        if self.is_auto_printing:
+            self.sync_auto_print_schedules()
+
+    def refresh_printers(self, force=True):
+        """在后台并行查询各打印机来源，结果由 check_print_timeout 在GUI线程中按增量应用"""
+        if not self.printer_inventory.refresh_in_background(force, self._on_printers_discovered):
+            self.log_message("打印机列表正在刷新中")
+
+    def _on_printers_discovered(self, diff):
+        # 在后台线程中调用，只保存结果
+        self.printers_diff = diff
+
+    def apply_printer_diff(self, diff):
+        """按增量更新打印机下拉框，不重建整个列表"""
+        for name in diff.removed:
+            index = self.printer_combo.findText(name)
+            if index >= 0:
+                self.printer_combo.removeItem(index)
+        for info in diff.changed:
+            index = self.printer_combo.findText(info['name'])
+            if index >= 0:
+                self.printer_combo.setItemData(index, info)
+        first_load = self.printer_combo.count() == 0
+        for info in diff.added:
+            self.printer_combo.addItem(info['name'], info)
+
+        if first_load and diff.added:
+            # 尝试设置默认打印机（如果它在过滤后的列表中）
+            default_printer = default_printer_name()
+            if default_printer and default_printer.lower().startswith('sunmi'):
+                index = self.printer_combo.findText(default_printer)
+                if index >= 0:
+                    self.printer_combo.setCurrentIndex(index)
+                    self.log_message(f"已选择默认打印机: {default_printer}")
+
+        if diff:
+            self.log_message(f"打印机列表已更新: 新增 {len(diff.added)} 台，移除 {len(diff.removed)} 台，"
+                             f"共 {self.printer_combo.count()} 台Sunmi打印机")
+        if self.printer_combo.count() == 0 and not self.printer_warning_shown:
+            # 如果没有找到任何Sunmi打印机，显示警告（只提示一次）
+            self.printer_warning_shown = True
+            self.log_message("警告: 未找到任何以'Sunmi'开头的打印机")
+            QMessageBox.warning(self, "打印机警告", "未找到任何以'Sunmi'开头的打印机！")
+
+    def refresh_documents(self):
+        self.doc_combo.clear()
+        self.load_documents()
+        for doc in self.test_documents:
+            self.doc_combo.addItem(os.path.basename(doc), doc)
+
+    def refresh_doc_list(self):
+        self.doc_list.clear()
+        self.load_documents()
+        for doc in self.test_documents:
+            item = QListWidgetItem(os.path.basename(doc))
+            item.setData(Qt.UserRole, doc)
+            self.doc_list.addItem(item)
+
+    def load_documents(self, rescan=False):
+        self.test_documents = []
+        try:
+            self.test_documents = self.documents.documents(rescan)
+        except Exception as e:
+            self.log_message(f"加载文档失败: {str(e)}")
+
+    def reload_documents(self):
+        """重新读取文档文件夹并刷新下拉框和文档列表"""
+        self.load_documents(rescan=True)
+        self.refresh_documents()
+        self.refresh_doc_list()
+
+    def _on_documents_changed(self, changed_paths):
+        # 在监视线程中调用，只做标记
+        self.documents_changed = True
+
+    def add_document(self):
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "选择测试文档", "",
+            "文档文件 (*.pdf *.txt *.doc *.docx *.xps *.tcp *.usb);;所有文件 (*.*)"
+        )
+        if file_path:
+            try:
+                file_name = os.path.basename(file_path)
+                dest_path = os.path.join(self.document_folder, file_name)
+                shutil.copy2(file_path, dest_path)
+                self.log_message(f"已添加文档: {file_name}")
+                self.reload_documents()
+            except Exception as e:
+                self.log_message(f"添加文档失败: {str(e)}")
+
+    def remove_document(self):
+        current_item = self.doc_list.currentItem()
+        if current_item:
+            file_path = current_item.data(Qt.UserRole)
+            try:
+                os.remove(file_path)
+                self.log_message(f"已删除文档: {os.path.basename(file_path)}")
+                self.reload_documents()
+            except Exception as e:
+                self.log_message(f"删除文档失败: {str(e)}")
+        else:
+            self.log_message("请先选择一个文档")
+
+    def open_document_folder(self):
+        try:
+            os.startfile(self.document_folder)
+        except Exception as e:
+            self.log_message(f"打开文件夹失败: {str(e)}")
+
+    def update_timeout(self):
+        self.print_timeout = self.timeout_spin.value()
+        self.timeout_policy.default = self.print_timeout
+
+    def toggle_auto_print(self):
+        if self.is_auto_printing:
+            self.stop_auto_print()
+        else:
+            self.start_auto_print()
+
+    def start_auto_print(self):
+        self.auto_print_params = self._print_params()
+        self.is_auto_printing = True
+        self.sync_auto_print_schedules()
+        self.auto_print_btn.setText("停止自动打印")
+
+        # 【新增】开始自动打印时重置成功打印次数
+        self.reset_print_counters()
+        self.log_message(f"已启用自动打印，每 {self.interval_spin.value():g} 秒打印一次"
+                         f"（配置文件中单独设置计划的打印机除外）")
+        if self.auto_print_params is None:
+            self.log_message("暂无可用的打印机或测试文档，可用后开始自动打印")
+
+    def sync_auto_print_schedules(self):
+        """在GUI线程中按当前选择的打印机和配置文件同步调度计划，计划不变的打印机保持原有节奏"""
+        params = self.auto_print_params
+        printers = params['printers'] if params else []
+        default = IntervalSchedule(self.interval_spin.value())
+        config = self.station_config.config
+        self.scheduler.update({name: config.schedule(name, default) for name in printers})
+
+    def stop_auto_print(self):
+        self.scheduler.clear()
+        self.auto_print_params = None
+        self.is_auto_printing = False
+        self.auto_print_btn.setText("开始自动打印")
+        self.log_message("已停止自动打印")
+
+    def reset_print_counters(self):
+        """重置打印计数器"""
+        self.engine.reset_counters()
+        self.journal.reset_counters()
+        self.update_status_labels()
+        self.log_message("打印计数器已重置")
+
+    def manual_print_test_page(self):
+        if not self.printer_combo.count():
+            self.log_message("错误: 没有可用打印机")
+            QMessageBox.warning(self, "打印机错误", "没有可用的Sunmi打印机！")
+            return
+        if not self.test_documents:
+            self.log_message("错误: 没有可用测试文档")
+            QMessageBox.warning(self, "文档错误", "没有可用的测试文档！")
+            return
+        self.log_message("手动请求打印测试文档")
+        self.print_test_page(priority=PRIORITY_HIGH)
+
+    def auto_print_test_page(self, printer_name, count):
+        """调度线程回调：按GUI线程最近一次快照的打印参数提交 count 个作业"""
+        params = self.auto_print_params
+        if params is None or printer_name not in params['printers']:
+            return
+        for _ in range(count):
+            self._submit_print(params, printer_name)
+
+    def _print_params(self):
+        """在GUI线程中读取打印参数；没有可用的打印机或文档时返回 None"""
+        doc_index = self.doc_combo.currentIndex()
+        if not self.printer_combo.count() or doc_index < 0 or doc_index >= len(self.test_documents):
+            return None
+        if self.all_printers_check.isChecked():
+            printers = [self.printer_combo.itemText(i) for i in range(self.printer_combo.count())]
+        else:
+            printers = [self.printer_combo.currentText()]
+        return {
+            'printers': printers,
+            'doc_path': self.test_documents[doc_index],
+            # 【关键修复】实时获取打印份数
+            'copies': self.copies_spin.value(),
+            'backend': self.backend_combo.currentData(),
+            'copy_mode': COPY_MODE_BATCH if self.batch_copies_check.isChecked() else COPY_MODE_PER_COPY,
+            'cut': self.cut_combo.currentData(),
+            'confirm': self.confirm_check.isChecked(),
+        }
+
+    def _submit_print(self, params, printer_name, priority=PRIORITY_NORMAL):
+        # 可在任意线程中调用：只读取参数快照和配置文件
+        # 配置文件中为该打印机单独写出的字段优先于界面上的设置
+        override = self.station_config.config.printers.get(printer_name, {})
+        path = resolve_document(override.get('document'), self.document_folder) or params['doc_path']
+        printer_backend = override.get('backend', params['backend'] or 'auto')
+        if printer_backend == 'auto':
+            printer_backend = backend_for_document(path, printer_name, self.tcp_printers)
+        return self.engine.submit(
+            printer_name, path, override.get('copies', params['copies']), backend=printer_backend,
+            copy_mode=override.get('copy_mode', params['copy_mode']), cut=override.get('cut', params['cut']),
+            confirm=override.get('confirm', params['confirm']), timeout=override.get('timeout'),
+            priority=priority)
+
+    def print_test_page(self, priority=PRIORITY_NORMAL):
+        """在GUI线程中读取打印参数，交给调度引擎并发执行（手动打印优先于排队中的自动打印）"""
+        params = self._print_params()
+        if params is None:
+            self.log_message("错误: 没有可用的打印机或测试文档")
+            return
+        for printer_name in params['printers']:
+            self._submit_print(params, printer_name, priority)
+        self.update_job_status()
+
+    def print_tcp_fleet(self):
+        """使用asyncio后端向全部已配置的TCP打印机并发发送当前文档"""
+        if not self.tcp_printers:
+            self.log_message("错误: 未配置TCP打印机")
+            return
+        doc_index = self.doc_combo.currentIndex()
+        if doc_index < 0 or doc_index >= len(self.test_documents):
+            self.log_message("错误: 没有可用测试文档")
+            return
+        doc_path = self.test_documents[doc_index]
+        copies = self.copies_spin.value()
+        try:
+            # txt/pdf 发送渲染后的 ESC/POS 数据（已缓存时不重新渲染）
+            payload = self.backends.renderer.render(doc_path) if can_render(doc_path) else doc_path
+            data = read_document(payload)
+        except Exception as e:
+            self.log_message(f"读取文档失败: {str(e)}")
+            return
+
+        jobs = {name: self.engine.begin_job(name, doc_path, copies, backend="tcp",
+                                            bytes=len(data) * copies)
+                for name in self.tcp_printers}
+
+        def on_result(name, success, error, elapsed):
+            self.engine.complete_job(jobs[name]['id'], success, error)
+
+        def on_done(results):
+            failed = sum(1 for result in results if not result[1])
+            self.log_message(f"TCP批量打印结束: 共 {len(results)} 台，失败 {failed} 台")
+
+        self.log_message(f"开始向 {len(self.tcp_printers)} 台TCP打印机发送: "
+                         f"{os.path.basename(doc_path)}（份数: {copies}）")
+        self.tcp_fleet.send_timeout = self.print_timeout
+        self.tcp_fleet.print_fleet_in_background(dict(self.tcp_printers), data, copies,
+                                                 on_result=on_result, on_done=on_done)
+
+    def _print_job(self, job):
+        """在工作线程中执行单个打印作业；返回 True 表示发送即视为完成"""
+        self.log_message(f"开始打印: {job['document']} 到 {job['printer']}（份数: {job['copies']}）")
+        return self.backends.run_job(job, self.engine.complete_job)
+
+    def load_tcp_printers_config(self):
+        # 原地更新：TCP后端与本窗口共享同一个配置字典，配置文件中的打印机先填入，扫描结果到达后再补充
+        self.tcp_printers.clear()
+        diff = self.station_config.reload()
+        if diff:
+            self.apply_station_config(diff)
+        self.station_config.watch()
+        self.scan_tcp_printers()
+
+    def apply_station_config(self, diff):
+        """在GUI线程中按增量应用配置文件：只更新变化的控件和TCP打印机，进行中的作业不受影响"""
+        config = self.station_config.config
+        settings = config.settings()
+        for field in diff.defaults:
+            value = settings[field]
+            if field == 'interval':
+                self._set_silently(self.interval_spin, value)
+            elif field == 'timeout':
+                self._set_silently(self.timeout_spin, int(value))
+                self.print_timeout = value
+                self.timeout_policy.default = value
+            elif field == 'copies':
+                self._set_silently(self.copies_spin, value)
+                self.print_copies = value
+            elif field == 'document' and value:
+                index = self.doc_combo.findData(resolve_document(value, self.document_folder))
+                if index >= 0:
+                    self.doc_combo.setCurrentIndex(index)
+                else:
+                    self.log_message(f"配置文件中的测试文档不存在: {value}")
+            elif field == 'backend':
+                index = self.backend_combo.findData(None if value == 'auto' else value)
+                if index >= 0:
+                    self.backend_combo.setCurrentIndex(index)
+            elif field == 'copy_mode':
+                self.batch_copies_check.setChecked(value == COPY_MODE_BATCH)
+            elif field == 'cut':
+                self.cut_combo.setCurrentIndex(max(0, self.cut_combo.findData(value)))
+            elif field == 'confirm':
+                self.confirm_check.setChecked(value)
+        apply_tcp_config(self.tcp_printers, config, diff)
+        if self.is_auto_printing:
+            # 只更新计划变化的打印机，不重置计数器
+            self.sync_auto_print_schedules()
+        if diff.scan and config.scan_ranges:
+            self.scan_ranges_edit.setText(", ".join(config.scan_ranges))
+        self.log_message(f"已应用配置文件 {self.station_config.path}: {diff.summary()}")
+
+    @staticmethod
+    def _set_silently(spin, value):
+        # 不触发 valueChanged（手动修改份数会立即打印并重置计数器）
+        spin.blockSignals(True)
+        spin.setValue(value)
+        spin.blockSignals(False)
+
+    def scan_tcp_printers(self):
+        """在后台扫描网段中开放 9100 端口的主机，结果由 check_print_timeout 应用"""
+        if self.scan_thread is not None and self.scan_thread.is_alive():
+            self.log_message("网段扫描正在进行中")
+            return
+        try:
+            ranges = [cidr.strip() for cidr in self.scan_ranges_edit.text().split(",") if cidr.strip()]
+            hosts = count_hosts(ranges)
+        except ValueError as e:
+            self.log_message(f"网段格式错误: {str(e)}")
+            return
+        self.tcp_scan_ranges = ranges
+        self.log_message(f"开始扫描TCP打印机: {', '.join(ranges)}（{hosts} 台主机）")
+
+        def on_done(results, elapsed):
+            self.log_message(f"网段扫描完成: 发现 {len(results)} 台主机，用时 {elapsed:.1f} 秒")
+            self.scan_results = results
+
+        self.scan_thread = self.scanner.scan_in_background(ranges, on_done=on_done)
+
+    def apply_tcp_scan_results(self, results):
+        added = apply_scan_results(self.tcp_printers, results)
+        for result in results:
+            if RAW_PORT in result['ports']:
+                kind = "ESC/POS" if result['escpos'] else "RAW"
+                self.log_message(f"发现{kind}打印机: {scanned_printer_name(result)} ({result['ip']})")
+        self.log_message(f"TCP打印机配置: 新增 {len(added)} 台，共 {len(self.tcp_printers)} 台")
+
+    def _on_job_finished(self, job):
+        """调度引擎回调：记录单个作业的结束状态"""
+        self.backends.untrack(job)
+        if job['status'] == 'done':
+            success, _ = self.engine.totals()
+            self.log_message(f"打印成功完成！[{job['printer']}] 总成功次数: {success}")
+        elif job['status'] == 'timeout':
+            self.log_message(f"打印超时！[{job['printer']}] {job['document']}")
+        else:
+            self.log_message(f"打印失败: [{job['printer']}] {job.get('error')}"
+                             f"（{job['attempts']}次尝试，已放弃）")
+
+    def check_print_timeout(self):
+        if self.documents_changed:
+            self.documents_changed = False
+            self.reload_documents()
+        if self.printers_diff is not None:
+            diff, self.printers_diff = self.printers_diff, None
+            self.apply_printer_diff(diff)
+        elif not self.printer_inventory.is_fresh():
+            self.printer_inventory.refresh_in_background(callback=self._on_printers_discovered)
+        if self.scan_results is not None:
+            results, self.scan_results = self.scan_results, None
+            self.apply_tcp_scan_results(results)
+        while self.config_diffs:
+            diff = self.config_diffs.pop(0)
+            self.apply_station_config(diff)
+            if diff.scan:
+                self.scan_tcp_printers()
+        if self.is_auto_printing:
+            # 界面上修改的打印参数和打印机选择在一秒内对自动打印生效
+            self.auto_print_params = self._print_params()
+            self.sync_auto_print_schedules()
+        self.update_status_labels()
+        self.update_job_status()
+
+    def update_job_status(self):
+        jobs = self.engine.active_jobs()
+        if not jobs:
+            self.current_job_label.setText("当前打印作业: 无")
+            return
+        job = min(jobs, key=lambda j: j['start_time'])
+        elapsed = (datetime.now() - job['start_time']).total_seconds()
+        text = f"当前打印作业: {job['document']} 到 {job['printer']} ({elapsed:.0f}秒)"
+        if len(jobs) > 1:
+            text += f" 等 {len(jobs)} 个作业"
+        self.current_job_label.setText(text)
+
+    def update_status_labels(self):
+        success, failed = self.engine.totals()
+        retries = sum(state['retries'] for state in self.engine.printer_stats())
+        self.print_count_label.setText(f"成功打印次数: {success}")
+        self.failed_count_label.setText(f"失败打印次数: {failed}（重试 {retries} 次）")
+
+    def toggle_metrics_exporter(self, enabled):
+        if enabled:
+            try:
+                host, port = self.exporter.start(port=self.metrics_port_spin.value())
+                self.metrics_port_spin.setEnabled(False)
+                self.log_message(f"指标端口已开启: http://{host}:{port}/metrics")
+            except Exception as e:
+                self.log_message(f"开启指标端口失败: {str(e)}")
+                self.metrics_port_check.setChecked(False)
+        else:
+            self.exporter.stop()
+            self.metrics_port_spin.setEnabled(True)
+            self.log_message("指标端口已关闭")
+
+    def update_metrics_label(self):
+        stats = self.metrics.stats(window=300)
+        if not stats['jobs']:
+            self.metrics_label.setText("最近5分钟: 无数据")
+            return
+        text = f"最近5分钟: {stats['jobs_per_min']:.1f} 作业/分钟  成功率 {stats['success_rate']:.1%}"
+        if stats['p50'] is not None:
+            text += (f"  延迟 p50 {stats['p50']:.2f}s / p95 {stats['p95']:.2f}s"
+                     f" / p99 {stats['p99']:.2f}s")
+        self.metrics_label.setText(text)
+        self.metrics.flush()
+
+    def log_message(self, message):
+        """线程安全：只写入日志管道，由 flush_log_view 在GUI线程中批量显示"""
+        self.log_pipeline.log(message)
+
+    def flush_log_view(self):
+        records = self.log_pipeline.drain_view()
+        if not records:
+            return
+        self.log_text.append("\n".join(format_record(record) for record in records))
+        self.log_text.verticalScrollBar().setValue(
+            self.log_text.verticalScrollBar().maximum()
+        )
+
+    def clear_log(self):
+        self.log_text.clear()
+        self.log_message("日志已清空")
+
+    def export_log(self):
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "导出日志", "", "文本文件 (*.txt);;所有文件 (*.*)"
+        )
+        if file_path:
+            try:
+                if not file_path.lower().endswith('.txt'):
+                    file_path += '.txt'
+                # 从日志文件流式导出，不受窗口显示行数限制
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    for line in self.log_pipeline.iter_lines():
+                        f.write(line)
+                        f.write('\n')
+                self.log_message(f"日志已导出到: {file_path}")
+            except Exception as e:
+                self.log_message(f"导出日志失败: {str(e)}")
+
+    def closeEvent(self, event):
+        self.scheduler.stop()
+        if self.timeout_timer.isActive():
+            self.timeout_timer.stop()
+        self.log_flush_timer.stop()
+        self.metrics_timer.stop()
+        self.exporter.stop()
+        self.documents.close()
+        self.station_config.close()
+        self.printer_inventory.close()
+        self.engine.shutdown()
+        self.journal.close()
+        self.backends.close()
+        self.status_poller.stop()
+        self.tcp_pool.close_all()
+        self.metrics.close()
+        self.log_pipeline.close()
+        event.accept()
+
+
+def main():
+    app = QApplication(sys.argv)
+    window = PrintMonitorApp()
+    window.show()
+    sys.exit(app.exec_())
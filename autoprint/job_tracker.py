@@ -0,0 +1,319 @@
+"""打印后台处理程序（spooler）作业跟踪
+
+按 StartDocPrinter 返回的作业 ID 跟踪作业，不再按文档名子串匹配。
+每台打印机的所有未完成作业在一次 EnumJobs 中批量检查；
+NotifyJobTracker 使用打印机变更通知，在队列变化时立即检查。
+FakeSpooler 在内存中模拟后台处理程序，便于在 Linux 上验证跟踪逻辑。
+"""
+import itertools
+import threading
+import time
+from collections import defaultdict
+
+# 与 win32print.JOB_STATUS_* 相同的位掩码值，作业状态可能同时包含多个位
+JOB_STATUS_PAUSED = 0x1
+JOB_STATUS_ERROR = 0x2
+JOB_STATUS_DELETING = 0x4
+JOB_STATUS_SPOOLING = 0x8
+JOB_STATUS_PRINTING = 0x10
+JOB_STATUS_OFFLINE = 0x20
+JOB_STATUS_PAPEROUT = 0x40
+JOB_STATUS_PRINTED = 0x80
+JOB_STATUS_DELETED = 0x100
+JOB_STATUS_BLOCKED_DEVQ = 0x200
+JOB_STATUS_USER_INTERVENTION = 0x400
+JOB_STATUS_RESTART = 0x800
+JOB_STATUS_COMPLETE = 0x1000
+
+_STATUS_TEXT = [
+    (JOB_STATUS_PAUSED, "已暂停"),
+    (JOB_STATUS_ERROR, "错误"),
+    (JOB_STATUS_DELETING, "正在删除"),
+    (JOB_STATUS_SPOOLING, "正在假脱机"),
+    (JOB_STATUS_PRINTING, "正在打印"),
+    (JOB_STATUS_OFFLINE, "脱机"),
+    (JOB_STATUS_PAPEROUT, "缺纸"),
+    (JOB_STATUS_PRINTED, "已打印"),
+    (JOB_STATUS_DELETED, "已删除"),
+    (JOB_STATUS_BLOCKED_DEVQ, "设备队列阻塞"),
+    (JOB_STATUS_USER_INTERVENTION, "需要用户干预"),
+    (JOB_STATUS_RESTART, "重新启动"),
+    (JOB_STATUS_COMPLETE, "完成"),
+]
+
+DONE_MASK = (JOB_STATUS_COMPLETE | JOB_STATUS_PRINTED | JOB_STATUS_DELETED
+             | JOB_STATUS_DELETING | JOB_STATUS_RESTART)
+ERROR_MASK = JOB_STATUS_ERROR
+
+
+def job_status_text(status):
+    if not status:
+        return "排队中"
+    texts = [text for bit, text in _STATUS_TEXT if status & bit]
+    return "、".join(texts) if texts else f"未知状态 ({status})"
+
+
+class Spooler:
+    """后台处理程序接口"""
+
+    def open_printer(self, printer_name):
+        raise NotImplementedError
+
+    def close_printer(self, handle):
+        raise NotImplementedError
+
+    def enum_jobs(self, handle):
+        """返回 [{'JobId', 'Status', 'pDocument'}, ...]"""
+        raise NotImplementedError
+
+    def wait_for_change(self, handle, timeout):
+        """等待队列变化，返回是否收到通知；不支持通知时直接等待 timeout 秒"""
+        time.sleep(timeout)
+        return False
+
+
+class Win32Spooler(Spooler):
+    """基于 pywin32 的 Windows 后台处理程序"""
+
+    def __init__(self):
+        import win32print
+        import win32event
+        self._win32print = win32print
+        self._win32event = win32event
+        self._notifications = {}
+
+    def open_printer(self, printer_name):
+        return self._win32print.OpenPrinter(printer_name)
+
+    def close_printer(self, handle):
+        notification = self._notifications.pop(handle, None)
+        if notification is not None:
+            self._win32print.FindClosePrinterChangeNotification(notification)
+        self._win32print.ClosePrinter(handle)
+
+    def enum_jobs(self, handle):
+        return self._win32print.EnumJobs(handle, 0, -1, 1)
+
+    def wait_for_change(self, handle, timeout):
+        notification = self._notifications.get(handle)
+        if notification is None:
+            notification = self._win32print.FindFirstPrinterChangeNotification(
+                handle, self._win32print.PRINTER_CHANGE_JOB, 0, None)
+            self._notifications[handle] = notification
+        result = self._win32event.WaitForSingleObject(notification, int(timeout * 1000))
+        if result == self._win32event.WAIT_OBJECT_0:
+            self._win32print.FindNextPrinterChangeNotification(notification, 0)
+            return True
+        return False
+
+
+class FakeSpooler(Spooler):
+    """内存中的模拟后台处理程序，可手动推进作业状态"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self._queues = defaultdict(dict)  # 打印机名 -> {job_id: job}
+        self._versions = defaultdict(int)
+        self.enum_calls = 0
+
+    def add_job(self, printer_name, document, status=JOB_STATUS_SPOOLING):
+        with self._cond:
+            job_id = next(self._ids)
+            self._queues[printer_name][job_id] = {
+                'JobId': job_id, 'Status': status, 'pDocument': document}
+            self._changed(printer_name)
+            return job_id
+
+    def set_status(self, printer_name, job_id, status):
+        with self._cond:
+            self._queues[printer_name][job_id]['Status'] = status
+            self._changed(printer_name)
+
+    def remove_job(self, printer_name, job_id):
+        with self._cond:
+            self._queues[printer_name].pop(job_id, None)
+            self._changed(printer_name)
+
+    def _changed(self, printer_name):
+        self._versions[printer_name] += 1
+        self._cond.notify_all()
+
+    def open_printer(self, printer_name):
+        return [printer_name, self._versions[printer_name]]
+
+    def close_printer(self, handle):
+        pass
+
+    def enum_jobs(self, handle):
+        with self._cond:
+            self.enum_calls += 1
+            return [dict(job) for job in self._queues[handle[0]].values()]
+
+    def wait_for_change(self, handle, timeout):
+        printer_name = handle[0]
+        with self._cond:
+            changed = self._cond.wait_for(
+                lambda: self._versions[printer_name] != handle[1], timeout)
+            handle[1] = self._versions[printer_name]
+            return changed
+
+
+class JobTracker:
+    """作业跟踪接口：track 登记一个 spooler 作业，结束时回调 on_done(success, reason)"""
+
+    def __init__(self, spooler, interval=0.5, log=None):
+        self.spooler = spooler
+        self.interval = interval
+        self._log = log or (lambda message: None)
+        self._lock = threading.Lock()
+        self._outstanding = defaultdict(dict)  # 打印机名 -> {spool_job_id: 跟踪记录}
+        self.queue_depth = {}  # 打印机名 -> 最近一次检查时的队列长度
+        self._stopped = threading.Event()
+
+    def track(self, printer_name, spool_job_id, on_done, on_status=None):
+        with self._lock:
+            self._outstanding[printer_name][spool_job_id] = {
+                'on_done': on_done, 'on_status': on_status, 'last_status': None}
+        self._wake(printer_name)
+
+    def untrack(self, printer_name, spool_job_id):
+        with self._lock:
+            self._outstanding[printer_name].pop(spool_job_id, None)
+
+    def outstanding(self):
+        with self._lock:
+            return sum(len(jobs) for jobs in self._outstanding.values())
+
+    def _wake(self, printer_name):
+        pass
+
+    def check_printer(self, printer_name, handle):
+        """对一台打印机执行一次 EnumJobs，批量结算该打印机上所有未完成作业"""
+        with self._lock:
+            if not self._outstanding.get(printer_name):
+                return
+        jobs = self.spooler.enum_jobs(handle)
+        self.queue_depth[printer_name] = len(jobs)
+        queued = {job['JobId']: job for job in jobs}
+        finished = []
+        changed = []
+        with self._lock:
+            tracked = self._outstanding.get(printer_name, {})
+            for spool_job_id, record in list(tracked.items()):
+                job = queued.get(spool_job_id)
+                if job is None:
+                    # 作业ID已离开队列：已打印完成并被后台处理程序删除
+                    finished.append((record, True, "已离开打印队列"))
+                    del tracked[spool_job_id]
+                    continue
+                status = job['Status']
+                if status & ERROR_MASK:
+                    finished.append((record, False, job_status_text(status)))
+                    del tracked[spool_job_id]
+                elif status & DONE_MASK:
+                    finished.append((record, True, job_status_text(status)))
+                    del tracked[spool_job_id]
+                elif status != record['last_status']:
+                    record['last_status'] = status
+                    if record['on_status']:
+                        changed.append((record['on_status'], spool_job_id, status))
+        for on_status, spool_job_id, status in changed:
+            on_status(spool_job_id, job_status_text(status))
+        for record, success, reason in finished:
+            try:
+                record['on_done'](success, reason)
+            except Exception as e:
+                self._log(f"作业跟踪回调异常: {e}")
+
+    def start(self):
+        raise NotImplementedError
+
+    def stop(self):
+        self._stopped.set()
+
+
+class PollingJobTracker(JobTracker):
+    """单线程轮询：每个周期对每台有未完成作业的打印机只枚举一次"""
+
+    def __init__(self, spooler, interval=0.5, log=None):
+        super().__init__(spooler, interval, log)
+        self._handles = {}
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="job-tracker")
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.tick()
+        for handle in self._handles.values():
+            self.spooler.close_printer(handle)
+
+    def tick(self):
+        with self._lock:
+            printers = [name for name, jobs in self._outstanding.items() if jobs]
+        for printer_name in printers:
+            try:
+                handle = self._handles.get(printer_name)
+                if handle is None:
+                    handle = self._handles[printer_name] = self.spooler.open_printer(printer_name)
+                self.check_printer(printer_name, handle)
+            except Exception as e:
+                self._log(f"检查打印状态失败: {printer_name}: {str(e)}")
+                handle = self._handles.pop(printer_name, None)
+                if handle is not None:
+                    try:
+                        self.spooler.close_printer(handle)
+                    except Exception:
+                        pass
+
+
+class NotifyJobTracker(JobTracker):
+    """事件驱动：每台有未完成作业的打印机一个等待线程，队列变化时立即检查
+
+    interval 作为通知等待的超时时间，兼做漏通知时的兜底轮询。
+    """
+
+    def __init__(self, spooler, interval=2.0, log=None):
+        super().__init__(spooler, interval, log)
+        self._watchers = {}
+
+    def start(self):
+        return self
+
+    def _wake(self, printer_name):
+        with self._lock:
+            watcher = self._watchers.get(printer_name)
+            if watcher is not None and watcher.is_alive():
+                return
+            watcher = threading.Thread(target=self._watch, args=(printer_name,),
+                                       daemon=True, name=f"job-watch-{printer_name}")
+            self._watchers[printer_name] = watcher
+        watcher.start()
+
+    def _watch(self, printer_name):
+        handle = None
+        while not self._stopped.is_set():
+            try:
+                if handle is None:
+                    handle = self.spooler.open_printer(printer_name)
+                self.check_printer(printer_name, handle)
+                with self._lock:
+                    if not self._outstanding.get(printer_name):
+                        self._watchers.pop(printer_name, None)
+                        break
+                self.spooler.wait_for_change(handle, self.interval)
+            except Exception as e:
+                self._log(f"检查打印状态失败: {printer_name}: {str(e)}")
+                if handle is not None:
+                    try:
+                        self.spooler.close_printer(handle)
+                    except Exception:
+                        pass
+                    handle = None
+                self._stopped.wait(self.interval)
+        if handle is not None:
+            self.spooler.close_printer(handle)
@@ -0,0 +1,210 @@
+"""作业日志（持久化）
+
+把作业的提交、重试和结束追加写入一个紧凑的二进制日志，进程崩溃或重启后
+回放日志即可恢复各打印机的计数器和未完成的作业。写入先进入内存缓冲区，
+由后台线程每 sync_interval 秒统一写盘并 fsync 一次（组提交）；文件超过
+compact_bytes 时只保留计数器和未完成作业重写一遍。
+
+记录格式：类型(1字节) 长度(I) CRC32(I) JSON
+    S 提交的作业  R 重试  E 结束  C 计数器快照（压缩或重置计数时写入）
+"""
+import json
+import os
+import struct
+import threading
+import zlib
+from collections import defaultdict
+
+from autoprint.engine import PRIORITY_NORMAL
+
+_HEADER = struct.Struct('<cII')
+
+# 恢复作业所需的字段，其余为运行时状态
+_JOB_FIELDS = ('id', 'key', 'printer', 'doc_path', 'copies', 'priority', 'backend',
+               'copy_mode', 'cut', 'payload_size', 'usb', 'confirm', 'timeout', 'enqueue_ts')
+_COUNTERS = ('success', 'failed', 'timeouts', 'retries')
+
+
+def _empty_counters():
+    return dict.fromkeys(_COUNTERS, 0)
+
+
+class JobJournal:
+    """path: 日志文件路径；sync_interval: 组提交间隔（秒）；compact_bytes: 触发压缩的文件大小"""
+
+    def __init__(self, path, sync_interval=0.5, compact_bytes=4 * 1024 * 1024, log=None):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.compact_bytes = compact_bytes
+        self._log = log or (lambda message: None)
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._live = {}  # job_id -> 提交记录（未结束的作业）
+        self._counters = defaultdict(_empty_counters)
+        self.max_id = 0
+        self.records_written = 0
+        self.syncs = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._replay()
+        self._file = open(path, 'ab')
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="job-journal")
+        self._thread.start()
+
+    # ---- 回放 ----
+
+    def _replay(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        offset = 0
+        while offset + _HEADER.size <= len(data):
+            kind, length, crc = _HEADER.unpack_from(data, offset)
+            payload = data[offset + _HEADER.size:offset + _HEADER.size + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            try:
+                self._apply(kind, json.loads(payload))
+            except (ValueError, KeyError, TypeError):
+                break
+            offset += _HEADER.size + length
+        if offset < len(data):
+            # 崩溃时写了一半的尾部记录：截断，后续追加不会接在损坏数据之后
+            self._log(f"作业日志尾部有 {len(data) - offset} 字节不完整，已截断")
+            with open(self.path, 'r+b') as f:
+                f.truncate(offset)
+
+    def _apply(self, kind, record):
+        if kind == b'S':
+            self._live[record['id']] = record
+            self.max_id = max(self.max_id, record['id'])
+        elif kind == b'R':
+            self._counters[record['printer']]['retries'] += 1
+        elif kind == b'E':
+            self._live.pop(record['id'], None)
+            counters = self._counters[record['printer']]
+            if record['status'] == 'done':
+                counters['success'] += 1
+            else:
+                counters['failed'] += 1
+                if record['status'] == 'timeout':
+                    counters['timeouts'] += 1
+        elif kind == b'C':
+            self._counters.clear()
+            for printer, counters in record['counters'].items():
+                self._counters[printer].update(counters)
+        else:
+            raise ValueError(kind)
+
+    # ---- 写入 ----
+
+    @staticmethod
+    def _encode(kind, record):
+        payload = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return _HEADER.pack(kind, len(payload), zlib.crc32(payload)) + payload
+
+    def _append(self, kind, record):
+        with self._lock:
+            self._apply(kind, record)
+            self._buffer += self._encode(kind, record)
+            self.records_written += 1
+
+    def on_submit(self, job):
+        self._append(b'S', {field: job.get(field) for field in _JOB_FIELDS
+                            if job.get(field) is not None})
+
+    def on_retry(self, job):
+        self._append(b'R', {'id': job['id'], 'printer': job['printer'],
+                            'failure': job.get('failure')})
+
+    def on_finished(self, job):
+        self._append(b'E', {'id': job['id'], 'printer': job['printer'], 'status': job['status'],
+                            'failure': job.get('failure'), 'attempts': job.get('attempts')})
+
+    def reset_counters(self):
+        """与 PrintEngine.reset_counters 一起调用"""
+        self._append(b'C', {'counters': {}})
+
+    def _run(self):
+        while not self._stopped.wait(self.sync_interval):
+            try:
+                self.sync()
+                if self._file.tell() > self.compact_bytes:
+                    self.compact()
+            except Exception as e:
+                self._log(f"写入作业日志失败: {str(e)}")
+
+    def sync(self):
+        """把缓冲区写入文件并 fsync"""
+        with self._lock:
+            if not self._buffer or self._file is None:
+                return
+            data, self._buffer = bytes(self._buffer), bytearray()
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.syncs += 1
+
+    def compact(self):
+        """只保留计数器快照和未完成的作业，重写日志文件"""
+        with self._lock:
+            if self._file is None:
+                return
+            records = [self._encode(b'C', {'counters': dict(self._counters)})]
+            records.extend(self._encode(b'S', record) for record in self._live.values())
+            # 缓冲区中的记录已由 _append 应用到计数器和未完成作业中，快照已包含它们，不能再写一遍
+            self._buffer = bytearray()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(b''.join(records))
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, 'ab')
+
+    # ---- 与打印引擎对接 ----
+
+    def counters(self):
+        with self._lock:
+            return {printer: dict(counters) for printer, counters in self._counters.items()}
+
+    def unfinished(self):
+        with self._lock:
+            return [dict(record) for record in self._live.values()]
+
+    def attach(self, engine, resubmit=True):
+        """恢复引擎计数器、注册回调，并重新提交上次未完成的作业；返回重新提交的作业"""
+        recovered = self.unfinished()
+        engine.restore(self.counters(), self.max_id + 1)
+        with self._lock:
+            self._live.clear()
+        self.compact()
+        engine.add_submit_listener(self.on_submit)
+        engine.add_retry_listener(self.on_retry)
+        engine.add_listener(self.on_finished)
+        if not resubmit:
+            return []
+        jobs = []
+        for record in sorted(recovered, key=lambda record: record['id']):
+            extra = {field: record[field] for field in ('backend', 'copy_mode', 'cut', 'payload_size',
+                                                         'usb', 'confirm', 'timeout') if field in record}
+            jobs.append(engine.submit(record['printer'], record['doc_path'], record.get('copies', 1),
+                                      priority=record.get('priority', PRIORITY_NORMAL),
+                                      key=record.get('key'), **extra))
+        if jobs:
+            self._log(f"从作业日志恢复了 {len(jobs)} 个未完成的作业")
+        return jobs
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join()
+        self.sync()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,316 @@
+"""负载生成：按目标速率向每台打印机提交作业，找出后台处理程序或设备开始饱和的速率
+
+负载曲线（命令行的 --profile）:
+    sustained 10/s 60s          持续 60 秒，每台打印机每秒 10 个作业
+    ramp 1-50/s 120s            120 秒内从每秒 1 个线性升到 50 个
+    step 5,10,20,40/s 30s       每级 30 秒
+    spike 10:100/s 60s 5s       基础 10/s，正中间 5 秒突增到 100/s
+速率单位可以是 /s、/min（作业数），也可以是 B/s、KB/s、MB/s（字节数，按每个作业的数据量换算）。
+
+开环（默认）按时刻提交，不等待之前的作业完成，跟不上时积压在打印引擎的队列中；
+闭环时每台打印机最多 concurrency 个未完成作业，目标速率只是上限，来不及提交的作业直接放弃。
+作业经 PrintEngine 和现有后端（RAW/TCP/模拟）发送。按 window 秒分窗统计目标速率、提交数、
+完成数和延迟：完成数连续两个窗口低于目标的 (1 - tolerance)（目标按开始时的 p50 延迟平移），
+或 p95 延迟超过开始时的 latency_factor 倍时，判定为饱和。
+"""
+import math
+import re
+import threading
+import time
+
+_RATE = re.compile(r'([\d.,:\-]+)\s*(b|kb|mb)?/(s|sec|min)')
+_DURATION = re.compile(r'(\d+(?:\.\d+)?)\s*(s|m|min|h)?')
+_BYTE_UNITS = {None: None, 'b': 1, 'kb': 1024, 'mb': 1024 * 1024}
+_DURATION_UNITS = {None: 1.0, 's': 1.0, 'm': 60.0, 'min': 60.0, 'h': 3600.0}
+PROFILE_KINDS = ('sustained', 'ramp', 'step', 'spike')
+
+
+def _duration(text):
+    match = _DURATION.fullmatch(text)
+    if not match:
+        raise ValueError(f"无法识别的时长: {text}")
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+
+class LoadProfile:
+    """目标速率随时间的变化；rates 的含义由 kind 决定，unit_bytes 不为 None 时速率为字节/秒"""
+
+    def __init__(self, kind, rates, duration, peak_seconds=0.0, unit_bytes=None, spec=None):
+        if kind not in PROFILE_KINDS:
+            raise ValueError(f"未知的负载曲线: {kind}（可选 {'/'.join(PROFILE_KINDS)}）")
+        if duration <= 0 or any(rate < 0 for rate in rates):
+            raise ValueError("时长必须大于0，速率不能为负")
+        self.kind = kind
+        self.rates = [float(rate) for rate in rates]
+        self.step = float(duration)
+        # step 的 duration 为每级时长
+        self.duration = self.step * len(self.rates) if kind == 'step' else self.step
+        self.peak_seconds = min(peak_seconds, self.duration)
+        self.unit_bytes = unit_bytes
+        self.spec = spec or kind
+
+    def __str__(self):
+        return self.spec
+
+    def rate(self, t):
+        """t 秒时的目标速率"""
+        t = min(max(t, 0.0), self.duration)
+        if self.kind == 'sustained':
+            return self.rates[0]
+        if self.kind == 'ramp':
+            start, end = self.rates
+            return start + (end - start) * t / self.duration
+        if self.kind == 'step':
+            return self.rates[min(int(t / self.step), len(self.rates) - 1)]
+        base, peak = self.rates
+        spike_start = (self.duration - self.peak_seconds) / 2
+        return peak if spike_start <= t < spike_start + self.peak_seconds else base
+
+    def amount(self, t):
+        """0 到 t 秒应提交的总量（速率的积分），开环按它决定提交时刻，不累积误差"""
+        t = min(max(t, 0.0), self.duration)
+        if self.kind == 'sustained':
+            return self.rates[0] * t
+        if self.kind == 'ramp':
+            start, end = self.rates
+            return start * t + (end - start) * t * t / (2 * self.duration)
+        if self.kind == 'step':
+            full = min(int(t / self.step), len(self.rates) - 1)
+            return sum(self.rates[:full]) * self.step + self.rates[full] * (t - full * self.step)
+        base, peak = self.rates
+        spike_start = (self.duration - self.peak_seconds) / 2
+        overlap = max(0.0, min(t, spike_start + self.peak_seconds) - spike_start)
+        return base * t + (peak - base) * overlap
+
+
+def parse_profile(text):
+    """解析负载曲线字符串，格式错误时抛出 ValueError"""
+    spec = " ".join(str(text).split())
+    parts = spec.lower().split()
+    if len(parts) < 3 or parts[0] not in PROFILE_KINDS:
+        raise ValueError(f"无法识别的负载曲线: {text}（示例: ramp 1-50/s 120s、step 5,10,20/s 30s）")
+    kind = parts[0]
+    match = _RATE.fullmatch(parts[1])
+    if not match:
+        raise ValueError(f"无法识别的速率: {parts[1]}（示例: 10/s、120/min、512KB/s）")
+    separator = {'ramp': '-', 'step': ',', 'spike': ':'}.get(kind)
+    try:
+        rates = [float(value) for value in (match.group(1).split(separator) if separator else [match.group(1)])]
+    except ValueError:
+        raise ValueError(f"无法识别的速率: {parts[1]}")
+    expected = {'sustained': 1, 'ramp': 2, 'spike': 2}.get(kind)
+    if (expected and len(rates) != expected) or not rates:
+        raise ValueError(f"{kind} 需要 {expected} 个速率: {parts[1]}")
+    if match.group(3) == 'min':
+        rates = [rate / 60.0 for rate in rates]
+    peak_seconds = 0.0
+    if kind == 'spike':
+        peak_seconds = _duration(parts[3]) if len(parts) > 3 else _duration(parts[2]) / 10
+    return LoadProfile(kind, rates, _duration(parts[2]), peak_seconds,
+                       _BYTE_UNITS[match.group(2)], spec)
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))]
+
+
+class _Window:
+    def __init__(self, start):
+        self.start = start
+        self.target = 0.0  # 目标作业数（全部打印机）
+        self.submitted = 0
+        self.dropped = 0  # 闭环时来不及提交而放弃的作业数
+        self.completed = 0
+        self.failed = 0
+        self.bytes = 0
+        self.latencies = []
+        self.backlog = 0  # 窗口结束时未完成的作业数
+
+
+class LoadGenerator:
+    """engine: PrintEngine；submit(printer_name, **extra) 把 extra 加入作业字典并提交；
+    job_bytes: 每个作业的数据量，用于把字节/秒换算为作业/秒。
+    """
+
+    def __init__(self, engine, printers, submit, profile, job_bytes=0, closed_loop=False,
+                 concurrency=1, window=1.0, tolerance=0.1, latency_factor=3.0, tick=0.002, log=None):
+        if profile.unit_bytes and job_bytes <= 0:
+            raise ValueError("按字节速率生成负载需要知道每个作业的数据量")
+        self.engine = engine
+        self.printers = list(printers)
+        self._submit = submit
+        self.profile = profile
+        self.job_bytes = job_bytes
+        self.closed_loop = closed_loop
+        self.concurrency = concurrency
+        self.window = window
+        self.tolerance = tolerance
+        self.latency_factor = latency_factor
+        self.tick = tick
+        self._log = log or (lambda message: None)
+        self._lock = threading.Lock()
+        self._outstanding = {name: 0 for name in self.printers}
+        self._tag = id(self)  # 作业字典中的 loadgen 字段，区分本次生成的作业
+        self._windows = []
+        self._origin = None
+        self._stopped = threading.Event()
+        engine.add_listener(self._on_finished)
+
+    def _jobs_for(self, amount):
+        # 速率为字节/秒时按每个作业的数据量换算
+        return amount * self.profile.unit_bytes / self.job_bytes if self.profile.unit_bytes else amount
+
+    def _window_at(self, t):
+        # 调用方持有 self._lock
+        index = max(0, int(t / self.window))
+        while len(self._windows) <= index:
+            self._windows.append(_Window(len(self._windows) * self.window))
+        return self._windows[index]
+
+    def _on_finished(self, job):
+        with self._lock:
+            if job.get('loadgen') != self._tag:
+                return
+            self._outstanding[job['printer']] -= 1
+            window = self._window_at(time.monotonic() - self._origin)
+            if job['status'] == 'done':
+                window.completed += 1
+                window.bytes += job.get('bytes') or 0
+                window.latencies.append(job['end_ts'] - job['enqueue_ts'])
+            else:
+                window.failed += 1
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self, drain=30.0):
+        """按负载曲线提交作业，结束后最多等待 drain 秒让积压的作业完成，返回 report()"""
+        self._origin = time.monotonic()
+        sent = {name: 0 for name in self.printers}
+        last_window = -1
+        while not self._stopped.is_set():
+            t = time.monotonic() - self._origin
+            if t >= self.profile.duration:
+                break
+            due = math.floor(self._jobs_for(self.profile.amount(t)))
+            for name in self.printers:
+                while sent[name] < due:
+                    sent[name] += 1
+                    with self._lock:
+                        window = self._window_at(t)
+                        if self.closed_loop and self._outstanding[name] >= self.concurrency:
+                            window.dropped += 1
+                            continue
+                        self._outstanding[name] += 1
+                        window.submitted += 1
+                    self._submit(name, loadgen=self._tag)
+            index = int(t / self.window)
+            if index != last_window:
+                self._close_windows(index)
+                last_window = index
+            self._stopped.wait(self.tick)
+        end = self.profile.duration
+        with self._lock:
+            self._window_at(end - 1e-9)
+        self._close_windows(int(end / self.window) + 1)
+        deadline = time.monotonic() + drain
+        while self.outstanding() and time.monotonic() < deadline and not self._stopped.is_set():
+            time.sleep(0.05)
+        return self.report()
+
+    def _close_windows(self, index):
+        # 记录已经结束的窗口的目标作业数和积压
+        closed = []
+        with self._lock:
+            backlog = sum(self._outstanding.values())
+            for window in self._windows[:index]:
+                if window.target:
+                    continue
+                end = min(window.start + self.window, self.profile.duration)
+                window.target = (self._jobs_for(self.profile.amount(end) - self.profile.amount(window.start))
+                                 * len(self.printers))
+                window.backlog = backlog
+                closed.append(window)
+        for window in closed:
+            self._log(f"{window.start:6.1f}s 目标 {window.target / self.window:.1f}/s  "
+                      f"提交 {window.submitted / self.window:.1f}/s  完成 {window.completed / self.window:.1f}/s  "
+                      f"积压 {window.backlog}")
+
+    def outstanding(self):
+        with self._lock:
+            return sum(self._outstanding.values())
+
+    def report(self):
+        """每个窗口的统计和饱和点（saturation 为 None 表示在目标速率范围内没有饱和）"""
+        with self._lock:
+            windows = [window for window in self._windows if window.start < self.profile.duration]
+            rows = []
+            for window in windows:
+                latencies = sorted(window.latencies)
+                rows.append({
+                    'start': window.start,
+                    'target_rate': window.target / self.window,
+                    'submitted_rate': window.submitted / self.window,
+                    'completed_rate': window.completed / self.window,
+                    'bytes_rate': window.bytes / self.window,
+                    'dropped': window.dropped,
+                    'failed': window.failed,
+                    'backlog': window.backlog,
+                    'p50': _percentile(latencies, 50),
+                    'p95': _percentile(latencies, 95),
+                })
+            outstanding = sum(self._outstanding.values())
+        early = [row for row in rows[:3] if row['p95'] is not None]
+        baseline = sorted(row['p95'] for row in early)[len(early) // 2] if early else None
+        # 未饱和时作业也要经过一段基础延迟才完成：与按开始时的 p50 延迟平移后的目标比较
+        lag = sorted(row['p50'] for row in early)[len(early) // 2] if early else 0.0
+        for row in rows:
+            start = row['start'] - lag
+            expected = self.profile.amount(start + self.window) - self.profile.amount(start)
+            row['expected_rate'] = self._jobs_for(expected) * len(self.printers) / self.window
+        saturation = None
+        for index, row in enumerate(rows):
+            if row['target_rate'] <= row['completed_rate']:
+                continue  # 本窗口的完成速率已经达到目标，延迟平移的偏差不能把它判定为饱和点
+            behind = [r['completed_rate'] < r['expected_rate'] * (1 - self.tolerance)
+                      for r in rows[index:index + 2] if r['expected_rate'] > 0]
+            throughput = len(behind) == 2 and all(behind)
+            latency = (baseline is not None and row['p95'] is not None
+                       and row['p95'] > max(baseline * self.latency_factor, baseline + self.window / 10))
+            if throughput or latency:
+                saturation = dict(row, reason="完成速率跟不上目标速率" if throughput else "p95 延迟上升")
+                break
+        peak = max(rows, key=lambda row: row['completed_rate']) if rows else None
+        return {
+            'windows': rows,
+            'saturation': saturation,
+            'peak_rate': peak['completed_rate'] if peak else 0.0,
+            'peak_bytes_rate': max((row['bytes_rate'] for row in rows), default=0.0),
+            'baseline_p95': baseline,
+            'outstanding': outstanding,
+        }
+
+
+def format_report(report, printers=1):
+    """把 report() 的结果格式化为日志行"""
+    lines = ["  时刻    目标/s   提交/s   完成/s      字节/s  积压  放弃  失败   p50(s)   p95(s)"]
+    for row in report['windows']:
+        p50 = f"{row['p50']:8.3f}" if row['p50'] is not None else "       -"
+        p95 = f"{row['p95']:8.3f}" if row['p95'] is not None else "       -"
+        lines.append(f"{row['start']:6.1f} {row['target_rate']:9.1f} {row['submitted_rate']:8.1f} "
+                     f"{row['completed_rate']:8.1f} {row['bytes_rate']:11.0f} {row['backlog']:5d} "
+                     f"{row['dropped']:5d} {row['failed']:5d} {p50} {p95}")
+    lines.append(f"最高完成速率 {report['peak_rate']:.1f} 作业/秒（每台打印机 {report['peak_rate'] / printers:.1f}），"
+                 f"{report['peak_bytes_rate']:.0f} 字节/秒")
+    saturation = report['saturation']
+    if saturation is None:
+        lines.append("在目标速率范围内没有出现饱和")
+    else:
+        lines.append(f"饱和点: {saturation['start']:.1f} 秒，目标 {saturation['target_rate']:.1f} 作业/秒"
+                     f"（每台打印机 {saturation['target_rate'] / printers:.1f}），"
+                     f"完成 {saturation['completed_rate']:.1f} 作业/秒，{saturation['reason']}")
+    if report['outstanding']:
+        lines.append(f"结束时仍有 {report['outstanding']} 个作业未完成")
+    return lines
@@ -0,0 +1,138 @@
+"""结构化、带缓冲的日志管道
+
+任意线程调用 log() 只做一次加锁入队；GUI 定时批量取出待显示的记录，
+后台线程把记录批量写入按大小轮转的 JSONL 文件。内存中只保留固定条数的环形缓冲。
+"""
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+
+def format_record(record):
+    return f"[{record['ts']}] {record['msg']}"
+
+
+class JsonlRotatingSink:
+    """按大小轮转的 JSONL 日志文件：path, path.1, path.2 ...（数字越大越旧）"""
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, records):
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False))
+            self._file.write('\n')
+        self._file.flush()
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def files(self):
+        """按时间顺序（旧到新）返回现有的日志文件"""
+        backups = [f"{self.path}.{index}" for index in range(self.backup_count, 0, -1)]
+        return [path for path in backups + [self.path] if os.path.exists(path)]
+
+    def iter_records(self):
+        for path in self.files():
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+    def close(self):
+        self._file.close()
+
+
+class LogPipeline:
+    """capacity: 内存环形缓冲条数；pending_limit: 等待GUI显示的最大条数（超出丢弃最旧的）；
+    echo(line): 可选，每条记录同步输出（如无界面模式打印到控制台）。
+    """
+
+    def __init__(self, file_path=None, capacity=10000, pending_limit=5000,
+                 flush_interval=0.5, max_bytes=10 * 1024 * 1024, backup_count=5, echo=None):
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.records = deque(maxlen=capacity)
+        self._pending_view = deque(maxlen=pending_limit)
+        self._pending_file = []
+        self._echo = echo
+        self.sink = JsonlRotatingSink(file_path, max_bytes, backup_count) if file_path else None
+        self._stopped = threading.Event()
+        self._flush_interval = flush_interval
+        self._thread = None
+        if self.sink:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="log-writer")
+            self._thread.start()
+
+    def log(self, message, level="info", **fields):
+        record = {'ts': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                  'level': level, 'msg': message}
+        if fields:
+            record.update(fields)
+        with self._lock:
+            self.records.append(record)
+            self._pending_view.append(record)
+            if self.sink:
+                self._pending_file.append(record)
+        if self._echo:
+            self._echo(format_record(record))
+
+    def drain_view(self):
+        """取出所有尚未显示的记录"""
+        with self._lock:
+            records = list(self._pending_view)
+            self._pending_view.clear()
+        return records
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                records, self._pending_file = self._pending_file, []
+            if records and self.sink:
+                self.sink.write(records)
+
+    def _run(self):
+        while not self._stopped.wait(self._flush_interval):
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def iter_lines(self):
+        """按时间顺序逐行输出全部日志；有日志文件时从文件流式读取"""
+        if self.sink:
+            self.flush()
+            for record in self.sink.iter_records():
+                yield format_record(record)
+        else:
+            with self._lock:
+                records = list(self.records)
+            for record in records:
+                yield format_record(record)
+
+    def close(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+        if self.sink:
+            self.flush()
+            self.sink.close()
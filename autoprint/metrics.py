@@ -0,0 +1,210 @@
+"""打印作业指标的时间序列存储
+
+每个结束的作业记录为一条定长记录，按列保存在 array 中（每条约 50 字节），
+可选同时追加写入二进制文件，便于 72 小时长测后离线分析。
+记录按完成时间追加，窗口查询用二分查找定位起点。
+"""
+import bisect
+import math
+import struct
+import threading
+import time
+from array import array
+
+OUTCOME_SUCCESS = 0
+OUTCOME_FAILED = 1
+OUTCOME_TIMEOUT = 2
+
+_OUTCOMES = {'done': OUTCOME_SUCCESS, 'failed': OUTCOME_FAILED, 'timeout': OUTCOME_TIMEOUT}
+_OUTCOME_NAMES = {value: key for key, value in _OUTCOMES.items()}
+
+# 文件格式：每条记录以类型字节开头
+#   b'S' 字符串表：种类(B) 编号(H) 长度(H) UTF-8
+#   b'J' 作业：入队/开始/进入队列/完成时间(4d) 打印机/文档(2H) 后端(B) 份数(H) 结果(B) 字节数(Q)
+_STRING = struct.Struct('<BHH')
+_JOB = struct.Struct('<4d2HBHBQ')
+_KIND_PRINTER, _KIND_DOCUMENT, _KIND_BACKEND = 0, 1, 2
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    # 最近秩法
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class JobMetricsStore:
+    """capacity: 内存中最多保留的记录数，超过后丢弃最旧的一半"""
+
+    def __init__(self, path=None, capacity=1000000):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._strings = ([], [], [])  # 种类 -> 编号 -> 字符串
+        self._string_ids = ({}, {}, {})
+        self.enqueue = array('d')
+        self.start = array('d')
+        self.spooled = array('d')
+        self.complete = array('d')
+        self.printer = array('H')
+        self.document = array('H')
+        self.backend = array('B')
+        self.copies = array('H')
+        self.outcome = array('B')
+        self.nbytes = array('Q')
+        self._columns = (self.enqueue, self.start, self.spooled, self.complete, self.printer,
+                         self.document, self.backend, self.copies, self.outcome, self.nbytes)
+        self.path = path
+        self._file = None
+        if path:
+            self._load(path)
+            self._file = open(path, 'ab')
+
+    def _intern(self, kind, value, pending):
+        value = value or ""
+        ids = self._string_ids[kind]
+        string_id = ids.get(value)
+        if string_id is None:
+            string_id = ids[value] = len(self._strings[kind])
+            self._strings[kind].append(value)
+            if pending is not None:
+                encoded = value.encode('utf-8')
+                pending.append(b'S' + _STRING.pack(kind, string_id, len(encoded)) + encoded)
+        return string_id
+
+    def record(self, job):
+        """记录一个已结束的作业（PrintEngine 监听器）"""
+        end = job.get('end_ts') or time.time()
+        start = job.get('start_ts') or end
+        values = (job.get('enqueue_ts') or start, start, job.get('spooled_ts') or end, end)
+        with self._lock:
+            pending = [] if self._file else None
+            row = values + (
+                self._intern(_KIND_PRINTER, job.get('printer'), pending),
+                self._intern(_KIND_DOCUMENT, job.get('document'), pending),
+                self._intern(_KIND_BACKEND, job.get('backend'), pending),
+                min(job.get('copies') or 1, 0xFFFF),
+                _OUTCOMES.get(job.get('status'), OUTCOME_FAILED),
+                job.get('bytes') or 0,
+            )
+            self._append(row)
+            if self._file:
+                pending.append(b'J' + _JOB.pack(*row))
+                self._file.write(b''.join(pending))
+
+    def _append(self, row):
+        # 完成时间偶尔会因线程调度略微乱序，插入到正确位置以保证二分查找有效
+        if self.complete and row[3] < self.complete[-1]:
+            index = bisect.bisect_right(self.complete, row[3])
+            for column, value in zip(self._columns, row):
+                column.insert(index, value)
+        else:
+            for column, value in zip(self._columns, row):
+                column.append(value)
+        if len(self.complete) > self.capacity:
+            drop = len(self.complete) // 2
+            for column in self._columns:
+                del column[:drop]
+
+    def _load(self, path):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        offset = 0
+        while offset < len(data):
+            tag = data[offset:offset + 1]
+            offset += 1
+            if tag == b'S' and offset + _STRING.size <= len(data):
+                kind, string_id, length = _STRING.unpack_from(data, offset)
+                offset += _STRING.size
+                value = data[offset:offset + length].decode('utf-8')
+                offset += length
+                strings = self._strings[kind]
+                while len(strings) <= string_id:
+                    strings.append("")
+                strings[string_id] = value
+                self._string_ids[kind][value] = string_id
+            elif tag == b'J' and offset + _JOB.size <= len(data):
+                self._append(_JOB.unpack_from(data, offset))
+                offset += _JOB.size
+            else:
+                break  # 文件尾部写入不完整（如进程崩溃），忽略剩余部分
+
+    def flush(self):
+        with self._lock:
+            if self._file:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def __len__(self):
+        return len(self.complete)
+
+    def _window(self, window, now):
+        now = now or time.time()
+        return bisect.bisect_left(self.complete, now - window), len(self.complete)
+
+    def printers(self):
+        with self._lock:
+            return list(self._strings[_KIND_PRINTER])
+
+    def stats(self, printer=None, window=300, now=None, percentiles=(50, 95, 99)):
+        """返回最近 window 秒内的统计：作业数、成功率、作业/分钟、延迟分位数（秒）
+
+        latency 为入队到完成的总延迟，spool_latency 为开始发送到进入打印队列的延迟。
+        """
+        with self._lock:
+            lo, hi = self._window(window, now)
+            printer_id = None
+            if printer is not None:
+                printer_id = self._string_ids[_KIND_PRINTER].get(printer)
+                if printer_id is None:
+                    lo = hi
+            latencies = []
+            spool_latencies = []
+            success = total = nbytes = 0
+            for i in range(lo, hi):
+                if printer_id is not None and self.printer[i] != printer_id:
+                    continue
+                total += 1
+                nbytes += self.nbytes[i]
+                if self.outcome[i] == OUTCOME_SUCCESS:
+                    success += 1
+                    latencies.append(self.complete[i] - self.enqueue[i])
+                    spool_latencies.append(self.spooled[i] - self.start[i])
+        latencies.sort()
+        spool_latencies.sort()
+        result = {
+            'jobs': total,
+            'success': success,
+            'success_rate': success / total if total else None,
+            'jobs_per_min': total * 60.0 / window,
+            'bytes': nbytes,
+        }
+        for pct in percentiles:
+            result[f'p{pct}'] = _percentile(latencies, pct)
+            result[f'spool_p{pct}'] = _percentile(spool_latencies, pct)
+        return result
+
+    def stats_by_printer(self, window=300, now=None):
+        return {name: self.stats(name, window, now) for name in self.printers() if name}
+
+    def iter_records(self):
+        """按完成时间顺序输出全部记录（字典形式）"""
+        with self._lock:
+            rows = list(zip(*self._columns))
+            strings = tuple(list(table) for table in self._strings)
+        for row in rows:
+            yield {
+                'enqueue_ts': row[0], 'start_ts': row[1], 'spooled_ts': row[2], 'end_ts': row[3],
+                'printer': strings[_KIND_PRINTER][row[4]],
+                'document': strings[_KIND_DOCUMENT][row[5]],
+                'backend': strings[_KIND_BACKEND][row[6]],
+                'copies': row[7], 'outcome': _OUTCOME_NAMES[row[8]], 'bytes': row[9],
+            }
@@ -0,0 +1,192 @@
+"""广域网中继：门店本地代理按内容摘要缓存测试文档
+
+中心测试机通过一条压缩的 TCP 连接向门店的中继代理发送“用摘要 X 打印 N 份”的指令，
+代理在本地缓存中查找文档内容并通过连接池发送到门店的 9100 打印机；
+只有代理缓存中没有的文档才经过广域网传输一次，之后的份数、轮次和打印机都只发送指令。
+
+帧协议见 rpc.py:
+    {"op": "print", "id": 请求ID, "printer": 名称, "hash": sha256, "copies": N, "cut": 十六进制}
+        -> {"ok": true, "bytes": 发送字节数, "elapsed": 秒} / {"ok": false, "missing": true}
+    {"op": "put", "hash": sha256} + 文档内容  -> {"ok": true}
+    {"op": "stats"} -> 代理的缓存与发送统计
+客户端先只发送 print，代理回复 missing 时再把 put 和 print 一起发送（少一次往返）。
+连接超时或断开后客户端会重发请求：代理按请求ID记住最近的打印结果，重复的 print 直接返回
+原来的结果（原请求仍在打印时等待它结束），不会重复打印。
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from autoprint.rpc import RpcClient, RpcError, RpcServer
+from autoprint.tcp_pool import TcpConnectionPool
+
+RELAY_PORT = 9200
+REQUEST_LIMIT = 4096  # 代理记住的最近打印请求数
+
+
+class RelayError(RpcError):
+    pass
+
+
+def payload_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class PayloadStore:
+    """代理端的文档缓存：摘要 -> 内容，按字节预算 LRU 淘汰"""
+
+    def __init__(self, budget_bytes=256 * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest):
+        with self._lock:
+            data = self._entries.get(digest)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return data
+
+    def put(self, digest, data):
+        if payload_hash(data) != digest:
+            raise RelayError("文档内容与摘要不一致")
+        with self._lock:
+            if digest in self._entries:
+                return
+            self._entries[digest] = data
+            self.used_bytes += len(data)
+            while self.used_bytes > self.budget_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.used_bytes -= len(evicted)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class RelayAgent:
+    """门店端中继代理：printers 为 打印机名 -> (ip, port)，打印数据经本地连接池发送"""
+
+    def __init__(self, printers, host="0.0.0.0", port=RELAY_PORT, store=None, pool=None,
+                 compress_level=6, log=None):
+        self.printers = printers
+        self.store = store or PayloadStore()
+        self.pool = pool or TcpConnectionPool(log=log)
+        self._log = log or (lambda message: None)
+        self._lock = threading.Lock()
+        self._requests_cond = threading.Condition()
+        self._requests = OrderedDict()  # 请求ID -> 回复（None 表示仍在打印）
+        self._server = RpcServer(self.handle, host, port, compress_level, log=log)
+        self.jobs = 0
+
+    @property
+    def address(self):
+        return self._server.address
+
+    def handle(self, header, payload):
+        op = header.get('op')
+        try:
+            if op == 'put':
+                self.store.put(header['hash'], payload)
+                return {'ok': True}
+            if op == 'print':
+                return self._print(header)
+            if op == 'stats':
+                return {'ok': True, 'documents': len(self.store), 'bytes': self.store.used_bytes,
+                        'hits': self.store.hits, 'misses': self.store.misses, 'jobs': self.jobs}
+            return {'ok': False, 'error': f"未知的操作: {op}"}
+        except Exception as e:
+            return {'ok': False, 'error': str(e)}
+
+    def _print(self, header):
+        request_id = header.get('id')
+        if not request_id:
+            return self._send_print(header)
+        with self._requests_cond:
+            while request_id in self._requests and self._requests[request_id] is None:
+                self._requests_cond.wait()
+            if request_id in self._requests:
+                return self._requests[request_id]  # 客户端重发的请求，已经打印过
+            self._requests[request_id] = None
+        reply = None
+        try:
+            reply = self._send_print(header)
+            return reply
+        finally:
+            with self._requests_cond:
+                if reply is None or reply.get('missing'):
+                    # 没有打印：出错时由 handle 回复错误，缺文档时上传后同一请求需要重新执行
+                    del self._requests[request_id]
+                else:
+                    self._requests[request_id] = reply
+                # 只淘汰已经结束的请求，仍在打印的请求要留给重发的请求等待
+                while len(self._requests) > REQUEST_LIMIT and next(iter(self._requests.values())) is not None:
+                    self._requests.popitem(last=False)
+                self._requests_cond.notify_all()
+
+    def _send_print(self, header):
+        printer_name = header['printer']
+        if printer_name not in self.printers:
+            return {'ok': False, 'error': f"中继代理未配置打印机: {printer_name}"}
+        data = self.store.get(header['hash'])
+        if data is None:
+            return {'ok': False, 'missing': True}
+        ip, port = self.printers[printer_name]
+        cut = bytes.fromhex(header.get('cut', ''))
+        copies = int(header.get('copies', 1))
+        start = time.perf_counter()
+        self.pool.send(ip, port, data + cut if cut else data, copies)
+        with self._lock:
+            self.jobs += 1
+        elapsed = time.perf_counter() - start
+        self._log(f"中继打印: {printer_name} ({ip}:{port}) {copies}份，用时 {elapsed:.3f} 秒")
+        return {'ok': True, 'bytes': (len(data) + len(cut)) * copies, 'elapsed': elapsed}
+
+    def start(self):
+        self._server.start("relay-agent")
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.stop()
+        self.pool.close_all()
+
+
+class RelayClient(RpcClient):
+    """测试机端：一条到中继代理的持久连接，断开时重连一次"""
+
+    def __init__(self, host, port=RELAY_PORT, compress_level=6, timeout=30):
+        super().__init__(host, port, compress_level, timeout)
+        self.payload_bytes = 0  # 打印机收到的字节数（不经中继时需要传输的量）
+        self.uploads = 0
+
+    def print(self, printer_name, data, copies=1, cut=b''):
+        """打印 data 共 copies 份，返回代理的回复；代理没有该文档时先上传"""
+        data = bytes(data)
+        digest = payload_hash(data)
+        # 同一次打印的所有请求（包括重发）共用一个请求ID，代理据此去重
+        command = self.frame('print', id=uuid.uuid4().hex, printer=printer_name, hash=digest,
+                             copies=copies, cut=cut.hex())
+        reply = self.request([command])[0]
+        if reply.get('missing'):
+            put_reply, reply = self.request([self.frame('put', data, hash=digest), command])
+            if not put_reply.get('ok'):
+                raise RelayError(f"上传文档失败: {put_reply.get('error')}")
+            self.uploads += 1
+        if not reply.get('ok'):
+            raise RelayError(reply.get('error') or "中继打印失败")
+        self.payload_bytes += reply['bytes']
+        return reply
+
+    def stats(self):
+        return self.call('stats')
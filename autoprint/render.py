@@ -0,0 +1,398 @@
+"""进程内文档渲染：把文本/PDF/图片转换为 ESC/POS 打印机的原生数据
+
+txt: 按纸宽折行（中日韩字符占两列），编码为 GB18030 的 ESC/POS 文本，不依赖第三方库；
+pdf: 用 pypdfium2（需要安装）逐页渲染为灰度位图；
+图片: png/jpg/bmp 用 Pillow（需要安装）解码，PGM 灰度图直接读取；
+位图按打印宽度缩放后抖动为黑白（ordered: 8×8 Bayer 有序抖动，threshold: 固定阈值），
+打包为 GS v 0 光栅位图。安装了 NumPy 时抖动和打包整页向量化完成，
+否则按列相位用 bytes.translate 逐行处理（结果相同）。
+
+渲染结果按 (文档内容摘要, 打印点数, DPI, 抖动参数) 缓存在 cache_dir 中，内容相同的文档
+共用一个缓存文件，重启后仍然有效；同一文档同时被多个作业请求时只渲染一次。
+渲染后的数据由 RAW/TCP 后端发送，因此有真实的后台处理程序作业ID（或设备确认），
+不再每份启动一次关联程序。
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.pgm')
+RENDERABLE_EXTENSIONS = ('.txt', '.pdf') + IMAGE_EXTENSIONS
+RENDER_EXTENSION = '.escpos'
+RENDER_VERSION = 2  # 渲染格式变化时递增，旧的缓存文件自动失效
+
+PAPER_PRINTABLE_MM = {58: 48, 80: 72}  # 纸宽(mm) -> 可打印宽度(mm)
+PAPER_COLUMNS = {58: 32, 80: 48}  # 纸宽(mm) -> 每行字符数（12×24 字体）
+DITHER_MODES = ('ordered', 'threshold')
+
+ESC_INIT = b'\x1B@'
+FS_CHINESE = b'\x1C&'  # 进入汉字模式
+FEED = b'\x1Bd\x03'  # ESC d 3 走纸三行
+RASTER_BAND = 255  # 每条 GS v 0 指令的最大行数，避免超出打印机接收缓冲区
+DIGEST_LIMIT = 1024  # 记住内容摘要的文档数
+
+# 8×8 Bayer 矩阵，灰度低于对应位置的阈值时打印黑点
+_BAYER8 = (
+    (0, 32, 8, 40, 2, 34, 10, 42),
+    (48, 16, 56, 24, 50, 18, 58, 26),
+    (12, 44, 4, 36, 14, 46, 6, 38),
+    (60, 28, 52, 20, 62, 30, 54, 22),
+    (3, 35, 11, 43, 1, 33, 9, 41),
+    (51, 19, 59, 27, 49, 17, 57, 25),
+    (15, 47, 7, 39, 13, 45, 5, 37),
+    (63, 31, 55, 23, 61, 29, 53, 21),
+)
+BAYER_THRESHOLDS = tuple(tuple((value * 4) + 2 for value in row) for row in _BAYER8)
+
+
+def can_render(doc_path):
+    return os.path.splitext(doc_path)[1].lower() in RENDERABLE_EXTENSIONS
+
+
+def paper_dots(paper_width, dpi=203):
+    """纸宽(mm)和打印头 DPI 对应的每行点数（按 8 点对齐）"""
+    if paper_width not in PAPER_PRINTABLE_MM:
+        raise ValueError(f"纸宽应为 {'/'.join(str(width) for width in PAPER_PRINTABLE_MM)} 毫米: "
+                         f"{paper_width}")
+    return PAPER_PRINTABLE_MM[paper_width] * round(dpi / 25.4) // 8 * 8
+
+
+def decode_text(data):
+    """测试文档可能是 UTF-8 或 GBK 编码"""
+    for encoding in ('utf-8-sig', 'gb18030'):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+    return data.decode('latin-1')
+
+
+def _char_width(char):
+    return 2 if unicodedata.east_asian_width(char) in ('W', 'F') else 1
+
+
+def wrap_line(line, columns):
+    """按显示宽度折行"""
+    lines, current, width = [], [], 0
+    for char in line:
+        char_width = _char_width(char)
+        if width + char_width > columns:
+            lines.append("".join(current))
+            current, width = [], 0
+        current.append(char)
+        width += char_width
+    lines.append("".join(current))
+    return lines
+
+
+def escpos_text(text, columns=48, feed_lines=3):
+    """把文本转换为 ESC/POS 文本数据"""
+    out = bytearray(ESC_INIT + FS_CHINESE)
+    for line in text.expandtabs(4).splitlines():
+        for wrapped in wrap_line(line, columns):
+            out += wrapped.encode('gb18030', errors='replace') + b'\n'
+    out += b'\x1Bd' + bytes([feed_lines])  # ESC d n 走纸
+    return bytes(out)
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+@lru_cache(maxsize=16)
+def _bit_tables(dither, threshold):
+    # 每行相位 -> 每列相位 -> 灰度值到 '1'/'0' 字符的映射表
+    if dither == 'threshold':
+        rows = ((threshold,) * 8,) * 8
+    else:
+        rows = BAYER_THRESHOLDS
+    return [[bytes(ord('1') if value < limit else ord('0') for value in range(256)) for limit in row]
+            for row in rows]
+
+
+def _pack_python(gray, width, height, stride, dither, threshold):
+    width_bytes = (width + 7) // 8
+    padding = b'0' * (width_bytes * 8 - width)
+    tables = _bit_tables(dither, threshold)
+    out = bytearray()
+    row_bits = bytearray(width)
+    for y in range(height):
+        row = bytes(gray[y * stride:y * stride + width])
+        row_tables = tables[y % 8]
+        if dither == 'threshold':
+            row_bits[:] = row.translate(row_tables[0])
+        else:
+            # 同一列相位的像素用同一张映射表，一次 translate 处理整行的 1/8
+            for phase in range(8):
+                row_bits[phase::8] = row[phase::8].translate(row_tables[phase])
+        out += int(bytes(row_bits) + padding, 2).to_bytes(width_bytes, 'big')
+    return bytes(out), width_bytes
+
+
+def _pack_numpy(np, gray, width, height, stride, dither, threshold):
+    pixels = np.frombuffer(gray, dtype=np.uint8, count=stride * height)
+    pixels = pixels.reshape(height, stride)[:, :width]
+    if dither == 'threshold':
+        black = pixels < threshold
+    else:
+        matrix = np.array(BAYER_THRESHOLDS, dtype=np.uint16)
+        limits = np.tile(matrix, (-(-height // 8), -(-width // 8)))[:height, :width]
+        black = pixels < limits
+    bits = np.packbits(black, axis=1)  # 每行补齐到整字节，高位在前，与 GS v 0 一致
+    return bits.tobytes(), bits.shape[1]
+
+
+def pack_bits(gray, width, height, stride=None, dither='ordered', threshold=128, use_numpy=None):
+    """8 位灰度位图 -> 每行按字节对齐的 1 位位图（1 为黑点），返回 (数据, 每行字节数)
+
+    use_numpy 为 None 时有 NumPy 就使用。
+    """
+    if dither not in DITHER_MODES:
+        raise ValueError(f"抖动方式应为 {'/'.join(DITHER_MODES)} 之一: {dither}")
+    stride = stride or width
+    np = _numpy() if use_numpy in (None, True) else None
+    if use_numpy and np is None:
+        raise Exception("向量化抖动需要安装 NumPy")
+    if np is not None:
+        return _pack_numpy(np, gray, width, height, stride, dither, threshold)
+    return _pack_python(gray, width, height, stride, dither, threshold)
+
+
+def gs_v0(bits, width_bytes, height, band=RASTER_BAND):
+    """1 位位图 -> GS v 0 光栅位图指令（按 band 行分段）"""
+    out = bytearray()
+    for top in range(0, height, band):
+        rows = min(band, height - top)
+        out += b'\x1Dv0\x00' + width_bytes.to_bytes(2, 'little') + rows.to_bytes(2, 'little')
+        out += bits[top * width_bytes:(top + rows) * width_bytes]
+    return bytes(out)
+
+
+def read_pgm(data):
+    """读取二进制 PGM（P5，8 位）灰度图，返回 (灰度数据, 宽, 高)"""
+    fields = []
+    pos = 0
+    while len(fields) < 4:
+        while data[pos:pos + 1].isspace():
+            pos += 1
+        if data[pos:pos + 1] == b'#':
+            pos = data.index(b'\n', pos) + 1
+            continue
+        end = pos
+        while not data[end:end + 1].isspace():
+            end += 1
+        fields.append(data[pos:end])
+        pos = end
+    magic, width, height, maxval = fields[0], int(fields[1]), int(fields[2]), int(fields[3])
+    if magic != b'P5' or maxval != 255:
+        raise Exception("只支持 8 位二进制 PGM（P5）")
+    pixels = data[pos + 1:pos + 1 + width * height]
+    if len(pixels) != width * height:
+        raise Exception("PGM 数据不完整")
+    return pixels, width, height
+
+
+def write_pgm(path, gray, width, height):
+    with open(path, 'wb') as f:
+        f.write(b'P5\n%d %d\n255\n' % (width, height))
+        f.write(gray)
+
+
+def scale_gray(gray, width, height, target_width):
+    """最近邻缩放到 target_width 点宽，返回 (灰度数据, 宽, 高)"""
+    if width == target_width:
+        return gray, width, height
+    target_height = max(1, round(height * target_width / width))
+    np = _numpy()
+    if np is not None:
+        pixels = np.frombuffer(gray, dtype=np.uint8, count=width * height).reshape(height, width)
+        rows = np.arange(target_height) * height // target_height
+        columns = np.arange(target_width) * width // target_width
+        return pixels[rows][:, columns].tobytes(), target_width, target_height
+    columns = [x * width // target_width for x in range(target_width)]
+    out = bytearray()
+    for y in range(target_height):
+        start = (y * height // target_height) * width
+        row = gray[start:start + width]
+        out += bytes(map(row.__getitem__, columns))
+    return bytes(out), target_width, target_height
+
+
+def render_pdf_pages(doc_path, width_dots):
+    """逐页返回 (灰度数据, 宽, 高, 每行字节数)，页面按宽度缩放到 width_dots 点"""
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        raise Exception("渲染 PDF 需要安装 pypdfium2")
+    pdf = pdfium.PdfDocument(doc_path)
+    try:
+        for page in pdf:
+            bitmap = page.render(scale=width_dots / page.get_width(), grayscale=True)
+            yield bytes(bitmap.buffer), bitmap.width, bitmap.height, bitmap.stride
+            page.close()
+    finally:
+        pdf.close()
+
+
+def render_image_pages(doc_path, width_dots):
+    """图片按宽度缩放到 width_dots 点，返回一页 (灰度数据, 宽, 高, 每行字节数)"""
+    if doc_path.lower().endswith('.pgm'):
+        with open(doc_path, 'rb') as f:
+            gray, width, height = scale_gray(*read_pgm(f.read()), width_dots)
+        return [(gray, width, height, width)]
+    try:
+        from PIL import Image
+    except ImportError:
+        raise Exception("渲染 png/jpg/bmp 图片需要安装 Pillow")
+    with Image.open(doc_path) as image:
+        image = image.convert('L')
+        height = max(1, round(image.height * width_dots / image.width))
+        image = image.resize((width_dots, height))
+        return [(image.tobytes(), width_dots, height, width_dots)]
+
+
+class Renderer:
+    """cache_dir: 渲染结果的缓存文件夹；paper_width: 纸宽（58 或 80 毫米）；dpi: 打印头分辨率；
+    dither: 抖动方式（DITHER_MODES）；threshold: threshold 方式下灰度低于该值的像素打印为黑点；
+    cache_limit: 缓存文件夹的字节上限，超出时删除最早渲染的文件。
+    """
+
+    def __init__(self, cache_dir=None, paper_width=80, dpi=203, dither='ordered', threshold=128,
+                 cache_limit=256 * 1024 * 1024, log=None):
+        self.width_dots = paper_dots(paper_width, dpi)
+        if dither not in DITHER_MODES:
+            raise ValueError(f"抖动方式应为 {'/'.join(DITHER_MODES)} 之一: {dither}")
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "autoprinter-render")
+        self.paper_width = paper_width
+        self.dpi = dpi
+        self.dither = dither
+        self.threshold = threshold
+        self.cache_limit = cache_limit
+        self._log = log or (lambda message: None)
+        self._lock = threading.Lock()
+        self._rendering = {}  # 缓存文件路径 -> 正在渲染的 Event
+        # 文档路径 -> ((mtime, 大小), 内容摘要)，文档未修改时不重新计算；每个路径只保留最新的一条，
+        # 超过 DIGEST_LIMIT 时淘汰最久未用的
+        self._digests = OrderedDict()
+        self.renders = 0
+        self.hits = 0
+        self.render_seconds = 0.0
+
+    def _content_digest(self, doc_path):
+        st = os.stat(doc_path)
+        norm = os.path.normcase(os.path.abspath(doc_path))
+        key = (st.st_mtime_ns, st.st_size)
+        digest = None
+        with self._lock:
+            entry = self._digests.get(norm)
+            if entry is not None and entry[0] == key:
+                self._digests.move_to_end(norm)
+                digest = entry[1]
+        if digest is None:
+            sha1 = hashlib.sha1()
+            with open(doc_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha1.update(chunk)
+            digest = sha1.hexdigest()
+            with self._lock:
+                self._digests[norm] = (key, digest)
+                self._digests.move_to_end(norm)
+                while len(self._digests) > DIGEST_LIMIT:
+                    self._digests.popitem(last=False)
+        return digest
+
+    def cache_path(self, doc_path):
+        ext = os.path.splitext(doc_path)[1].lower()
+        options = (f"{ext}|{self.paper_width}|{self.width_dots}|{self.dpi}|{self.dither}|"
+                   f"{self.threshold}|{RENDER_VERSION}")
+        digest = hashlib.sha1(f"{self._content_digest(doc_path)}|{options}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest[:24]}{RENDER_EXTENSION}")
+
+    def render(self, doc_path):
+        """返回渲染结果文件的路径；缓存有效时直接返回，并发请求同一文档时只渲染一次"""
+        path = self.cache_path(doc_path)
+        while True:
+            with self._lock:
+                pending = self._rendering.get(path)
+                if pending is None:
+                    if os.path.exists(path):
+                        self.hits += 1
+                        return path
+                    pending = self._rendering[path] = threading.Event()
+                    break
+            pending.wait()
+        try:
+            self._render_to(doc_path, path)
+        finally:
+            with self._lock:
+                del self._rendering[path]
+            pending.set()
+        self._prune(keep=path)
+        return path
+
+    def render_bytes(self, doc_path):
+        """渲染文档并返回数据（不经过缓存文件）"""
+        ext = os.path.splitext(doc_path)[1].lower()
+        if ext == '.txt':
+            with open(doc_path, 'rb') as f:
+                return escpos_text(decode_text(f.read()), PAPER_COLUMNS[self.paper_width])
+        if ext == '.pdf':
+            pages = render_pdf_pages(doc_path, self.width_dots)
+        elif ext in IMAGE_EXTENSIONS:
+            pages = render_image_pages(doc_path, self.width_dots)
+        else:
+            raise Exception(f"不支持渲染的文档类型: {ext}")
+        out = bytearray(ESC_INIT)
+        for gray, width, height, stride in pages:
+            bits, width_bytes = pack_bits(gray, width, height, stride, self.dither, self.threshold)
+            out += gs_v0(bits, width_bytes, height)
+        out += FEED
+        return bytes(out)
+
+    def _render_to(self, doc_path, path):
+        try:
+            start = time.perf_counter()
+            data = self.render_bytes(doc_path)
+            elapsed = time.perf_counter() - start
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.tmp{threading.get_ident()}"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            raise Exception(f"渲染文档失败: {str(e)}")
+        with self._lock:
+            self.renders += 1
+            self.render_seconds += elapsed
+        self._log(f"已渲染文档: {os.path.basename(doc_path)} -> ESC/POS（{len(data)} 字节，"
+                  f"{self.width_dots} 点宽，用时 {elapsed:.3f} 秒）")
+
+    def _prune(self, keep):
+        # 缓存文件夹超出上限时按渲染时间删除最早的文件（刚渲染的 keep 除外）
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir)
+                       if entry.name.endswith(RENDER_EXTENSION)]
+            stats = sorted(((entry.stat(), entry.path) for entry in entries),
+                           key=lambda item: item[0].st_mtime)
+        except OSError:
+            return
+        total = sum(st.st_size for st, _ in stats)
+        for st, path in stats:
+            if total <= self.cache_limit:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= st.st_size
+            except OSError:
+                pass
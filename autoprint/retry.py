@@ -0,0 +1,76 @@
+"""打印失败分类与重试策略
+
+失败按原因分类（连接被拒绝、后台处理程序出错、超时），每类有各自的重试次数和
+指数退避间隔；用尽重试次数的作业进入 PrintEngine 的死信列表。
+"""
+import errno
+import random
+
+from autoprint.streaming import StallError
+
+FAILURE_CONNECT = "connect"  # 连接被拒绝或网络不可达
+FAILURE_SPOOLER = "spooler"  # 后台处理程序、驱动或打印机报错
+FAILURE_TIMEOUT = "timeout"  # 打印超时或设备停滞
+FAILURE_OTHER = "other"
+
+_CONNECT_ERRNOS = {errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH, errno.ECONNRESET}
+
+
+def classify_exception(error):
+    """沿异常链（各后端会把原始异常包装成带中文说明的 Exception）判断失败类别"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (TimeoutError, StallError)):
+            return FAILURE_TIMEOUT
+        if isinstance(error, ConnectionError) or (
+                isinstance(error, OSError) and error.errno in _CONNECT_ERRNOS):
+            return FAILURE_CONNECT
+        if type(error).__module__ == 'pywintypes':
+            return FAILURE_SPOOLER
+        error = error.__cause__ or error.__context__
+    return FAILURE_OTHER
+
+
+class RetryRule:
+    """max_attempts: 含第一次在内的最多尝试次数；第 n 次重试前等待
+    base_delay * multiplier ** (n - 1) 秒（不超过 max_delay），并加减 jitter 比例的随机量。
+    """
+
+    def __init__(self, max_attempts=1, base_delay=1.0, max_delay=60.0, multiplier=2.0, jitter=0.1):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+
+    def delay(self, attempts):
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (attempts - 1))
+        if self.jitter:
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        return max(0.0, delay)
+
+
+# 超时的作业可能仍留在打印队列中稍后打出，只重试一次以免重复打印过多
+DEFAULT_RULES = {
+    FAILURE_CONNECT: RetryRule(max_attempts=4, base_delay=2.0, max_delay=30.0),
+    FAILURE_SPOOLER: RetryRule(max_attempts=3, base_delay=5.0, max_delay=60.0),
+    FAILURE_TIMEOUT: RetryRule(max_attempts=2, base_delay=10.0, max_delay=60.0),
+    FAILURE_OTHER: RetryRule(max_attempts=1),
+}
+
+
+class RetryPolicy:
+    def __init__(self, rules=None):
+        self.rules = dict(DEFAULT_RULES)
+        self.rules.update(rules or {})
+
+    def next_delay(self, failure, attempts):
+        """attempts 次尝试失败后下一次重试前的等待秒数，不再重试时返回 None"""
+        rule = self.rules.get(failure) or self.rules[FAILURE_OTHER]
+        if attempts >= rule.max_attempts:
+            return None
+        return rule.delay(attempts)
+
+
+NO_RETRY = RetryPolicy({failure: RetryRule(max_attempts=1) for failure in DEFAULT_RULES})
@@ -0,0 +1,192 @@
+"""进程间 RPC：中继代理、打印代理和协调器共用的帧协议
+
+帧格式: 4 字节长度 + 1 字节标志（bit0 = zlib 压缩）+ 帧体；
+帧体为一行 JSON 头（{"op": 操作, ...参数}），之后是可选的二进制数据。
+每个请求帧对应一个回复帧，客户端可以一次写出多个请求（流水线），再按顺序读取回复。
+回复中 ok 为 false 时 error 说明原因。
+"""
+import json
+import socket
+import socketserver
+import struct
+import threading
+import zlib
+
+_FRAME = struct.Struct('!IB')
+_COMPRESSED = 0x01
+MAX_FRAME = 256 * 1024 * 1024
+COMPRESS_MIN = 256  # 小于该字节数的帧不压缩
+
+
+class RpcError(Exception):
+    pass
+
+
+def encode_frame(header, payload=b'', level=6):
+    body = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+    body += bytes(payload)
+    flags = 0
+    if level and len(body) >= COMPRESS_MIN:
+        compressed = zlib.compress(body, level)
+        if len(compressed) < len(body):
+            body, flags = compressed, _COMPRESSED
+    return _FRAME.pack(len(body), flags) + body
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(min(size - len(buffer), 1024 * 1024))
+        if not chunk:
+            raise ConnectionError("连接已关闭")
+        buffer += chunk
+    return bytes(buffer)
+
+
+def read_frame(sock):
+    """返回 (头, 数据, 线路字节数)"""
+    length, flags = _FRAME.unpack(_recv_exact(sock, _FRAME.size))
+    if length > MAX_FRAME:
+        raise RpcError(f"帧过大: {length} 字节")
+    body = _recv_exact(sock, length)
+    if flags & _COMPRESSED:
+        body = zlib.decompress(body)
+    line, _, payload = body.partition(b'\n')
+    return json.loads(line.decode('utf-8')), payload, _FRAME.size + length
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server.rpc
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with server._lock:
+            server._connections.add(sock)
+        try:
+            while True:
+                try:
+                    header, payload, _ = read_frame(sock)
+                except (ConnectionError, OSError):
+                    return
+                except Exception as e:
+                    server._log(f"RPC 请求格式错误: {e}")
+                    return
+                try:
+                    reply = server.handler(header, payload)
+                except Exception as e:
+                    reply = {'ok': False, 'error': str(e)}
+                try:
+                    sock.sendall(encode_frame(reply, level=server.compress_level))
+                except OSError:
+                    return
+        finally:
+            with server._lock:
+                server._connections.discard(sock)
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class RpcServer:
+    """handler(header, payload) -> 回复字典，每个连接一个线程，同一连接上的请求按顺序处理"""
+
+    def __init__(self, handler, host="0.0.0.0", port=0, compress_level=6, log=None):
+        self.handler = handler
+        self.compress_level = compress_level
+        self._log = log or (lambda message: None)
+        self._lock = threading.Lock()
+        self._connections = set()  # 客户端连接，停止时一并断开
+        self._server = _ThreadingServer((host, port), _Handler)
+        self._server.rpc = self
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address[:2]
+
+    def start(self, name="rpc-server"):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name=name)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            connections = list(self._connections)
+        for sock in connections:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class RpcClient:
+    """一条持久连接，请求串行发送；连接断开时重连并重发一次"""
+
+    def __init__(self, host, port, compress_level=6, timeout=30):
+        self.endpoint = (host, port)
+        self.compress_level = compress_level
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock = None
+        self.wire_sent = 0  # 实际经过线路的字节数（压缩后，含帧头）
+        self.wire_received = 0
+
+    def frame(self, op, payload=b'', **params):
+        return encode_frame(dict(params, op=op), payload, level=self.compress_level)
+
+    def _connect(self):
+        sock = socket.create_connection(self.endpoint, timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _exchange(self, frames):
+        # 调用方持有 self._lock；一次写出全部帧，再按顺序读取各自的回复
+        if self._sock is None:
+            self._sock = self._connect()
+        data = b''.join(frames)
+        self._sock.sendall(data)
+        self.wire_sent += len(data)
+        replies = []
+        for _ in frames:
+            header, _, size = read_frame(self._sock)
+            self.wire_received += size
+            replies.append(header)
+        return replies
+
+    def request(self, frames):
+        """发送若干请求帧，返回对应的回复列表
+
+        超时或连接断开时重连并整体重发一次，对端可能已经执行过这些请求：
+        不幂等的请求需要带上请求ID，由对端去重（如 relay 的 print）。
+        """
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    return self._exchange(frames)
+                except (ConnectionError, OSError):
+                    self._close()
+                    if attempt:
+                        raise
+
+    def call(self, op, payload=b'', **params):
+        """发送一个请求并返回回复；回复 ok 为 false 时抛出 RpcError"""
+        reply = self.request([self.frame(op, payload, **params)])[0]
+        if not reply.get('ok'):
+            raise RpcError(reply.get('error') or f"{op} 失败")
+        return reply
+
+    def _close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def close(self):
+        with self._lock:
+            self._close()
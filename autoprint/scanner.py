@@ -0,0 +1,161 @@
+"""网段扫描发现网络打印机
+
+在一个 asyncio 事件循环中探测 CIDR 网段内每台主机的 9100（RAW）、515（LPD）、
+631（IPP）端口。并发连接数由固定数量的工作协程限制（内存占用与网段大小无关），
+新建连接的速率由令牌桶限制，避免触发交换机或防火墙的防扫描策略。
+RAW 端口开放的主机再发送 ESC/POS 实时状态查询（DLE EOT 1），按返回字节的
+固定位判断是否为 ESC/POS 打印机。
+"""
+import asyncio
+import ipaddress
+import threading
+import time
+
+RAW_PORT = 9100
+DEFAULT_PORTS = (RAW_PORT, 515, 631)
+DLE_EOT_PRINTER_STATUS = b'\x10\x04\x01'
+
+
+def is_escpos_status(value):
+    """ESC/POS 状态字节固定位：bit1=1, bit4=1, bit0=0, bit7=0"""
+    return value is not None and value & 0x93 == 0x12
+
+
+def iter_hosts(cidrs):
+    for cidr in cidrs:
+        network = ipaddress.ip_network(cidr.strip(), strict=False)
+        if network.num_addresses == 1:
+            yield str(network.network_address)
+        else:
+            for address in network.hosts():
+                yield str(address)
+
+
+def count_hosts(cidrs):
+    total = 0
+    for cidr in cidrs:
+        network = ipaddress.ip_network(cidr.strip(), strict=False)
+        total += network.num_addresses if network.num_addresses <= 2 else network.num_addresses - 2
+    return total
+
+
+class SubnetScanner:
+    """ports: 探测的端口；raw_port: 用于打印和指纹识别的 RAW 端口；
+    max_concurrency: 同时打开的连接数上限；rate: 每秒新建连接数上限（0 表示不限）；
+    connect_timeout / probe_timeout: 连接和等待状态回复的超时（秒）。
+    """
+
+    def __init__(self, ports=DEFAULT_PORTS, raw_port=RAW_PORT, max_concurrency=2000, rate=5000,
+                 connect_timeout=0.5, probe_timeout=0.5, fingerprint=True):
+        self.ports = tuple(ports)
+        self.raw_port = raw_port
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.connect_timeout = connect_timeout
+        self.probe_timeout = probe_timeout
+        self.fingerprint = fingerprint
+        self.hosts_scanned = 0
+        self.connects = 0
+        self._next_slot = 0.0
+
+    async def _throttle(self):
+        if not self.rate:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1.0 / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _probe(self, ip, port):
+        """返回 None（端口关闭）或 (端口, ESC/POS 状态字节或 None)"""
+        await self._throttle()
+        self.connects += 1
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port),
+                                                    self.connect_timeout)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        status = None
+        try:
+            if port == self.raw_port and self.fingerprint:
+                writer.write(DLE_EOT_PRINTER_STATUS)
+                await writer.drain()
+                data = await asyncio.wait_for(reader.read(1), self.probe_timeout)
+                status = data[0] if data else None
+        except (OSError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+        return port, status
+
+    async def _scan_host(self, ip):
+        probes = await asyncio.gather(*(self._probe(ip, port) for port in self.ports))
+        self.hosts_scanned += 1
+        open_ports = [probe for probe in probes if probe is not None]
+        if not open_ports:
+            return None
+        status = dict(open_ports).get(self.raw_port)
+        return {
+            'ip': ip,
+            'ports': sorted(port for port, _ in open_ports),
+            'status': status,
+            'escpos': is_escpos_status(status),
+        }
+
+    async def run(self, cidrs, on_result=None):
+        """扫描 cidrs 中的全部主机，on_result(result) 在发现一台主机时回调，返回结果列表"""
+        hosts = iter_hosts(cidrs)
+        results = []
+        self._next_slot = 0.0
+
+        async def worker():
+            for ip in hosts:
+                result = await self._scan_host(ip)
+                if result is not None:
+                    results.append(result)
+                    if on_result:
+                        on_result(result)
+
+        # 每台主机同时探测全部端口，工作协程数 × 端口数 即为并发连接上限
+        workers = max(1, self.max_concurrency // max(1, len(self.ports)))
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        return results
+
+    def scan(self, cidrs, on_result=None):
+        """同步入口：在当前线程中运行一个事件循环直到扫描结束"""
+        return asyncio.run(self.run(cidrs, on_result))
+
+    def scan_in_background(self, cidrs, on_result=None, on_done=None):
+        """在后台线程中扫描，避免阻塞GUI线程；on_done(results, elapsed) 在结束时调用"""
+        def runner():
+            start = time.perf_counter()
+            results = self.scan(cidrs, on_result)
+            if on_done:
+                on_done(results, time.perf_counter() - start)
+
+        thread = threading.Thread(target=runner, daemon=True, name="subnet-scan")
+        thread.start()
+        return thread
+
+
+def printer_name(result, prefix="TCP"):
+    return f"{prefix}-{result['ip']}"
+
+
+def apply_scan_results(tcp_printers, results, raw_port=RAW_PORT, prefix="TCP", escpos_only=False):
+    """把 RAW 端口开放的主机写入 tcp_printers（原地更新），返回新增的打印机名"""
+    added = []
+    for result in results:
+        if raw_port not in result['ports'] or (escpos_only and not result['escpos']):
+            continue
+        name = printer_name(result, prefix)
+        if name not in tcp_printers:
+            added.append(name)
+        tcp_printers[name] = (result['ip'], raw_port)
+    return added
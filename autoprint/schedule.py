@@ -0,0 +1,304 @@
+"""自动打印计划：按打印机设置间隔、速率或 cron 计划
+
+一个调度线程用最小堆管理全部打印机的下一次触发时刻，不为每个作业创建定时器。
+计划时刻按固定网格推进（上一次的计划时刻 + 周期，而不是实际触发时刻 + 周期），
+线程唤醒的误差不会累积；每次触发再加上一个随机抖动，避免大量打印机同时向
+共享的打印服务器提交作业。
+
+计划的写法（配置文件的 schedule 字段、命令行的 --schedule）:
+    30 / every 30s / every 0.5s / every 5m / every 2h   固定间隔，落后时跳过错过的次数
+    10/s / 120/min / rate 10/s                          速率，落后时补发（最多补一秒的量）
+    cron */5 * * * * / cron 0 */10 * * * * *            cron 表达式（5 段，或 6 段时第一段为秒）
+"""
+import calendar
+import heapq
+import itertools
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+_UNITS = {'s': 1.0, 'sec': 1.0, 'm': 60.0, 'min': 60.0, 'h': 3600.0}
+
+
+class IntervalSchedule:
+    """每 period 秒触发一次"""
+
+    def __init__(self, period, spec=None):
+        if period <= 0:
+            raise ValueError(f"间隔必须大于0: {period}")
+        self.period = float(period)
+        self.spec = spec or f"every {self.period:g}s"
+
+    def __eq__(self, other):
+        return isinstance(other, type(self)) and other.spec == self.spec
+
+    def __str__(self):
+        return f"每 {self.period:g} 秒"
+
+    def first_due(self, now):
+        return now + self.period
+
+    def advance(self, due, now):
+        """返回 (本次触发的次数, 跳过的次数, 下一次的计划时刻)"""
+        missed = max(0, math.floor((now - due) / self.period))
+        return 1, missed, due + (missed + 1) * self.period
+
+
+class RateSchedule(IntervalSchedule):
+    """每秒 rate 次；线程唤醒较晚时一次补发多次，保持平均速率"""
+
+    def __init__(self, rate, spec=None):
+        if rate <= 0:
+            raise ValueError(f"速率必须大于0: {rate}")
+        super().__init__(1.0 / rate, spec or f"{rate:g}/s")
+        self.rate = float(rate)
+        self.max_burst = max(1, math.ceil(self.rate))
+
+    def __str__(self):
+        return f"每秒 {self.rate:g} 次"
+
+    def first_due(self, now):
+        return now
+
+    def advance(self, due, now):
+        ticks = max(1, math.floor((now - due) / self.period) + 1)
+        count = min(ticks, self.max_burst)
+        return count, ticks - count, due + ticks * self.period
+
+
+_CRON_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+def _cron_field(text, low, high):
+    values = set()
+    for part in text.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"步长必须大于0: {text}")
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(value) for value in part.split('-', 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"取值超出范围 {low}-{high}: {text}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """cron 表达式：分 时 日 月 周（6 段时前面多一段秒），按本地时间计算"""
+
+    def __init__(self, expr, spec=None):
+        fields = expr.split()
+        if len(fields) not in (5, 6):
+            raise ValueError(f"cron 表达式应为 5 段或 6 段: {expr}")
+        try:
+            self.seconds = _cron_field(fields.pop(0), 0, 59) if len(fields) == 6 else {0}
+            sets = [_cron_field(field, *bounds) for field, bounds in zip(fields, _CRON_RANGES)]
+        except ValueError as e:
+            raise ValueError(f"cron 表达式格式错误: {str(e)}")
+        self.minutes, self.hours, self.days, self.months, weekdays = sets
+        self.weekdays = {day % 7 for day in weekdays}  # 0 和 7 都表示周日
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+        self.expr = " ".join(expr.split())
+        self.spec = spec or f"cron {self.expr}"
+        # 用于计算抖动幅度
+        self.period = 1.0 if len(self.seconds) > 1 else 60.0
+
+    def __eq__(self, other):
+        return isinstance(other, CronSchedule) and other.spec == self.spec
+
+    def __str__(self):
+        return f"cron {self.expr}"
+
+    def _day_matches(self, t):
+        day = t.day in self.days
+        weekday = (t.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday  # 日和周都有限制时满足其一即可（与 cron 一致）
+
+    def next_time(self, after):
+        """after 之后（不含）第一个匹配的本地时间"""
+        t = after.replace(microsecond=0) + timedelta(seconds=1)
+        limit = after + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                days = calendar.monthrange(t.year, t.month)[1] - t.day + 1
+                t = (t + timedelta(days=days)).replace(hour=0, minute=0, second=0)
+            elif not self._day_matches(t):
+                t = (t + timedelta(days=1)).replace(hour=0, minute=0, second=0)
+            elif t.hour not in self.hours:
+                t = (t + timedelta(hours=1)).replace(minute=0, second=0)
+            elif t.minute not in self.minutes:
+                t = (t + timedelta(minutes=1)).replace(second=0)
+            elif t.second not in self.seconds:
+                t += timedelta(seconds=1)
+            else:
+                return t
+        raise ValueError(f"cron 表达式在五年内没有匹配的时间: {self.expr}")
+
+    def _due(self, now, after):
+        # 把本地时间换算为单调时钟上的时刻
+        return now + (self.next_time(after) - datetime.now()).total_seconds()
+
+    def first_due(self, now):
+        return self._due(now, datetime.now())
+
+    def advance(self, due, now):
+        return 1, 0, self._due(now, datetime.now())
+
+
+def parse_schedule(text):
+    """解析计划字符串，格式错误时抛出 ValueError"""
+    spec = " ".join(str(text).split())
+    lowered = spec.lower()
+    if lowered.startswith('cron '):
+        return CronSchedule(spec[5:], spec)
+    if len(spec.split()) in (5, 6):
+        return CronSchedule(spec, spec)
+    match = re.fullmatch(r'(?:rate\s+)?(\d+(?:\.\d+)?)\s*/\s*(s|sec|m|min|h)', lowered)
+    if match:
+        return RateSchedule(float(match.group(1)) / _UNITS[match.group(2)], spec)
+    match = re.fullmatch(r'(?:every\s+)?(\d+(?:\.\d+)?)\s*(s|sec|m|min|h)?', lowered)
+    if match:
+        return IntervalSchedule(float(match.group(1)) * _UNITS[match.group(2) or 's'], spec)
+    raise ValueError(f"无法识别的计划: {text}（示例: every 30s、10/s、cron */5 * * * *）")
+
+
+class _Entry:
+    def __init__(self, name, schedule):
+        self.name = name
+        self.schedule = schedule
+        self.due = None  # 下一次的计划时刻（未加抖动，单调时钟）
+        self.version = 0  # 计划变化后堆中的旧条目作废
+        self.fired = 0
+        self.skipped = 0
+        self.max_late = 0.0
+
+
+class Scheduler:
+    """fire(name, count): 到期时在调度线程中调用，count 为本次应提交的作业数；
+    jitter: 抖动占周期的比例，max_jitter: 抖动上限（秒）。
+    """
+
+    def __init__(self, fire, jitter=0.1, max_jitter=1.0, log=None):
+        self._fire = fire
+        self.jitter = jitter
+        self.max_jitter = max_jitter
+        self._log = log or (lambda message: None)
+        self._entries = {}
+        self._heap = []  # (触发时刻, 序号, entry, version)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        self._random = random.Random()
+
+    def _jitter(self, schedule):
+        return self._random.uniform(0, min(schedule.period * self.jitter, self.max_jitter))
+
+    def _push(self, entry):
+        # 调用方持有 self._cond
+        fire_at = entry.due + self._jitter(entry.schedule)
+        heapq.heappush(self._heap, (fire_at, next(self._seq), entry, entry.version))
+
+    def set(self, name, schedule, immediate=False):
+        """设置一台打印机的计划；计划没有变化时保持原有节奏，变化时从上一次的计划时刻重新计算"""
+        with self._cond:
+            entry = self._entries.get(name)
+            if entry is not None and entry.schedule == schedule:
+                return
+            now = time.monotonic()
+            if entry is None:
+                entry = self._entries[name] = _Entry(name, schedule)
+                entry.due = now if immediate else schedule.first_due(now)
+            elif isinstance(entry.schedule, IntervalSchedule) and isinstance(schedule, IntervalSchedule):
+                # 只改周期：从上一次的计划时刻起按新周期计算，不重新开始计时
+                last = entry.due - entry.schedule.period
+                entry.schedule = schedule
+                entry.due = max(now, last + schedule.period)
+            else:
+                entry.schedule = schedule
+                entry.due = schedule.first_due(now)
+            entry.version += 1
+            self._push(entry)
+            self._cond.notify()
+
+    def remove(self, name):
+        with self._cond:
+            entry = self._entries.pop(name, None)
+            if entry is not None:
+                entry.version += 1
+
+    def update(self, schedules, immediate=False):
+        """按 名称 -> 计划 的字典整体同步：新增、修改，并移除不在字典中的打印机"""
+        for name in [name for name in list(self._entries) if name not in schedules]:
+            self.remove(name)
+        for name, schedule in schedules.items():
+            self.set(name, schedule, immediate)
+
+    def clear(self):
+        with self._cond:
+            for entry in self._entries.values():
+                entry.version += 1
+            self._entries.clear()
+            self._heap.clear()
+
+    def names(self):
+        with self._cond:
+            return list(self._entries)
+
+    def stats(self):
+        """每台打印机的触发次数、跳过次数和最大延迟（实际触发时刻晚于应触发时刻的秒数）"""
+        with self._cond:
+            return [{'printer': entry.name, 'schedule': str(entry.schedule), 'fired': entry.fired,
+                     'skipped': entry.skipped, 'max_late': entry.max_late}
+                    for entry in self._entries.values()]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="print-scheduler")
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                fire_at, _, entry, version = self._heap[0]
+                if version != entry.version:
+                    heapq.heappop(self._heap)
+                    continue
+                now = time.monotonic()
+                if fire_at > now:
+                    self._cond.wait(fire_at - now)
+                    continue
+                heapq.heappop(self._heap)
+                entry.max_late = max(entry.max_late, now - fire_at)
+                count, skipped, entry.due = entry.schedule.advance(entry.due, now)
+                entry.fired += count
+                entry.skipped += skipped
+                self._push(entry)
+            try:
+                self._fire(entry.name, count)
+            except Exception as e:
+                self._log(f"计划打印异常 [{entry.name}]: {e}")
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
@@ -0,0 +1,141 @@
+"""可配置的模拟后台处理程序
+
+在 FakeSpooler 的基础上自动推进作业状态：按配置的延迟完成作业，
+并按概率或打印机状态模拟缺纸、脱机和出错，用于在 Linux 上压测调度、
+超时和重试逻辑。
+"""
+import heapq
+import random
+import threading
+import time
+
+from autoprint.job_tracker import (FakeSpooler, JOB_STATUS_ERROR, JOB_STATUS_OFFLINE,
+                                   JOB_STATUS_PAPEROUT, JOB_STATUS_PRINTING,
+                                   JOB_STATUS_SPOOLING, JOB_STATUS_USER_INTERVENTION)
+
+PRINTER_READY = 'ready'
+PRINTER_PAPER_OUT = 'paper_out'
+PRINTER_OFFLINE = 'offline'
+PRINTER_ERROR = 'error'
+
+# 打印机处于异常状态时，新作业停留在队列中的状态
+_BLOCKED_STATUS = {
+    PRINTER_PAPER_OUT: JOB_STATUS_PAPEROUT | JOB_STATUS_USER_INTERVENTION,
+    PRINTER_OFFLINE: JOB_STATUS_OFFLINE,
+    PRINTER_ERROR: JOB_STATUS_ERROR,
+}
+
+
+class SimulatedSpooler(FakeSpooler):
+    """latency: 每个作业的基础完成时间（秒）；jitter: 随机附加的最大时间；
+    bytes_per_sec: 模拟设备吞吐量（0 表示不限）；
+    paper_out_rate/offline_rate/error_rate: 单个作业随机遇到对应故障的概率。
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, bytes_per_sec=0, paper_out_rate=0.0,
+                 offline_rate=0.0, error_rate=0.0, seed=None):
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.bytes_per_sec = bytes_per_sec
+        self.paper_out_rate = paper_out_rate
+        self.offline_rate = offline_rate
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._printer_states = {}
+        self._schedule = []  # 堆：(到期时间, 序号, 打印机名, job_id)
+        self._seq = 0
+        self._busy_until = {}  # 打印机名 -> 设备空闲时刻，作业按顺序打印
+        self._stopped = False
+        self.completed = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, daemon=True, name="sim-spooler")
+        self._thread.start()
+
+    def set_printer_state(self, printer_name, state):
+        """设置打印机状态；恢复为 ready 时被阻塞的作业重新开始打印"""
+        with self._cond:
+            self._printer_states[printer_name] = state
+            if state == PRINTER_READY:
+                for job_id, job in self._queues[printer_name].items():
+                    if job['Status'] & (JOB_STATUS_PAPEROUT | JOB_STATUS_OFFLINE):
+                        job['Status'] = JOB_STATUS_SPOOLING
+                        self._schedule_job(printer_name, job_id, job.get('_bytes', 0))
+            self._changed(printer_name)
+
+    def printer_state(self, printer_name):
+        with self._cond:
+            return self._printer_states.get(printer_name, PRINTER_READY)
+
+    def submit(self, printer_name, document, nbytes=0):
+        """提交一个作业，返回后台处理程序作业ID"""
+        with self._cond:
+            job_id = next(self._ids)
+            status = _BLOCKED_STATUS.get(self._printer_states.get(printer_name))
+            if status is None:
+                roll = self._random.random()
+                if roll < self.error_rate:
+                    status = JOB_STATUS_ERROR
+                elif roll < self.error_rate + self.paper_out_rate:
+                    status = _BLOCKED_STATUS[PRINTER_PAPER_OUT]
+                elif roll < self.error_rate + self.paper_out_rate + self.offline_rate:
+                    status = JOB_STATUS_OFFLINE
+            self._queues[printer_name][job_id] = {
+                'JobId': job_id, 'Status': status or JOB_STATUS_SPOOLING,
+                'pDocument': document, '_bytes': nbytes}
+            if status is None:
+                self._schedule_job(printer_name, job_id, nbytes)
+            elif status & JOB_STATUS_ERROR:
+                self.failed += 1
+            self._changed(printer_name)
+            return job_id
+
+    def _schedule_job(self, printer_name, job_id, nbytes):
+        duration = self.latency
+        if self.jitter:
+            duration += self._random.random() * self.jitter
+        if self.bytes_per_sec:
+            duration += nbytes / self.bytes_per_sec
+        now = time.monotonic()
+        start = max(now, self._busy_until.get(printer_name, now))
+        due = start + duration
+        self._busy_until[printer_name] = due
+        self._seq += 1
+        heapq.heappush(self._schedule, (due, self._seq, printer_name, job_id))
+        if self._schedule[0][1] == self._seq:
+            self._cond.notify_all()
+
+    def enum_jobs(self, handle):
+        with self._cond:
+            self.enum_calls += 1
+            return [{'JobId': job['JobId'], 'Status': job['Status'],
+                     'pDocument': job['pDocument']}
+                    for job in self._queues[handle[0]].values()]
+
+    def _run(self):
+        with self._cond:
+            while not self._stopped:
+                if not self._schedule:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                due = self._schedule[0][0]
+                if due > now:
+                    self._cond.wait(due - now)
+                    continue
+                while self._schedule and self._schedule[0][0] <= now:
+                    _, _, printer_name, job_id = heapq.heappop(self._schedule)
+                    job = self._queues[printer_name].get(job_id)
+                    if job is None or job['Status'] not in (JOB_STATUS_SPOOLING,
+                                                            JOB_STATUS_PRINTING):
+                        continue
+                    # 完成的作业直接离开队列，与真实后台处理程序一致
+                    del self._queues[printer_name][job_id]
+                    self.completed += 1
+                    self._changed(printer_name)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join()
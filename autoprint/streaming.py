@@ -0,0 +1,191 @@
+"""大文件的流式分块发送
+
+数据源可以是内存缓冲区（bytes、memoryview）或文件路径；
+文件按块读入一个复用的缓冲区，内存占用与文档大小无关。
+每块统计吞吐量，单块写入超过 stall_timeout 秒即视为设备停滞并立即中止。
+"""
+import os
+import threading
+import time
+
+from autoprint.documents import document_cache
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class StallError(Exception):
+    """设备停滞：单块数据在 stall_timeout 内没有写完（不是连接错误，不应重连重试）"""
+
+
+def document_source(doc_path, cache=document_cache):
+    """返回 (数据源, 大小)：能放进缓存的文档走缓存，更大的文档直接从磁盘分块读取"""
+    size = os.path.getsize(doc_path)
+    if size <= cache.budget_bytes:
+        data = cache.get(doc_path)
+        return data, len(data)
+    return doc_path, size
+
+
+class CompositeSource:
+    """按顺序拼接的多个数据源（如多份文档与切纸指令），发送时才逐块读取，不在内存中拼接"""
+
+    def __init__(self, parts):
+        self.parts = [part for part in parts if source_size(part)]
+
+    def __len__(self):
+        return sum(source_size(part) for part in self.parts)
+
+
+def source_size(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    return len(source)
+
+
+def iter_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """按块产出 memoryview；文件源复用同一个缓冲区，调用方须在取下一块前用完当前块"""
+    if isinstance(source, CompositeSource):
+        yield from _iter_composite(source, chunk_size)
+    elif isinstance(source, (str, os.PathLike)):
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        with open(source, 'rb') as f:
+            while True:
+                count = f.readinto(buffer)
+                if not count:
+                    break
+                yield view[:count]
+    else:
+        view = memoryview(source)
+        for offset in range(0, len(view), chunk_size):
+            yield view[offset:offset + chunk_size]
+
+
+def _iter_composite(source, chunk_size):
+    # 小片段（切纸指令、小文档）合并成整块再产出，大块数据原样透传不复制
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    fill = 0
+    for part in source.parts:
+        for chunk in iter_chunks(part, chunk_size):
+            if fill == 0 and len(chunk) == chunk_size:
+                yield chunk
+                continue
+            while chunk:
+                take = min(len(chunk), chunk_size - fill)
+                buffer[fill:fill + take] = chunk[:take]
+                fill += take
+                chunk = chunk[take:]
+                if fill == chunk_size:
+                    yield view
+                    fill = 0
+    if fill:
+        yield view[:fill]
+
+
+class StreamStats:
+    def __init__(self, total):
+        self.total = total
+        self.sent = 0
+        self.chunks = 0
+        self.elapsed = 0.0
+        self.min_bps = None  # 最慢一块的吞吐量（字节/秒）
+        self.last_bps = None
+
+    @property
+    def avg_bps(self):
+        return self.sent / self.elapsed if self.elapsed > 0 else None
+
+    def summary(self):
+        text = f"{self.sent} 字节 / {self.chunks} 块"
+        if self.avg_bps:
+            text += f"，平均 {self.avg_bps / 1024:.1f} KB/s"
+        if self.min_bps:
+            text += f"，最慢分块 {self.min_bps / 1024:.1f} KB/s"
+        return text
+
+
+class _StallWatchdog:
+    """阻塞式写入无法设置超时：由监视线程在单块写入超时时调用 on_stall() 中止设备作业"""
+
+    def __init__(self, timeout, on_stall):
+        self.timeout = timeout
+        self.on_stall = on_stall
+        self.deadline = None
+        self.fired = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="stall-watchdog")
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(min(self.timeout / 4, 0.5)):
+            deadline = self.deadline
+            if deadline is not None and time.monotonic() > deadline and not self.fired:
+                self.fired = True
+                try:
+                    self.on_stall()
+                except Exception:
+                    pass
+
+    def stop(self):
+        self._stopped.set()
+
+
+def stream_write(write, source, total, chunk_size=DEFAULT_CHUNK_SIZE, stall_timeout=10.0,
+                 on_progress=None, on_stall=None):
+    """用 write(chunk) 分块发送 source，返回 StreamStats
+
+    write 应在底层超时时抛出 TimeoutError（如设置了超时的 socket）；
+    阻塞式写入（如 WritePrinter）需提供 on_stall，由监视线程在超时时调用以打断写入。
+    on_progress(stats) 在每块发送完成后调用。
+    """
+    stats = StreamStats(total)
+    watchdog = _StallWatchdog(stall_timeout, on_stall) if stall_timeout and on_stall else None
+    start = time.perf_counter()
+    try:
+        for chunk in iter_chunks(source, chunk_size):
+            chunk_start = time.perf_counter()
+            if watchdog:
+                watchdog.deadline = time.monotonic() + stall_timeout
+            try:
+                write(chunk)
+            except TimeoutError:
+                raise StallError(f"设备停滞：{stall_timeout} 秒内未能写入（已发送 {stats.sent}/{total} 字节）")
+            except Exception:
+                if watchdog and watchdog.fired:
+                    raise StallError(f"设备停滞：{stall_timeout} 秒内未能写入，已中止（已发送 {stats.sent}/{total} 字节）")
+                raise
+            now = time.perf_counter()
+            duration = now - chunk_start
+            if watchdog:
+                watchdog.deadline = None
+            stats.sent += len(chunk)
+            stats.chunks += 1
+            stats.elapsed = now - start
+            if duration > 0:
+                stats.last_bps = len(chunk) / duration
+                if stats.min_bps is None or stats.last_bps < stats.min_bps:
+                    stats.min_bps = stats.last_bps
+            if on_progress:
+                on_progress(stats)
+            if stall_timeout and duration > stall_timeout:
+                raise StallError(f"设备停滞：单块写入耗时 {duration:.1f} 秒（已发送 {stats.sent}/{total} 字节）")
+    finally:
+        if watchdog:
+            watchdog.stop()
+    return stats
+
+
+def progress_logger(log, label, interval=1.0):
+    """返回 on_progress 回调：大文档发送时每 interval 秒记录一次进度和当前分块吞吐量"""
+    last = [time.monotonic()]
+
+    def on_progress(stats):
+        now = time.monotonic()
+        if now - last[0] < interval or stats.sent >= stats.total:
+            return
+        last[0] = now
+        rate = f"，当前 {stats.last_bps / 1024:.1f} KB/s" if stats.last_bps else ""
+        log(f"{label}: 已发送 {stats.sent}/{stats.total} 字节{rate}")
+
+    return on_progress
@@ -0,0 +1,189 @@
+"""RAW/9100 TCP打印机的持久连接池
+
+按 (ip, port) 复用已建立的连接，避免每份打印都重新建立和关闭连接。
+空闲连接在取出前做健康检查；复用的连接在一份数据发出之前失败时自动重连并继续发送剩余份数，
+已经发出部分数据时不重发，避免打出残缺和重复的份数。
+数据按 chunk_size 分块发送，单块超过 send_timeout 视为设备停滞，立即中止而不重连。
+"""
+import socket
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from autoprint.streaming import DEFAULT_CHUNK_SIZE, StallError, source_size, stream_write
+
+
+class TcpConnectionPool:
+    def __init__(self, connect_timeout=10, send_timeout=10, max_idle_per_endpoint=2,
+                 idle_timeout=60, keepalive=True, pipeline=True, copy_delay=0.0,
+                 chunk_size=DEFAULT_CHUNK_SIZE, log=None):
+        self.connect_timeout = connect_timeout
+        self.send_timeout = send_timeout
+        self.max_idle_per_endpoint = max_idle_per_endpoint
+        self.idle_timeout = idle_timeout  # 空闲超过该秒数的连接直接丢弃
+        self.keepalive = keepalive
+        self.pipeline = pipeline  # 多份打印在同一连接上连续发送
+        self.copy_delay = copy_delay  # 非流水线模式下份数之间的间隔（秒）
+        self.chunk_size = chunk_size
+        self._log = log or (lambda message: None)
+        self._lock = threading.Lock()
+        self._idle = defaultdict(deque)  # (ip, port) -> deque[(sock, 归还时间)]
+        self.stats = defaultdict(int)
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _connect(self, endpoint):
+        sock = socket.create_connection(endpoint, timeout=self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.keepalive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.settimeout(self.send_timeout)
+        self._count('connects')
+        return sock
+
+    @staticmethod
+    def _is_healthy(sock):
+        """非阻塞窥探一次：对端已关闭时 recv 返回空字节"""
+        try:
+            sock.setblocking(False)
+            try:
+                data = sock.recv(64, socket.MSG_PEEK)
+            except (BlockingIOError, InterruptedError):
+                return True
+            if not data:
+                return False
+            # 打印机主动上报的状态字节（如 ASB），读掉即可
+            sock.recv(len(data))
+            return True
+        except OSError:
+            return False
+
+    def _take_idle(self, endpoint):
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                idle = self._idle.get(endpoint)
+                if not idle:
+                    return None
+                sock, returned_at = idle.pop()
+            if now - returned_at <= self.idle_timeout and self._is_healthy(sock):
+                sock.settimeout(self.send_timeout)
+                self._count('reuses')
+                return sock
+            self._count('stale_closed')
+            sock.close()
+
+    def _release(self, endpoint, sock):
+        with self._lock:
+            idle = self._idle[endpoint]
+            if len(idle) < self.max_idle_per_endpoint:
+                idle.append((sock, time.monotonic()))
+                return
+        sock.close()
+
+    def release(self, ip, port, sock, reuse=True):
+        """归还 send(detach=True) 取出的连接；reuse=False 时直接关闭"""
+        if reuse:
+            self._release((ip, port), sock)
+        else:
+            sock.close()
+
+    @contextmanager
+    def connection(self, ip, port, detach=False):
+        """取出一个可用连接；块内抛出异常时连接被关闭而不是归还，detach=True 时由调用方 release"""
+        endpoint = (ip, port)
+        sock = self._take_idle(endpoint) or self._connect(endpoint)
+        try:
+            yield sock
+        except BaseException:
+            sock.close()
+            raise
+        if not detach:
+            self._release(endpoint, sock)
+
+    def send(self, ip, port, data, copies=1, on_copy=None, on_progress=None, trailer=b'',
+             detach=False):
+        """发送 copies 份数据；复用的连接在某一份还没有发出任何字节时失败，换一条连接从这一份继续
+
+        某一份已经发出部分数据后失败时不重发：打印机已经收下了前半份（如 GS v 0 光栅会把重发的
+        数据当作图像），重发只会打出一份残缺的和一份重复的，由引擎的重试策略处理这次失败。
+        data 可以是字节缓冲区或文件路径（按块读取，内存占用固定）。
+        on_copy(copy_num, stats) 在每份发送完成后调用（copy_num 从 1 开始），
+        on_progress(stats) 在每块发送完成后调用。返回最后一份的 StreamStats。
+        trailer 在全部份数之后发送（如状态查询指令）；detach=True 时不归还连接，
+        返回 (StreamStats, sock)，调用方读完回复后调用 release()。
+        """
+        endpoint = (ip, port)
+        size = source_size(data)
+        stats = None
+        sent = 0
+        written = 0  # 当前这一份（或 trailer）已交给内核的字节数
+
+        def write(chunk):
+            # 逐次 send 而不是 sendall，失败时才知道这一份是否已经有数据发出
+            nonlocal written
+            view = memoryview(chunk).cast('B')
+            while view:
+                count = sock.send(view)
+                written += count
+                view = view[count:]
+
+        while True:
+            sock = self._take_idle(endpoint)
+            reused = sock is not None
+            try:
+                if sock is None:
+                    sock = self._connect(endpoint)
+                while sent < copies:
+                    written = 0
+                    stats = stream_write(write, data, size, self.chunk_size, self.send_timeout, on_progress)
+                    sent += 1
+                    self._count('copies')
+                    self._count('bytes', size)
+                    if on_copy:
+                        on_copy(sent, stats)
+                    if sent < copies and not self.pipeline:
+                        time.sleep(self.copy_delay)
+                if trailer:
+                    written = 0
+                    write(trailer)
+                break
+            except StallError:
+                # 设备停滞不是连接失效，重连只会再等一次超时
+                sock.close()
+                self._count('errors')
+                raise
+            except OSError as e:
+                if sock is not None:
+                    sock.close()
+                if not reused or written:
+                    self._count('errors')
+                    raise
+                # 复用的连接可能已被打印机关闭，这一份还没有发出数据，换一条连接继续
+                self._count('reconnects')
+                self._log(f"TCP连接 {ip}:{port} 发送失败，正在重连: {e}")
+            except BaseException:
+                if sock is not None:
+                    sock.close()
+                raise
+        if not detach:
+            self._release(endpoint, sock)
+        self._count('jobs')
+        return (stats, sock) if detach else stats
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['idle'] = sum(len(idle) for idle in self._idle.values())
+        return stats
+
+    def close_all(self):
+        with self._lock:
+            idle_lists = list(self._idle.values())
+            self._idle.clear()
+        for idle in idle_lists:
+            for sock, _ in idle:
+                sock.close()
@@ -0,0 +1,115 @@
+"""作业超时：进程内一个时间轮
+
+所有作业的截止时间登记在同一个哈希时间轮中（resolution 秒一格，slots 格一圈），
+登记和取消都是 O(1)，每个 tick 只检查当前格中的条目，与作业总数无关。
+时间轮在自己的线程中按单调时钟推进（落后时连续补齐，不累积漂移），不依赖 Qt 事件循环。
+TimeoutPolicy 按 作业 > 打印机 > 后端 > 默认值 的顺序决定每个作业的超时时间。
+"""
+import itertools
+import math
+import threading
+import time
+
+
+class TimerWheel:
+    """resolution: 每格的时长（秒），即超时的精度；slots: 每圈的格数"""
+
+    def __init__(self, resolution=0.05, slots=1024, log=None):
+        self.resolution = resolution
+        self._slots = [{} for _ in range(slots)]  # 每格：handle -> (到期tick, callback, args)
+        self._handles = {}  # handle -> 所在格
+        self._ids = itertools.count(1)
+        self._log = log or (lambda message: None)
+        self._cond = threading.Condition()
+        self._origin = time.monotonic()  # tick 0 对应的时刻
+        self._tick = 0  # 已处理到的 tick
+        self._stopped = False
+        self._thread = None
+        self.fired = 0
+
+    def __len__(self):
+        with self._cond:
+            return len(self._handles)
+
+    def schedule(self, delay, callback, *args):
+        """delay 秒后在时间轮线程中调用 callback(*args)，返回用于 cancel 的句柄"""
+        with self._cond:
+            now = time.monotonic()
+            if not self._handles:
+                # 空闲期间时间轮线程不推进 tick：按当前时刻重新对齐起点，否则截止时间会晚整个空闲时长
+                self._origin = now - self._tick * self.resolution
+            target = math.ceil((now + delay - self._origin) / self.resolution)
+            target = max(target, self._tick + 1)
+            handle = next(self._ids)
+            slot = target % len(self._slots)
+            self._slots[slot][handle] = (target, callback, args)
+            self._handles[handle] = slot
+            if len(self._handles) == 1:
+                self._cond.notify()
+        return handle
+
+    def cancel(self, handle):
+        with self._cond:
+            slot = self._handles.pop(handle, None)
+            if slot is None:
+                return False
+            del self._slots[slot][handle]
+            return True
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="timer-wheel")
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._handles and not self._stopped:
+                    self._cond.wait()
+                    # 空闲期间不推进，重新对齐起点，醒来后不需要补齐空转的 tick
+                    self._origin = time.monotonic() - self._tick * self.resolution
+                if self._stopped:
+                    return
+                wait = self._origin + (self._tick + 1) * self.resolution - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                self._tick += 1
+                entries = self._slots[self._tick % len(self._slots)]
+                due = [handle for handle, entry in entries.items() if entry[0] <= self._tick]
+                callbacks = []
+                for handle in due:
+                    _, callback, args = entries.pop(handle)
+                    del self._handles[handle]
+                    callbacks.append((callback, args))
+            for callback, args in callbacks:
+                self.fired += 1
+                try:
+                    callback(*args)
+                except Exception as e:
+                    self._log(f"超时回调异常: {e}")
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+
+class TimeoutPolicy:
+    """default: 默认超时（秒）；printers / backends: 打印机名、后端名 -> 超时秒数；
+    作业字典中的 timeout 优先。超时为 None 或 0 表示不限时。
+    """
+
+    def __init__(self, default=120.0, printers=None, backends=None):
+        self.default = default
+        self.printers = dict(printers or {})
+        self.backends = dict(backends or {})
+
+    def timeout_for(self, job):
+        if job.get('timeout') is not None:
+            return job['timeout']
+        if job['printer'] in self.printers:
+            return self.printers[job['printer']]
+        if job.get('backend') in self.backends:
+            return self.backends[job['backend']]
+        return self.default